@@ -0,0 +1,152 @@
+"""Structured, non-blocking logging.
+
+Request threads only put records on a bounded queue; a background listener
+formats and writes them, so a slow stdout or log pipe never stalls a request.
+When the queue is full, records are dropped and counted instead of blocking.
+
+    log = get_logger(__name__)
+    log.info("Serving from cache", extra={"path": path, "cache": "hit", "bytes": 1234})
+
+Extra fields become JSON keys (LOG_FORMAT=json) or key=value pairs (text).
+Hot-path records logged with ``extra={"sample": True}`` are only kept once
+every LOG_SAMPLE_HITS records.
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLE_HITS
+
+ROOT_LOGGER = "iaw"
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RESERVED = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "sample"}
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+_dropped = 0
+
+
+def get_logger(name):
+    """Logger under the application's root logger"""
+    if name == "__main__" or not name:
+        name = "app"
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def _fields(record):
+    return {key: value for key, value in record.__dict__.items() if key not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SampleFilter(logging.Filter):
+    """Keep one in ``every`` records marked ``sample``; everything else passes"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if not getattr(record, "sample", False) or self.every == 1:
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the calling thread"""
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _start_listener():
+    global _listener
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (e.g. gunicorn --preload)
+    if _handler is not None:
+        _start_listener()
+
+
+def setup_logging():
+    """Install the queue handler and start the writer thread (idempotent)"""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(LOG_LEVEL.upper())
+        logger.propagate = False
+        _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _handler.addFilter(SampleFilter(LOG_SAMPLE_HITS))
+        logger.addHandler(_handler)
+        _start_listener()
+        atexit.register(shutdown_logging)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+
+
+def get_log_stats():
+    return {
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _dropped,
+        "sample_hits_every": LOG_SAMPLE_HITS,
+    }
+
+
+def elapsed_ms(started):
+    """Milliseconds since a time.perf_counter() reading, for latency fields"""
+    return round((time.perf_counter() - started) * 1000, 1)
@@ -0,0 +1,406 @@
+"""Offline benchmark: drive the app against a local stub LLM.
+
+Starts stub_llm.py in-process, points the app at it with a throwaway cache
+directory, warms up a pool of pages and then sends a mix of requests at a
+fixed concurrency. Results (latency percentiles per request kind, throughput,
+memory and stub counters) are written as JSON for comparing runs:
+
+    python benchmark.py run --requests 2000 --concurrency 32 --mix hit=70,miss=20,nocache=5,post=5 -o before.json
+    python benchmark.py run ... -o after.json
+    python benchmark.py compare before.json after.json
+
+``--record CORPUS`` stores the stub's answers and ``--replay CORPUS`` serves a
+later run (same ``--seed``) from them with their recorded timing, see replay.py.
+
+Use ``--target http://host:port`` to benchmark an already running server
+(e.g. under gunicorn) instead of the in-process app; the stub is then not
+started and the server must already point at one.
+
+``startup`` measures a cold start instead: a fresh interpreter imports the app,
+runs create_app() and loads the provider backend, under ``-X importtime``. It
+reports the wall time, the resident memory of a worker at that point and the
+slowest imports; ``compare`` works on these reports too.
+
+    python benchmark.py startup --provider gemini --repeat 5 -o startup.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stub_llm import add_stub_arguments, options_from_args, start_stub
+
+KINDS = ("hit", "miss", "nocache", "post")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown request kind {kind!r}, expected one of {KINDS}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def rss_bytes():
+    """Current resident set size, 0 where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed=None):
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "p50_ms": _ms(percentile(values, 0.50)),
+        "p95_ms": _ms(percentile(values, 0.95)),
+        "p99_ms": _ms(percentile(values, 0.99)),
+        "mean_ms": _ms(statistics.fmean(values)) if values else None,
+        "max_ms": _ms(values[-1]) if values else None,
+    }
+    if elapsed:
+        summary["throughput_rps"] = round(summary["requests"] / elapsed, 2)
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def start_app(args, stub_url):
+    """Configure the environment, then import and serve the app on a free port"""
+    workdir = tempfile.mkdtemp(prefix="iaw-bench-")
+    os.environ.update({
+        "AI_PROVIDER": "openai",
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_MODEL": "stub-model",
+        "WEB_DIR": os.path.join(workdir, "web"),
+        "CACHE_BACKEND": args.backend,
+        "PACKFILE_PATH": os.path.join(workdir, "web.pack"),
+        "LEDGER_PATH": os.path.join(workdir, "usage.sqlite3"),
+        "PROFILE_DIR": os.path.join(workdir, "profiles"),
+        "LOG_LEVEL": args.log_level,
+        # Keep features that need outside services or change routing out of the way
+        "DRAFT_PROVIDER": "", "CACHE_PEERS": "", "PROFILE_TOKEN": "", "PROFILE_SAMPLE_EVERY": "0",
+        "TOKEN_BUDGET_HOURLY": "0", "TOKEN_BUDGET_DAILY": "0", "NEGATIVE_CACHE_TTL": "0",
+        "REPLAY_RECORD": "0",
+    })
+    if args.replay:
+        # Recorded answers instead of the stub (see replay.py)
+        os.environ.update({"AI_PROVIDER": "replay", "REPLAY_CORPUS": args.replay,
+                           "REPLAY_SPEED": str(args.replay_speed)})
+    elif args.record:
+        os.environ.update({"REPLAY_RECORD": "1", "REPLAY_CORPUS": args.record})
+    from werkzeug.serving import make_server
+    from infinite_web import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access line per request
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", workdir
+
+
+def plan_requests(args):
+    rng = random.Random(args.seed)
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    plan = []
+    for number in range(args.requests):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "miss":
+            path = f"bench/miss/page-{args.seed}-{number}"
+        else:
+            path = f"bench/hot/page-{rng.randrange(args.hot_pages)}"
+        plan.append((kind, path, rng.randrange(4)))
+    return plan
+
+
+def send(session, base_url, kind, path, variant, timeout):
+    url = f"{base_url}/{path}"
+    if kind == "nocache":
+        return session.get(url, params={"nocache": "1"}, timeout=timeout)
+    if kind == "post":
+        return session.post(url, data={"q": f"variant {variant}"}, timeout=timeout)
+    return session.get(url, timeout=timeout)
+
+
+def run(args):
+    stub = None
+    stub_options = None
+    workdir = None
+    app_server = None
+    base_url = args.target
+    if base_url is None:
+        stub_options = options_from_args(args)
+        stub, stub_url = start_stub(stub_options)
+        app_server, base_url, workdir = start_app(args, stub_url)
+
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    # Generate the hot pool first so "hit" requests really hit the cache
+    warm_started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(lambda n: send(session(), base_url, "hit", f"bench/hot/page-{n}", 0, args.timeout),
+                      range(args.hot_pages)))
+    warmup_seconds = time.perf_counter() - warm_started
+
+    results = {kind: ([], [0]) for kind in KINDS}
+    lock = threading.Lock()
+    statuses = {}
+
+    def worker(item):
+        kind, path, variant = item
+        started = time.perf_counter()
+        try:
+            response = send(session(), base_url, kind, path, variant, args.timeout)
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            latencies, errors = results[kind]
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    rss_before = rss_bytes()
+    plan = plan_requests(args)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, plan))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for latencies, _ in results.values() for value in latencies]
+    report = {
+        "label": args.label,
+        "created": round(time.time(), 3),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests, "concurrency": args.concurrency, "mix": args.mix,
+            "hot_pages": args.hot_pages, "backend": args.backend, "target": args.target,
+            "seed": args.seed, "replay": args.replay,
+        },
+        "warmup_seconds": round(warmup_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "overall": summarize(all_latencies, sum(errors[0] for _, errors in results.values()), elapsed),
+        "kinds": {kind: summarize(latencies, errors[0]) for kind, (latencies, errors) in results.items()
+                  if latencies or errors[0]},
+        "statuses": statuses,
+    }
+    if args.target is None:
+        report["memory"] = {"rss_before_bytes": rss_before, "rss_after_bytes": rss_bytes(),
+                            "peak_rss_bytes": peak_rss_bytes()}
+        report["stub"] = dict(stub_options.counters)
+        report["settings"]["stub"] = {
+            "latency": args.latency, "latency_dist": args.latency_dist,
+            "tokens_per_second": args.tokens_per_second, "completion_tokens": args.completion_tokens,
+            "error_rate": args.error_rate,
+        }
+        app_server.shutdown()
+        stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+# Runs in a fresh interpreter; prints its measurements as JSON on the last line
+STARTUP_PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+from infinite_web import create_app
+create_app()
+app_loaded = time.perf_counter()
+from config import AI_PROVIDER
+from models import get_provider
+get_provider(AI_PROVIDER)
+done = time.perf_counter()
+try:
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+except (OSError, ValueError):
+    rss = 0
+print(json.dumps({"app_ms": (app_loaded - started) * 1000, "provider_ms": (done - app_loaded) * 1000,
+                  "rss_bytes": rss, "modules": len(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr):
+    """Per-module (self, cumulative) microseconds from ``-X importtime`` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # header line
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def startup(args):
+    """Cold-start wall time, memory and slowest imports of one app process"""
+    workdir = tempfile.mkdtemp(prefix="iaw-startup-")
+    env = dict(os.environ, WEB_DIR=os.path.join(workdir, "web"), LOG_LEVEL="WARNING")
+    if args.provider:
+        env["AI_PROVIDER"] = args.provider
+    root = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    imports = {}
+    try:
+        # The first run compiles bytecode and warms the OS file cache; it is not counted
+        for number in range(args.repeat + 1):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_PROBE], cwd=root,
+                                    env=env, capture_output=True, text=True)
+            wall_ms = (time.perf_counter() - started) * 1000
+            if result.returncode != 0:
+                raise RuntimeError(f"App failed to start:\n{result.stderr[-2000:]}")
+            if number:
+                runs.append(dict(json.loads(result.stdout.strip().splitlines()[-1]), wall_ms=wall_ms))
+                imports = parse_importtime(result.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Top-level packages and modules, slowest first (nested ones count towards their importer too)
+    top = sorted(((name, self_us, cumulative_us) for name, (self_us, cumulative_us) in imports.items()
+                  if "." not in name), key=lambda item: item[2], reverse=True)[:args.top]
+    return {
+        "label": args.label,
+        "created": round(time.time(), 3),
+        "python": platform.python_version(),
+        "settings": {"provider": env.get("AI_PROVIDER", "openrouter"), "repeat": args.repeat},
+        "startup": {
+            "wall_ms": round(statistics.median(run["wall_ms"] for run in runs), 1),
+            "app_ms": round(statistics.median(run["app_ms"] for run in runs), 1),
+            "provider_ms": round(statistics.median(run["provider_ms"] for run in runs), 1),
+            "rss_bytes": int(statistics.median(run["rss_bytes"] for run in runs)),
+            "modules": runs[-1]["modules"],
+            "import_ms": round(sum(self_us for self_us, _ in imports.values()) / 1000, 1),
+        },
+        "slowest_imports": [{"module": name, "self_ms": round(self_us / 1000, 1),
+                             "cumulative_ms": round(cumulative_us / 1000, 1)} for name, self_us, cumulative_us in top],
+    }
+
+
+def _changes(old, new, metrics):
+    rows = {}
+    for metric in metrics:
+        if old.get(metric) is None or new.get(metric) is None:
+            continue
+        change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else None
+        rows[metric] = {"before": old[metric], "after": new[metric],
+                        "change_pct": None if change is None else round(change, 1)}
+    return rows
+
+
+def compare(before, after):
+    """Relative change of the headline numbers between two result files"""
+    if "startup" in before and "startup" in after:
+        return {"startup": _changes(before["startup"], after["startup"],
+                                    ("wall_ms", "app_ms", "provider_ms", "import_ms", "rss_bytes", "modules"))}
+    rows = {}
+    for section in ["overall"] + sorted(set(before.get("kinds", {})) & set(after.get("kinds", {}))):
+        old = before["overall"] if section == "overall" else before["kinds"][section]
+        new = after["overall"] if section == "overall" else after["kinds"][section]
+        rows[section] = _changes(old, new, ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark against a stub LLM")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("run", help="run a benchmark")
+    bench.add_argument("--requests", type=int, default=1000)
+    bench.add_argument("--concurrency", type=int, default=16)
+    bench.add_argument("--mix", type=parse_mix, default=parse_mix("hit=70,miss=20,nocache=5,post=5"),
+                       help="weights of hit, miss, nocache and post requests")
+    bench.add_argument("--hot-pages", type=int, default=50, help="pages generated before measuring")
+    bench.add_argument("--backend", choices=("directory", "packfile"), default="directory")
+    bench.add_argument("--target", help="benchmark a running server instead of the in-process app")
+    bench.add_argument("--timeout", type=float, default=60.0)
+    bench.add_argument("--label", default="", help="free-form name stored with the results")
+    bench.add_argument("--log-level", default="WARNING")
+    bench.add_argument("--keep", action="store_true", help="keep the temporary cache directory")
+    bench.add_argument("--record", metavar="CORPUS", help="record the stub's answers into a replay corpus")
+    bench.add_argument("--replay", metavar="CORPUS", help="answer from a recorded corpus instead of the stub")
+    bench.add_argument("--replay-speed", type=float, default=1.0,
+                       help="replay recorded timing at this speed (0 = no delays)")
+    bench.add_argument("-o", "--output", default="-", help="results file, '-' for stdout")
+    add_stub_arguments(bench)
+
+    cold = commands.add_parser("startup", help="measure cold start time, memory and imports")
+    cold.add_argument("--provider", help="AI_PROVIDER to start with (default: from the environment)")
+    cold.add_argument("--repeat", type=int, default=3, help="measured starts (the median is reported)")
+    cold.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    cold.add_argument("--label", default="", help="free-form name stored with the results")
+    cold.add_argument("-o", "--output", default="-", help="results file, '-' for stdout")
+
+    diff = commands.add_parser("compare", help="compare two result files")
+    diff.add_argument("before")
+    diff.add_argument("after")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        print(json.dumps(compare(before, after), indent=2))
+        return 0
+
+    if args.command == "startup":
+        report = json.dumps(startup(args), indent=2)
+    else:
+        if args.seed is None:
+            args.seed = 1
+        report = json.dumps(run(args), indent=2)
+    if args.output == "-":
+        print(report)
+    else:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
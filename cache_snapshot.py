@@ -0,0 +1,238 @@
+"""Export and import the page cache as a single streaming snapshot.
+
+A snapshot is a gzip-compressed PAX tar stream. Every page is stored as
+``pages/<cache key><extension>`` with its cache key, content type, page
+metadata and SHA-256 checksum in PAX headers. A trailing MANIFEST.json
+carries the entry count and a digest over all checksums to detect truncated
+archives; an import verifies the whole archive before writing any page.
+
+Typical use when bringing up a new node:
+
+    python cache_snapshot.py export -o cache.tar.gz
+    python cache_snapshot.py import cache.tar.gz
+
+or without an intermediate file:
+
+    python cache_snapshot.py export | ssh new-node 'cd app && python cache_snapshot.py import -'
+
+Keep nodes in sync cheaply with incremental exports, passing the
+``exported_at`` value printed by the previous export:
+
+    python cache_snapshot.py export --since 1767225600 -o delta.tar.gz
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import posixpath
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+from config import CACHE_BACKEND
+from utils import (
+    extension_for_content_type, get_cache_mtime, iter_cache_entries,
+    normalize_cache_path, note_cache_saved, read_cache_entry, read_cache_metadata, write_cache_entry
+)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "MANIFEST.json"
+
+
+def log(message):
+    # stdout may be carrying the archive itself
+    print(message, file=sys.stderr)
+
+
+def parse_since(value):
+    """Accept a unix timestamp or an ISO 8601 date/time"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def export_snapshot(out, since=None, compresslevel=1):
+    """Write every cached page modified at or after ``since`` to ``out``.
+    Pages that cannot be read are logged and left out."""
+    exported_at = time.time()
+    digest = hashlib.sha256()
+    count = total_bytes = unreadable = 0
+
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=compresslevel, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+            for key, content_type, mtime, source in iter_cache_entries(since):
+                try:
+                    entry = read_cache_entry(key, source)
+                except (OSError, ValueError) as e:
+                    log(f"Skipping unreadable page {source}: {e}")
+                    unreadable += 1
+                    continue
+                if entry is None:
+                    continue  # evicted while we were exporting
+                content_type, content, _ = entry
+                data = content.encode("utf-8")
+                checksum = hashlib.sha256(data).hexdigest()
+
+                info = tarfile.TarInfo(f"pages/{key}{extension_for_content_type(content_type)}")
+                info.size = len(data)
+                info.mtime = mtime
+                info.pax_headers = {
+                    "IAW.key": key,
+                    "IAW.content_type": content_type,
+                    "IAW.sha256": checksum,
+                }
+                meta = read_cache_metadata(key)
+                if meta:
+                    info.pax_headers["IAW.meta"] = json.dumps(meta, separators=(",", ":"))
+                archive.addfile(info, io.BytesIO(data))
+                digest.update(checksum.encode("ascii"))
+                count += 1
+                total_bytes += len(data)
+
+            manifest = json.dumps({
+                "format": SNAPSHOT_FORMAT,
+                "exported_at": exported_at,
+                "since": since,
+                "backend": CACHE_BACKEND,
+                "entries": count,
+                "bytes": total_bytes,
+                "digest": digest.hexdigest(),
+            }, indent=2).encode("utf-8")
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(manifest)
+            info.mtime = exported_at
+            archive.addfile(info, io.BytesIO(manifest))
+
+    log(f"Exported {count} pages ({total_bytes} bytes), skipped {unreadable} unreadable, "
+        f"exported_at={exported_at}")
+    return {"entries": count, "bytes": total_bytes, "unreadable": unreadable,
+            "exported_at": exported_at}
+
+
+def _safe_key(key):
+    """Reject keys that would escape the cache directory"""
+    key = normalize_cache_path(key)
+    if posixpath.isabs(key) or "\\" in key or ".." in key.split("/"):
+        raise ValueError(f"Unsafe cache key in snapshot: {key!r}")
+    return key
+
+
+def import_snapshot(src, force=False, verify_only=False):
+    """Verify and load a snapshot stream into the configured cache backend.
+
+    The whole snapshot is verified before the first page is written, so a
+    truncated or tampered archive changes nothing; a stream that cannot seek
+    (stdin) is spooled to a temporary file for that. Pages whose local copy
+    is at least as new as the snapshot copy are kept unless ``force`` is set.
+    With ``verify_only`` nothing is written.
+    """
+    if not verify_only and not src.seekable():
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(src, spool)
+            spool.seek(0)
+            return import_snapshot(spool, force)
+
+    start = None if verify_only else src.tell()
+    result = _read_snapshot(src, force, verify_only=True)
+    if not verify_only:
+        src.seek(start)
+        result = _read_snapshot(src, force, verify_only=False)
+    log(f"Verified {result['entries']} pages: {result['imported']} imported, "
+        f"{result['skipped']} already up to date")
+    return result
+
+
+def _read_snapshot(src, force, verify_only):
+    digest = hashlib.sha256()
+    manifest = None
+    imported = skipped = seen = 0
+    written = set()  # a key may hold several files (foo.html and foo.json)
+
+    with tarfile.open(fileobj=src, mode="r|*") as archive:
+        for member in archive:
+            if member.name == MANIFEST_NAME:
+                manifest = json.load(archive.extractfile(member))
+                continue
+            headers = member.pax_headers
+            if not member.isfile() or "IAW.key" not in headers:
+                if verify_only:  # logged once, by the verifying pass
+                    log(f"Ignoring unexpected archive member: {member.name}")
+                continue
+
+            key = _safe_key(headers["IAW.key"])
+            data = archive.extractfile(member).read()
+            checksum = hashlib.sha256(data).hexdigest()
+            if checksum != headers.get("IAW.sha256"):
+                raise ValueError(f"Checksum mismatch for {key}")
+            digest.update(checksum.encode("ascii"))
+            seen += 1
+
+            if verify_only:
+                continue
+            if not force and key not in written:
+                local_mtime = get_cache_mtime(key)
+                if local_mtime is not None and local_mtime >= member.mtime:
+                    skipped += 1
+                    continue
+            meta = json.loads(headers["IAW.meta"]) if "IAW.meta" in headers else None
+            write_cache_entry(key, headers.get("IAW.content_type", "text/html"), data,
+                              mtime=member.mtime, meta=meta)
+            note_cache_saved(key)
+            written.add(key)
+            imported += 1
+
+    if manifest is None:
+        raise ValueError("Snapshot is truncated: manifest missing")
+    if manifest.get("entries") != seen or manifest.get("digest") != digest.hexdigest():
+        raise ValueError("Snapshot manifest does not match its contents")
+
+    return {"entries": seen, "imported": imported, "skipped": skipped,
+            "exported_at": manifest.get("exported_at")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export/import cache snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write the cache to a snapshot")
+    export.add_argument("-o", "--output", default="-", help="output file, '-' for stdout")
+    export.add_argument("--since", type=parse_since,
+                        help="only pages modified since this unix timestamp or ISO date")
+    export.add_argument("--level", type=int, default=1, help="gzip compression level (1-9)")
+
+    load = commands.add_parser("import", help="load a snapshot into the cache")
+    load.add_argument("input", help="snapshot file, '-' for stdin")
+    load.add_argument("--force", action="store_true", help="overwrite newer local pages")
+
+    verify = commands.add_parser("verify", help="check a snapshot without importing it")
+    verify.add_argument("input", help="snapshot file, '-' for stdin")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            if args.output == "-":
+                result = export_snapshot(sys.stdout.buffer, args.since, args.level)
+            else:
+                with open(args.output, "wb") as out:
+                    result = export_snapshot(out, args.since, args.level)
+        else:
+            src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+            with src:
+                result = import_snapshot(src, force=getattr(args, "force", False),
+                                         verify_only=args.command == "verify")
+    except (OSError, ValueError, tarfile.TarError) as e:
+        log(f"Error: {e}")
+        return 1
+
+    log(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,8 +4,12 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def _env_flag(name, default):
+    """Read a boolean setting such as CACHE_VARY_ON_MODEL=1"""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
 # AI Provider configuration
-AI_PROVIDER = os.getenv("AI_PROVIDER", "openrouter")  # openrouter, openai, gemini
+AI_PROVIDER = os.getenv("AI_PROVIDER", "openrouter")  # openrouter, openai, gemini, replay
 
 # OpenRouter configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -28,16 +32,74 @@ TOP_P = float(os.getenv("TOP_P", "0.95"))
 
 # Define the root directory path - use absolute path to avoid issues
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-WEB_DIR = os.path.join(ROOT_DIR, "web")
+WEB_DIR = os.getenv("WEB_DIR", os.path.join(ROOT_DIR, "web"))
 
 # Create web directory if it doesn't exist
 os.makedirs(WEB_DIR, exist_ok=True)
 
+# Per-page metadata (finish reason, token usage, model) for the directory backend;
+# the packfile backend keeps it inside each record
+CACHE_META_DIR = os.getenv("CACHE_META_DIR", WEB_DIR.rstrip("/\\") + "_meta")
+
+# Cache storage backend: directory (one file per page under web/) or packfile
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "directory")
+PACKFILE_PATH = os.getenv("PACKFILE_PATH", os.path.join(ROOT_DIR, "web.pack"))
+# Compact once dead bytes reach this share of the pack (and at least the minimum size)
+PACKFILE_COMPACT_RATIO = float(os.getenv("PACKFILE_COMPACT_RATIO", "0.5"))
+PACKFILE_COMPACT_MIN_BYTES = int(os.getenv("PACKFILE_COMPACT_MIN_BYTES", str(16 * 1024 * 1024)))
+
+# Cache variants: a page is cached per path, normalized form data, the query
+# params listed here and, optionally, provider/model
+CACHE_VARY_ON_MODEL = _env_flag("CACHE_VARY_ON_MODEL", "1")
+CACHE_VARY_QUERY_PARAMS = [name.strip() for name in os.getenv("CACHE_VARY_QUERY_PARAMS", "").split(",") if name.strip()]
+CACHE_MAX_VARIANTS_PER_PATH = int(os.getenv("CACHE_MAX_VARIANTS_PER_PATH", "16"))
+CACHE_MAX_FORM_BYTES = int(os.getenv("CACHE_MAX_FORM_BYTES", "4096"))  # larger submissions are not cached
+# Serve pages cached before variants existed (stored under the bare path) to plain GETs
+CACHE_LEGACY_FALLBACK = _env_flag("CACHE_LEGACY_FALLBACK", "1")
+
+# Junk paths (scanners, browser probes) get a cheap static response instead of
+# a generation. Rules must not catch topics such as /node.js, /my.sql or
+# /topics/.net: extensions are only asset and archive types, prefixes match whole
+# leading path segments, and dotfiles only the names listed in JUNK_DOTFILES
+# (also with a suffix, e.g. .env.local) in any segment.
+JUNK_EXTENSIONS = [ext.strip().lower() for ext in os.getenv(
+    "JUNK_EXTENSIONS",
+    ".ico,.png,.jpg,.jpeg,.gif,.webp,.svg,.map,.woff,.woff2,.ttf,"
+    ".asp,.aspx,.jsp,.cgi,.bak,.zip,.gz,.tar,.rar,.7z"
+).split(",") if ext.strip()]
+JUNK_PREFIXES = [prefix.strip().strip("/").lower() for prefix in os.getenv(
+    "JUNK_PREFIXES",
+    "wp-admin,wp-content,wp-includes,wp-login.php,wp-json,xmlrpc.php,cgi-bin,phpmyadmin,"
+    "vendor/phpunit,autodiscover,ads.txt,sitemap.xml,robots.txt,humans.txt,security.txt"
+).split(",") if prefix.strip().strip("/")]
+JUNK_DOTFILES = [name.strip().lower() for name in os.getenv(
+    "JUNK_DOTFILES",
+    ".env,.git,.svn,.hg,.htaccess,.htpasswd,.ds_store,.well-known,.aws,.ssh,.vscode,.idea"
+).split(",") if name.strip()]
+# Paths whose generation just failed are answered from a negative cache for a while
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "60"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+
+# Port used by `python infinite_web.py`
+PORT = int(os.getenv("PORT", "5000"))
+
+# Peer cache tier: base URLs of every node sharing the cache (including this one).
+# Each path is owned by one node chosen by consistent hashing; the others fetch
+# it from the owner on a local miss instead of generating it themselves.
+CACHE_PEERS = [url.strip().rstrip("/") for url in os.getenv("CACHE_PEERS", "").split(",") if url.strip()]
+CACHE_SELF_URL = os.getenv("CACHE_SELF_URL", f"http://127.0.0.1:{PORT}").rstrip("/")
+PEER_TIMEOUT = float(os.getenv("PEER_TIMEOUT", "180"))  # the owner may have to generate
+PEER_POOL_SIZE = int(os.getenv("PEER_POOL_SIZE", "32"))
+PEER_VIRTUAL_NODES = int(os.getenv("PEER_VIRTUAL_NODES", "128"))
+PEER_RETRY_AFTER = float(os.getenv("PEER_RETRY_AFTER", "30"))  # back-off for failing peers
+
 # Application title
 APP_TITLE = "INFINITE AI WEB v1"
 
-# Enhanced base prompt for richer content generation
-BASE_PROMPT = """Generate a comprehensive and detailed response for the URL path: `{{URL_PATH}}`
+# Static system prefix sent identically with every request, so providers (and
+# local llama.cpp / LM Studio servers) can reuse its cached prompt processing.
+# Nothing request-specific may go in here.
+SYSTEM_PROMPT = """You generate comprehensive and detailed responses for URL paths of a website.
 
 The first line must be the Content-Type (use 'text/html' for HTML responses).
 All subsequent lines should contain ONLY the renderable content with NO explanatory text, examples, or instructions.
@@ -57,14 +119,125 @@ For HTML responses:
 - Ensure all relative links maintain the parent context of the current URL path
 - Ensure the HTML is valid and immediately renderable in a browser
 - Focus on providing valuable, educational content rather than just navigation
+"""
 
+# Small per-request suffix
+USER_PROMPT = """Generate a comprehensive and detailed response for the URL path: `{{URL_PATH}}`
 {{OPTIONAL_DATA}}
 Content-Type:
 """
 
-def get_ai_config():
-    """Get configuration for the current AI provider"""
-    return {
+# Stop streaming as soon as the closing </html> tag arrives
+STOP_AT_HTML_END = _env_flag("STOP_AT_HTML_END", "1")
+# Adaptive max_tokens: shallow or popular paths get MAX_TOKENS, each level deeper
+# than TOKEN_BUDGET_FULL_DEPTH multiplies it by TOKEN_BUDGET_DEPTH_DECAY (never below
+# MIN_TOKENS), and data-like paths (.json, .txt, ...) get DATA_MAX_TOKENS
+ADAPTIVE_MAX_TOKENS = _env_flag("ADAPTIVE_MAX_TOKENS", "1")
+MIN_TOKENS = int(os.getenv("MIN_TOKENS", "2048"))
+DATA_MAX_TOKENS = int(os.getenv("DATA_MAX_TOKENS", "2048"))
+TOKEN_BUDGET_FULL_DEPTH = int(os.getenv("TOKEN_BUDGET_FULL_DEPTH", "2"))
+TOKEN_BUDGET_DEPTH_DECAY = float(os.getenv("TOKEN_BUDGET_DEPTH_DECAY", "0.75"))
+POPULAR_HITS = int(os.getenv("POPULAR_HITS", "5"))
+POPULARITY_MAX_PATHS = int(os.getenv("POPULARITY_MAX_PATHS", "100000"))
+
+# Truncated outputs (token limit hit, or </html> missing) are continued from
+# where they stopped instead of regenerated
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "1"))
+CONTINUE_PROMPT = ("Your previous response was cut off. Continue exactly where it stopped. "
+                   "Output only the remaining content, without repeating anything already written "
+                   "and without any explanation.")
+
+# Tiered generation: cache misses are served by a fast draft model, and pages
+# reaching UPGRADE_HITS requests are regenerated by the main model in the
+# background. Leave DRAFT_PROVIDER empty to always use the main model.
+DRAFT_PROVIDER = os.getenv("DRAFT_PROVIDER", "")  # openrouter, openai, gemini
+DRAFT_MODEL = os.getenv("DRAFT_MODEL", "")
+DRAFT_BASE_URL = os.getenv("DRAFT_BASE_URL", "")
+DRAFT_API_KEY = os.getenv("DRAFT_API_KEY", "")
+UPGRADE_HITS = int(os.getenv("UPGRADE_HITS", "3"))
+UPGRADE_WORKERS = int(os.getenv("UPGRADE_WORKERS", "2"))
+UPGRADE_RETRY_AFTER = float(os.getenv("UPGRADE_RETRY_AFTER", "300"))
+
+# Token ledger (SQLite) and budgets. Budgets count main-model tokens; once one
+# is exhausted, misses fall back to the draft model (BUDGET_EXHAUSTED_MODE=draft,
+# needs DRAFT_PROVIDER) or are only served from cache (cache-only). 0 = no limit.
+LEDGER_PATH = os.getenv("LEDGER_PATH", os.path.join(ROOT_DIR, "usage_ledger.sqlite3"))
+LEDGER_PREFIX_DEPTH = int(os.getenv("LEDGER_PREFIX_DEPTH", "1"))  # path segments grouped as a prefix
+TOKEN_BUDGET_HOURLY = int(os.getenv("TOKEN_BUDGET_HOURLY", "0"))
+TOKEN_BUDGET_DAILY = int(os.getenv("TOKEN_BUDGET_DAILY", "0"))
+BUDGET_EXHAUSTED_MODE = os.getenv("BUDGET_EXHAUSTED_MODE", "draft")
+BUDGET_CHECK_INTERVAL = float(os.getenv("BUDGET_CHECK_INTERVAL", "5"))  # seconds between ledger queries
+
+# Logging: records go through a bounded queue to a background writer.
+# LOG_FORMAT is json or text; hot-path (cache hit) messages are kept 1 in LOG_SAMPLE_HITS.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_HITS = int(os.getenv("LOG_SAMPLE_HITS", "10"))
+
+# Opt-in request profiling: send "X-Profile: <PROFILE_TOKEN>" or ?profile=<PROFILE_TOKEN>,
+# and/or profile one request in PROFILE_SAMPLE_EVERY (0 = never). Both unset = no overhead.
+# /api/profiles requires PROFILE_TOKEN and is closed when it is unset.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(ROOT_DIR, "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_TRACEMALLOC = _env_flag("PROFILE_TRACEMALLOC", "1")
+
+# Record/replay of provider responses (see replay.py). REPLAY_RECORD=1 stores every
+# live answer; AI_PROVIDER=replay serves them back, with recorded timing at REPLAY_SPEED
+# (1 = real time, 0 = no delays).
+REPLAY_CORPUS = os.getenv("REPLAY_CORPUS", os.path.join(ROOT_DIR, "replay_corpus"))
+REPLAY_RECORD = _env_flag("REPLAY_RECORD", "0")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "0"))
+
+# Link state: links in served pages are tagged data-link="cached", "ungenerated"
+# or "external" using an in-memory Bloom filter of cached paths, rebuilt from the
+# cache every LINK_FILTER_REFRESH seconds (picks up other workers' pages and evictions)
+LINK_STATE = _env_flag("LINK_STATE", "1")
+LINK_FILTER_FP_RATE = float(os.getenv("LINK_FILTER_FP_RATE", "0.01"))
+LINK_FILTER_REFRESH = float(os.getenv("LINK_FILTER_REFRESH", "300"))
+
+# Cache maintenance CLI (web_folder_cleaner.py). It runs next to the live server at
+# a lowered CPU priority; MAINTENANCE_PROCESSES=0 = half the CPUs (minification).
+MAINTENANCE_SCAN_THREADS = int(os.getenv("MAINTENANCE_SCAN_THREADS", "16"))  # parallel directory listings
+MAINTENANCE_PROCESSES = int(os.getenv("MAINTENANCE_PROCESSES", "0"))
+MAINTENANCE_NICE = int(os.getenv("MAINTENANCE_NICE", "10"))  # added to the process niceness
+
+# Prometheus-style metrics at /metrics (per-thread counters, cheap enough to leave on)
+METRICS_ENABLED = _env_flag("METRICS_ENABLED", "1")
+# With several gunicorn workers, each writes its totals here for the others' scrapes
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(ROOT_DIR, "metrics_shared"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))  # seconds
+
+# Production server (serve.py, gunicorn). Generations hold a worker thread for
+# tens of seconds while waiting on the provider, so the defaults favour many
+# threads per process over many processes. SERVE_WORKERS=0 = one per CPU.
+SERVE_BIND = os.getenv("SERVE_BIND", f"0.0.0.0:{PORT}")
+SERVE_WORKER_CLASS = os.getenv("SERVE_WORKER_CLASS", "gthread")  # gthread or gevent
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "64"))  # per gthread worker
+SERVE_WORKER_CONNECTIONS = int(os.getenv("SERVE_WORKER_CONNECTIONS", "1000"))  # per gevent worker
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", "300"))  # a silent worker is killed after this
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "180"))  # let generations finish on reload
+SERVE_KEEPALIVE = int(os.getenv("SERVE_KEEPALIVE", "5"))
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "5000"))  # recycle workers, 0 = never
+SERVE_MAX_REQUESTS_JITTER = int(os.getenv("SERVE_MAX_REQUESTS_JITTER", "500"))
+SERVE_PRELOAD = _env_flag("SERVE_PRELOAD", "1")
+SERVE_PIDFILE = os.getenv("SERVE_PIDFILE", os.path.join(ROOT_DIR, "serve.pid"))  # for reload/stop
+
+# Provider-side prompt caching hints (OpenRouter cache_control, llama.cpp
+# cache_prompt, Gemini cached content)
+PROMPT_CACHE = _env_flag("PROMPT_CACHE", "1")
+# Gemini explicit context caching; only pays off for models whose minimum
+# cacheable prompt size the system prompt reaches
+GEMINI_CONTEXT_CACHE = _env_flag("GEMINI_CONTEXT_CACHE", "0")
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+
+def get_ai_config(provider=None):
+    """Get configuration for the current (or the given) AI provider"""
+    provider = provider or AI_PROVIDER
+    config = {
         "openrouter": {
             "name": "OpenRouter",
             "api_key": OPENROUTER_API_KEY,
@@ -81,5 +254,27 @@ def get_ai_config():
             "name": "Google Gemini",
             "api_key": GEMINI_API_KEY,
             "model": GEMINI_MODEL
+        },
+        "replay": {
+            "name": "Replay",
+            "api_key": "",
+            "model": "replay",
+            "corpus": REPLAY_CORPUS
         }
-    }[AI_PROVIDER]
\ No newline at end of file
+    }[provider]
+    config["provider"] = provider
+    return config
+
+def get_draft_config():
+    """Configuration of the fast draft model, or None when tiering is disabled"""
+    if not DRAFT_PROVIDER:
+        return None
+    config = get_ai_config(DRAFT_PROVIDER)
+    config["name"] = f"{config['name']} (draft)"
+    if DRAFT_MODEL:
+        config["model"] = DRAFT_MODEL
+    if DRAFT_BASE_URL:
+        config["base_url"] = DRAFT_BASE_URL
+    if DRAFT_API_KEY:
+        config["api_key"] = DRAFT_API_KEY
+    return config
\ No newline at end of file
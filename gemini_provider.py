@@ -0,0 +1,109 @@
+"""Google Gemini backend, imported by models.get_provider() only when selected.
+
+google-generativeai pulls in grpc and protobuf, which takes seconds and tens
+of MB per process, so nothing else imports this module.
+"""
+import hashlib
+import threading
+import time
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    raise ImportError("Google Generative AI package not installed. Run: pip install google-generativeai") from None
+
+from config import MAX_TOKENS, TEMPERATURE, TOP_P, GEMINI_CONTEXT_CACHE, GEMINI_CACHE_TTL, get_ai_config
+from models import collect_until_html_end, estimate_usage
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+# One CachedContent per (model, API key, system prompt): the draft and main
+# tiers may both run on Gemini with different models or keys
+_gemini_caches = {}  # cache key -> (CachedContent, renew after)
+_gemini_cache_disabled = set()  # models whose system prompt cannot be cached
+_gemini_cache_lock = threading.Lock()
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _gemini_model(config, system_prompt):
+    """GenerativeModel for the system prompt, backed by Gemini cached content when enabled"""
+    model_name = config['model']
+    if GEMINI_CONTEXT_CACHE and model_name not in _gemini_cache_disabled:
+        key = (model_name, _digest(config['api_key'] or ""), _digest(system_prompt))
+        with _gemini_cache_lock:
+            try:
+                now = time.time()
+                content, expires = _gemini_caches.get(key, (None, 0.0))
+                if content is None or expires <= now:
+                    # Drop entries that expired, e.g. for a system prompt that changed
+                    for stale in [k for k, (_, renew) in _gemini_caches.items() if renew <= now]:
+                        del _gemini_caches[stale]
+                    content = genai.caching.CachedContent.create(
+                        model=model_name,
+                        system_instruction=system_prompt,
+                        ttl=f"{GEMINI_CACHE_TTL}s",
+                    )
+                    # Renew a little before the provider drops it
+                    _gemini_caches[key] = (content, now + GEMINI_CACHE_TTL * 0.9)
+                return genai.GenerativeModel.from_cached_content(content)
+            except Exception as e:
+                # Typically the prompt is below the model's minimum cacheable size
+                log.warning(f"Gemini context caching unavailable, using plain system instruction: {e}",
+                            extra={"provider": "gemini", "model": model_name})
+                _gemini_cache_disabled.add(model_name)
+    return genai.GenerativeModel(model_name, system_instruction=system_prompt)
+
+
+def generate_gemini(system_prompt, user_prompt, max_tokens=MAX_TOKENS, history=None, is_html=None, config=None):
+    """Generate content using Google Gemini API."""
+    config = config or get_ai_config()
+
+    # Configure Gemini
+    genai.configure(api_key=config['api_key'])
+    model = _gemini_model(config, system_prompt)
+
+    contents = [{"role": "user", "parts": [user_prompt]}]
+    for role, text in history or ():
+        contents.append({"role": "model" if role == "assistant" else "user", "parts": [text]})
+
+    log.debug("Sending request to Gemini API", extra={"provider": "gemini", "model": config["model"]})
+    response = model.generate_content(
+        contents,
+        generation_config={
+            "temperature": TEMPERATURE,
+            "top_p": TOP_P,
+            "max_output_tokens": max_tokens,
+        },
+        stream=True
+    )
+
+    last_chunk = {}
+
+    def pieces():
+        for chunk in response:
+            last_chunk["chunk"] = chunk
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts (e.g. only a finish reason)
+            if text:
+                yield text
+
+    ai_data, stopped_early = collect_until_html_end(pieces(), is_html)
+
+    # Streamed chunks carry cumulative usage; the last one we saw is the best we have
+    chunk = last_chunk.get("chunk")
+    metadata = getattr(chunk, "usage_metadata", None)
+    candidates = getattr(chunk, "candidates", None) or []
+    finish_reason = getattr(candidates[0].finish_reason, "name", None) if candidates else None
+    usage = {
+        "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+        "completion_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+        "cached_tokens": getattr(metadata, "cached_content_token_count", 0) or 0,
+        "finish_reason": "html_end" if stopped_early else (finish_reason or "").lower() or None,
+    }
+    return ai_data, estimate_usage(usage, system_prompt, user_prompt, history, ai_data)
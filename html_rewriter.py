@@ -0,0 +1,219 @@
+"""Single-pass HTML post-processing of generated pages.
+
+``HtmlRewriter`` scans the model output once, front to back, and works on
+chunks as they stream in: it only holds back the few characters a rule's
+token may span across a chunk boundary. Rules are regular expressions for a
+complete tag token (``</head>``, ``</body>``, ...) whose handler returns the
+replacement text, or None to leave the token alone; all of them are matched
+by one combined pattern anchored on ``<``, so text between tags is skipped
+inside the regex engine. Markers are plain text (``back-to-search``, in any
+case) that only set a flag the first time they appear. The default rules
+
+- inject the content CSS before ``</head>`` unless the page brought its own
+  ``<style>`` first, and
+- add the back-to-search link before ``</body>`` unless the page has one.
+
+Unlike the old whole-document ``process_html_response``, which looked for
+``<style`` anywhere in the page, a ``<style>`` after ``</head>`` no longer
+keeps the CSS out, since the head has already been sent by then. The back
+link is also added to pages that needed the CSS; the old check matched
+"back-to-search" inside the injected CSS and never added it.
+
+Documents without an ``<html`` tag are wrapped in a full page instead, which
+means they are held until the end. Further rewrites of generated pages plug
+in with ``register_rule``; a rewriter can also run its own list of rules
+(link_state.py tags links in pages as they are served).
+"""
+import re
+
+from templates import get_content_template
+
+BACK_LINK = '\n<div class="back-to-search">\n<a href="../..">Back to Search</a>\n</div>\n'
+_HTML_OPEN = re.compile(r"<html", re.IGNORECASE)
+
+
+class Rule:
+    """A tag to rewrite; ``handler(match, rewriter)`` returns its replacement or None.
+
+    ``pattern`` must start with ``<``. ``max_length`` bounds the token length,
+    and with it how much text is held back between chunks.
+    """
+
+    def __init__(self, name, pattern, handler, max_length=None):
+        if not pattern.startswith("<"):
+            raise ValueError(f"Rule {name!r} must match a tag starting with '<'")
+        self.name = name
+        self.pattern = pattern
+        self.handler = handler
+        self.max_length = max_length or len(pattern)
+
+
+def _head_end(match, rewriter):
+    state = rewriter.state
+    if state.get("style") or state.get("css_injected"):
+        return None
+    state["css_injected"] = True
+    return f"{get_content_template()}\n{match.group()}"
+
+
+def _body_end(match, rewriter):
+    state = rewriter.state
+    if state.get("back_link") or state.get("back_link_injected"):
+        return None
+    state["back_link_injected"] = True
+    return f"{BACK_LINK}{match.group()}"
+
+
+def _seen_style(match, rewriter):
+    rewriter.state["style"] = True
+    return None
+
+
+# Text (matched in any case) whose first occurrence sets rewriter.state[flag]
+MARKERS = {"back_link": "back-to-search"}
+_marker_patterns = {}  # marker text -> compiled pattern
+
+RULES = [
+    Rule("style", "<style", _seen_style),
+    Rule("head_end", "</head>", _head_end),
+    Rule("body_end", "</body>", _body_end),
+]
+_compiled = {}  # tuple of rules -> (regex, handlers, holdback)
+
+
+def register_rule(rule):
+    """Add a rewrite applied to every page processed from now on"""
+    RULES.append(rule)
+    _compiled.clear()
+
+
+def compile_rules(rules=None):
+    """Combined pattern, handlers and holdback of a rule list (cached), by default RULES"""
+    rules = tuple(RULES if rules is None else rules)
+    compiled = _compiled.get(rules)
+    if compiled is None:
+        alternatives = "|".join(f"(?P<{rule.name}>{rule.pattern[1:]})" for rule in rules)
+        regex = re.compile(f"<(?:{alternatives})", re.IGNORECASE)
+        handlers = {rule.name: rule.handler for rule in rules}
+        holdback = max([rule.max_length for rule in rules] + [len(text) for text in MARKERS.values()])
+        compiled = _compiled[rules] = (regex, handlers, holdback)
+    return compiled
+
+
+def format_title(path):
+    """Format a URL path into a readable page title."""
+    if path.startswith("web/"):
+        path = path[4:]
+
+    title = path.replace("-", " ").replace("/", " - ")
+    title = " ".join(word.capitalize() for word in title.split())
+
+    return title
+
+
+def wrap_fragment(html_content, path):
+    """Full page around model output that has no <html> structure"""
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{format_title(path)}</title>
+    {get_content_template()}
+</head>
+<body>
+    {html_content}
+    <div class="back-to-search">
+        <a href="../..">Back to Search</a>
+    </div>
+</body>
+</html>"""
+
+
+class HtmlRewriter:
+    """Incremental rewriter: ``feed`` chunks, then ``close``; both return output text.
+
+    ``rules`` replaces the default RULES (and their markers), ``state`` seeds
+    the dict handlers share, and ``wrap_fragments=False`` passes documents
+    without an ``<html`` tag through the rules instead of wrapping them.
+    """
+
+    def __init__(self, path, rules=None, state=None, wrap_fragments=True):
+        self.path = path
+        self.state = dict(state or {})
+        self._regex, self._handlers, self._holdback = compile_rules(rules)
+        self._markers = MARKERS if rules is None else {}
+        self._pending = ""
+        self._held = []  # output before <html> is seen; a fragment is wrapped at the end
+        self._tail = ""
+        self._streaming = not wrap_fragments
+
+    def feed(self, chunk):
+        if self._streaming:
+            return self._rewrite(chunk, final=False)
+        self._held.append(chunk)
+        boundary = self._tail + chunk[:len("<html") - 1]
+        if _HTML_OPEN.search(chunk) is None and _HTML_OPEN.search(boundary) is None:
+            self._tail = (self._tail + chunk)[-(len("<html") - 1):]
+            return ""
+        self._streaming = True
+        held, self._held = "".join(self._held), []
+        return self._rewrite(held, final=False)
+
+    def close(self):
+        if not self._streaming:
+            return wrap_fragment("".join(self._held), self.path)
+        return self._rewrite("", final=True)
+
+    def _rewrite(self, chunk, final):
+        data = self._pending + chunk if self._pending else chunk
+        limit = len(data) if final else len(data) - self._holdback
+        if limit <= 0:
+            self._pending = data
+            return ""
+
+        markers = self._find_markers(data)
+        out = []
+        position = cut = 0
+        for match in self._regex.finditer(data):
+            if match.start() >= limit:
+                break
+            cut = match.end()
+            if markers:
+                self._mark(markers, match.start())
+            replacement = self._handlers[match.lastgroup](match, self)
+            if replacement is not None:
+                out.append(data[position:match.start()])
+                out.append(replacement)
+                position = match.end()
+        cut = max(cut, limit)
+        if markers:
+            self._mark(markers, cut)
+        out.append(data[position:cut])
+        self._pending = data[cut:]
+        return "".join(out)
+
+    def _find_markers(self, data):
+        """First position of every marker not seen yet, in document order"""
+        found = []
+        for flag, text in self._markers.items():
+            if self.state.get(flag):
+                continue
+            pattern = _marker_patterns.get(text)
+            if pattern is None:
+                pattern = _marker_patterns[text] = re.compile(re.escape(text), re.IGNORECASE)
+            match = pattern.search(data)
+            if match:
+                found.append((match.start(), flag))
+        return sorted(found)
+
+    def _mark(self, markers, before):
+        """Set the flags of markers that start before ``before``; they are then dropped"""
+        while markers and markers[0][0] < before:
+            self.state[markers.pop(0)[1]] = True
+
+
+def rewrite_html(html_content, path):
+    """Rewrite a complete document in one go"""
+    rewriter = HtmlRewriter(path)
+    return rewriter.feed(html_content) + rewriter.close()
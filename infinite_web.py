@@ -1,27 +1,43 @@
 from flask import Flask
 import os
+import sys
 from config import ROOT_DIR
 from views import setup_routes
 from utils import generate_index_html
+from app_logging import setup_logging, get_logger
+import profiling
+
+log = get_logger(__name__)
 
 def create_app():
     """Create and configure the Flask application."""
+    setup_logging()
     app = Flask(__name__)
     setup_routes(app)
+    profiling.install(app)
     return app
 
-if __name__ == '__main__':
-    # Print directory information
-    from config import ROOT_DIR, WEB_DIR
-    print(f"Root directory path: {ROOT_DIR}")
-    print(f"Web directory path: {WEB_DIR}")
-    
-    # Create index.html if it doesn't exist yet
+def prepare_site():
+    """Log the directories in use and create index.html if it doesn't exist yet."""
+    from config import WEB_DIR
+    log.info(f"Root directory path: {ROOT_DIR}")
+    log.info(f"Web directory path: {WEB_DIR}")
+
     if not os.path.exists(os.path.join(ROOT_DIR, "index.html")):
-        print("Generating initial index.html...")
+        log.info("Generating initial index.html...")
         generate_index_html()
-    
-    # Create and run the app
-    app = create_app()
-    print("Starting Flask application...")
-    app.run(debug=True)
\ No newline at end of file
+
+if __name__ == '__main__':
+    setup_logging()
+
+    # `python infinite_web.py --dev` runs the Werkzeug development server with
+    # the reloader and debugger; everything else goes to the production server
+    if "--dev" in sys.argv[1:]:
+        from config import PORT
+        prepare_site()
+        app = create_app()
+        log.info("Starting Flask development server...")
+        app.run(debug=True, port=PORT)
+    else:
+        import serve
+        sys.exit(serve.main(sys.argv[1:]))
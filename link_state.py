@@ -0,0 +1,245 @@
+"""Link state of served pages: which links lead to pages that already exist.
+
+An in-memory Bloom filter holds the canonical path of every cached page (all
+variants of a path count as one). It is built from the cache with
+``iter_cache_entries``, updated when a page is saved, and rebuilt in the
+background every LINK_FILTER_REFRESH seconds, or sooner after evictions, to
+pick up pages generated by other workers and forget removed ones. Lookups
+never touch the disk; a false positive (about LINK_FILTER_FP_RATE) only means
+a link is styled as cached although the page still has to be generated.
+
+``annotate`` runs served HTML through an HtmlRewriter that adds
+``data-link="cached"``, ``"ungenerated"`` or ``"external"`` to every ``<a href>``
+and the matching CSS before ``</head>``. Tags left by an earlier pass are
+replaced and the CSS is not added twice; pages sent to peers are not annotated.
+"""
+import html
+import math
+import posixpath
+import re
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from config import LINK_FILTER_FP_RATE, LINK_FILTER_REFRESH
+from html_rewriter import HtmlRewriter, Rule
+from request_filters import match_junk
+from templates import LINK_STATE_CSS
+from utils import base_path_for_key, iter_cache_entries, normalize_cache_path
+from app_logging import get_logger
+
+log = get_logger(__name__)
+
+CACHED = "cached"
+UNGENERATED = "ungenerated"
+EXTERNAL = "external"
+
+MIN_CAPACITY = 10000
+# Rebuild once evictions since the last build reach this share of the entries
+STALE_RATIO = 0.05
+
+_HREF = re.compile(r"""\shref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+_DATA_LINK = re.compile(r"""\sdata-link\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+)""", re.IGNORECASE)
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity, fp_rate=LINK_FILTER_FP_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, int(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing on the halves of Python's (cached) string hash. It is
+        # randomized per interpreter, which is fine: the filter never leaves
+        # the process, and forked workers inherit the seed with the bits.
+        value = hash(item) & 0xFFFFFFFFFFFFFFFF
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+_filter = None
+_lock = threading.Lock()
+_built_at = 0.0
+_building = False
+_saved_while_building = []
+_evicted = 0
+_stats = {"builds": 0, "last_build_seconds": None}
+
+
+def build():
+    """(Re)build the filter from the cache and swap it in"""
+    global _filter, _built_at, _building, _saved_while_building, _evicted
+    with _lock:
+        _building = True
+        _saved_while_building = []
+    started = time.perf_counter()
+    paths = {base_path_for_key(key) for key, _, _, _ in iter_cache_entries()}
+    bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(paths)))
+    for path in paths:
+        bloom.add(path)
+    with _lock:
+        for path in _saved_while_building:
+            bloom.add(path)
+        _filter = bloom
+        _built_at = time.time()
+        _building = False
+        _evicted = 0
+        _stats["builds"] += 1
+        _stats["last_build_seconds"] = round(time.perf_counter() - started, 3)
+    log.info("Built link state filter", extra={"entries": bloom.count, "bytes": len(bloom.bits),
+                                               "seconds": _stats["last_build_seconds"]})
+    return bloom
+
+
+def _build_in_background():
+    global _building
+    try:
+        build()
+    except Exception as e:
+        _building = False
+        log.error(f"Error building link state filter: {e}")
+
+
+def _current_filter():
+    """The filter, scheduling a background (re)build when missing or stale"""
+    global _building
+    bloom = _filter
+    stale = (bloom is None or time.time() - _built_at >= LINK_FILTER_REFRESH
+             or bloom.count > bloom.capacity or _evicted > bloom.count * STALE_RATIO)
+    if stale and not _building:
+        with _lock:
+            if _building:
+                return bloom
+            _building = True
+        threading.Thread(target=_build_in_background, name="link-state", daemon=True).start()
+    return bloom
+
+
+def note_saved(key):
+    """A page was stored under cache key ``key``"""
+    path = base_path_for_key(key)
+    with _lock:
+        if _building:
+            _saved_while_building.append(path)
+        bloom = _filter
+    if bloom is not None:
+        bloom.add(path)
+
+
+def note_evicted(key):
+    """A page was removed; its path stays in the filter until the next rebuild"""
+    global _evicted
+    with _lock:
+        _evicted += 1
+
+
+def link_state(href, page_path, host=None, bloom=None):
+    """cached, ungenerated, external or None (not a page link) for an href on a page"""
+    href = href.strip()
+    if not href or href.startswith(("#", "?")):
+        return None
+    parts = urlsplit(href)
+    if parts.scheme and parts.scheme not in ("http", "https"):
+        return None  # mailto:, javascript:, tel:, data: ...
+    if parts.netloc and parts.netloc != host:
+        return EXTERNAL
+    path = parts.path
+    if not path.startswith("/"):
+        path = posixpath.join(posixpath.dirname("/" + page_path.lstrip("/")), path)
+    if "/." in path:
+        path = posixpath.normpath(path)
+    path = unquote(path)
+    if path == "/" or path.startswith("/api/") or match_junk(path):
+        return None
+    bloom = _filter if bloom is None else bloom
+    if bloom is None:
+        return None
+    return CACHED if normalize_cache_path(path) in bloom else UNGENERATED
+
+
+def _tag_link(match, rewriter):
+    tag = match.group()
+    href = _HREF.search(tag)
+    if href is None:
+        return None
+    # Pages cached before the state of their links changed (or fetched from
+    # an annotating peer) carry stale tags
+    stale = "data-link" in tag
+    if stale:
+        tag = _DATA_LINK.sub("", tag)
+    value = html.unescape(next(group for group in href.groups() if group is not None))
+    known = rewriter.state["links"]  # pages repeat their links (navigation, related topics)
+    state = known.get(value, False)
+    if state is False:
+        state = known[value] = link_state(value, rewriter.path, rewriter.state.get("host"), rewriter.state["filter"])
+    if state is None:
+        return tag if stale else None
+    end = -2 if tag.endswith("/>") else -1
+    return f'{tag[:end]} data-link="{state}"{tag[end:]}'
+
+
+def _seen_css(match, rewriter):
+    rewriter.state["css_added"] = True
+    return None
+
+
+def _add_css(match, rewriter):
+    if rewriter.state.get("css_added"):
+        return None
+    rewriter.state["css_added"] = True
+    return f"{LINK_STATE_CSS}{match.group()}"
+
+
+RULES = [
+    Rule("link_css_present", r"<style[^>]*>\s*a\[data-link=", _seen_css, max_length=256),
+    Rule("link_css", "</head>", _add_css),
+    Rule("link", r"<a\s[^>]*>", _tag_link, max_length=4096),
+]
+
+
+def annotate(content, page_path, host=None):
+    """Served HTML with its links tagged; unchanged while the filter is being built"""
+    bloom = _current_filter()
+    if bloom is None:
+        return content
+    rewriter = HtmlRewriter(page_path, rules=RULES, state={"filter": bloom, "host": host, "links": {}}, wrap_fragments=False)
+    return rewriter.feed(content) + rewriter.close()
+
+
+def get_link_state_stats():
+    bloom = _filter
+    if bloom is None:
+        return {"ready": False, "building": _building}
+    return {
+        "ready": True,
+        "building": _building,
+        "entries": bloom.count,
+        "capacity": bloom.capacity,
+        "bytes": len(bloom.bits),
+        "hashes": bloom.hashes,
+        "false_positive_rate": round((1 - math.exp(-bloom.hashes * bloom.count / bloom.size)) ** bloom.hashes, 6),
+        "evicted_since_build": _evicted,
+        "age_seconds": round(time.time() - _built_at, 1),
+        "builds": _stats["builds"],
+        "last_build_seconds": _stats["last_build_seconds"],
+    }
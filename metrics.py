@@ -0,0 +1,296 @@
+"""Prometheus-style metrics, served at /metrics.
+
+Recording is lock-free: every thread owns a store of counters and histogram
+buckets that only it writes to, and a scrape sums the stores of all threads.
+When a thread (or greenlet) ends, its store is folded into a shared total, so
+the number of stores stays at the number of live threads.
+Stages of a request are timed with ``timed``:
+
+    with metrics.timed("cache_lookup"):
+        ...
+
+Under gunicorn with several workers (serve.py), every worker writes a
+snapshot of its totals to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds,
+and a scrape, whichever worker answers it, reports the sum of all of them.
+Snapshots of exited workers are merged into one file by the master, so
+counters keep growing across worker restarts.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+from config import METRICS_ENABLED, METRICS_FLUSH_INTERVAL
+
+# Histogram buckets in seconds, from disk reads up to long generations
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+
+STAGE_SECONDS = "iaw_stage_seconds"
+REQUEST_SECONDS = "iaw_request_seconds"
+REQUESTS = "iaw_requests_total"
+CACHE_LOOKUPS = "iaw_cache_lookups_total"
+PROVIDER_REQUESTS = "iaw_provider_requests_total"
+PROVIDER_ERRORS = "iaw_provider_errors_total"
+GENERATIONS_STARTED = "iaw_generations_started_total"
+GENERATIONS_FINISHED = "iaw_generations_finished_total"
+
+HELP = {
+    STAGE_SECONDS: ("histogram", "Time spent in each stage of serving a page"),
+    REQUEST_SECONDS: ("histogram", "Request latency by endpoint and status"),
+    REQUESTS: ("counter", "Page requests by how they were answered"),
+    CACHE_LOOKUPS: ("counter", "Page cache lookups by result"),
+    PROVIDER_REQUESTS: ("counter", "Calls to the AI provider"),
+    PROVIDER_ERRORS: ("counter", "Failed calls to the AI provider by HTTP status"),
+    GENERATIONS_STARTED: ("counter", "Page generations started"),
+    GENERATIONS_FINISHED: ("counter", "Page generations finished, successful or not"),
+}
+
+_local = threading.local()
+_stores = []
+# Reentrant: a store can be retired by a finalizer running while the lock is held
+_stores_lock = threading.RLock()
+_shared_dir = None  # set by share() when several worker processes serve /metrics
+RETIRED_FILE = "retired.json"
+
+
+class _Store:
+    """Metrics written by a single thread"""
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = defaultdict(int)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> bucket counts + [+Inf count, sum]
+
+
+class _Owner:
+    """Lives in the thread-local next to the store; collected when the thread ends"""
+    __slots__ = ("__weakref__",)
+
+
+_retired = _Store()  # totals of threads that have ended
+
+
+def _merge(into, counters, histograms):
+    for key, value in counters.items():
+        into.counters[key] += value
+    for key, counts in histograms.items():
+        total = into.histograms.get(key)
+        if total is None:
+            into.histograms[key] = list(counts)
+        else:
+            for index, count in enumerate(counts):
+                total[index] += count
+
+
+def _retire(store):
+    with _stores_lock:
+        _stores.remove(store)
+        _merge(_retired, store.counters, store.histograms)
+
+
+def _store():
+    store = getattr(_local, "store", None)
+    if store is None:
+        store = _Store()
+        owner = _local.owner = _Owner()
+        weakref.finalize(owner, _retire, store)
+        with _stores_lock:
+            _stores.append(store)
+        _local.store = store
+    return store
+
+
+def inc(name, labels=(), value=1):
+    """Increase a counter; ``labels`` is a tuple of (name, value) pairs"""
+    if METRICS_ENABLED:
+        _store().counters[name, labels] += value
+
+
+def observe(name, seconds, labels=()):
+    if not METRICS_ENABLED:
+        return
+    histograms = _store().histograms
+    counts = histograms.get((name, labels))
+    if counts is None:
+        counts = histograms[name, labels] = [0] * (len(BUCKETS) + 1) + [0.0]
+    counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+    counts[-1] += seconds
+
+
+@contextmanager
+def _timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(STAGE_SECONDS, time.perf_counter() - started, (("stage", stage),))
+
+
+def timed(stage):
+    """Context manager timing one stage into iaw_stage_seconds"""
+    return _timer(stage) if METRICS_ENABLED else nullcontext()
+
+
+def error_status(error):
+    """HTTP status of a failed provider call, or a short name for the failure"""
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", None):
+        return str(response.status_code)
+    name = type(error).__name__.lower()
+    if "timeout" in name:
+        return "timeout"
+    if "connection" in name:
+        return "connection"
+    return "error"
+
+
+def _collect():
+    """Totals of this process"""
+    total = _Store()
+    with _stores_lock:
+        # Taken together, so a store retired meanwhile is counted exactly once
+        stores = list(_stores)
+        _merge(total, _retired.counters, _retired.histograms)
+    for store in stores:
+        # dict.copy() is atomic, so the owning thread may keep writing
+        _merge(total, store.counters.copy(), store.histograms.copy())
+    return total.counters, total.histograms
+
+
+# -- sharing between worker processes ---------------------------------------
+
+def _dump(counters, histograms, path):
+    snapshot = {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [[name, labels, counts] for (name, labels), counts in histograms.items()],
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _load(path, into):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    _merge(into,
+           {(name, tuple(map(tuple, labels))): value for name, labels, value in snapshot["counters"]},
+           {(name, tuple(map(tuple, labels))): counts for name, labels, counts in snapshot["histograms"]})
+
+
+def share(directory):
+    """Aggregate /metrics over all worker processes (call in the master before forking)"""
+    global _shared_dir
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):  # left over from an earlier run
+        if name.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, name))
+    _shared_dir = directory
+
+
+def flush():
+    """Write this process's totals for the other workers' scrapes"""
+    if _shared_dir is not None and METRICS_ENABLED:
+        counters, histograms = _collect()
+        _dump(counters, histograms, os.path.join(_shared_dir, f"{os.getpid()}.json"))
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start_sharing():
+    """Start writing snapshots (call in each worker after forking)"""
+    if _shared_dir is not None and METRICS_ENABLED:
+        threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+
+
+def retire_process(pid):
+    """Fold the last snapshot of an exited worker into the retired totals (master only)"""
+    if _shared_dir is None:
+        return
+    path = os.path.join(_shared_dir, f"{pid}.json")
+    if not os.path.exists(path):
+        return
+    retired_path = os.path.join(_shared_dir, RETIRED_FILE)
+    total = _Store()
+    _load(retired_path, total)
+    _load(path, total)
+    _dump(total.counters, total.histograms, retired_path)
+    os.remove(path)
+
+
+def _collect_shared():
+    """Totals of every worker: this one live, the others as of their last snapshot"""
+    flush()
+    total = _Store()
+    for name in os.listdir(_shared_dir):
+        if name.endswith(".json"):
+            _load(os.path.join(_shared_dir, name), total)
+    return total.counters, total.histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    counters, histograms = _collect_shared() if _shared_dir is not None else _collect()
+    lines = []
+
+    def header(name):
+        kind, text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name in sorted({name for name, _ in counters}):
+        header(name)
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        header(name)
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+            cumulative += counts[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {counts[-1]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    hits = counters.get((CACHE_LOOKUPS, (("result", "hit"),)), 0)
+    misses = counters.get((CACHE_LOOKUPS, (("result", "miss"),)), 0)
+    lines.append("# HELP iaw_cache_hit_ratio Share of page cache lookups that were hits")
+    lines.append("# TYPE iaw_cache_hit_ratio gauge")
+    lines.append(f"iaw_cache_hit_ratio {hits / (hits + misses) if hits + misses else 0.0:.4f}")
+
+    started = sum(value for (name, _), value in counters.items() if name == GENERATIONS_STARTED)
+    finished = sum(value for (name, _), value in counters.items() if name == GENERATIONS_FINISHED)
+    lines.append("# HELP iaw_generations_in_flight Page generations currently running")
+    lines.append("# TYPE iaw_generations_in_flight gauge")
+    lines.append(f"iaw_generations_in_flight {started - finished}")
+    return "\n".join(lines) + "\n"
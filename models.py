@@ -1,55 +1,339 @@
+import importlib
 import requests
 import json
 import re
+import threading
+import time
+from collections import Counter
 from config import (
-    AI_PROVIDER, BASE_PROMPT, MAX_TOKENS, TEMPERATURE, TOP_P,
-    get_ai_config
+    SYSTEM_PROMPT, USER_PROMPT, MAX_TOKENS, TEMPERATURE, TOP_P,
+    PROMPT_CACHE, STOP_AT_HTML_END,
+    ADAPTIVE_MAX_TOKENS, MIN_TOKENS, DATA_MAX_TOKENS, TOKEN_BUDGET_FULL_DEPTH,
+    TOKEN_BUDGET_DEPTH_DECAY, POPULAR_HITS, MAX_CONTINUATIONS, CONTINUE_PROMPT,
+    REPLAY_RECORD, get_ai_config, get_draft_config
 )
-from templates import get_content_template
+from html_rewriter import rewrite_html
 from utils import save_to_cache
+from popularity import hit_count
+import usage_ledger
+import metrics
+import replay
+from app_logging import get_logger
 
-# Try to import Gemini, but make it optional
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+log = get_logger(__name__)
 
-def generate_content(path, form_data=None, use_cache=True):
-    """Generate content using the configured AI provider."""
-    print(f"Using AI provider: {AI_PROVIDER}")
-    
-    # Prepare the prompt
+# Model tiers recorded in page metadata
+TIER_DRAFT = "draft"
+TIER_QUALITY = "quality"
+
+HTML_END = "</html>"
+# Paths that ask for data rather than a page get a smaller token budget
+DATA_EXTENSIONS = (".json", ".txt", ".csv", ".xml", ".yaml", ".yml", ".md")
+# Finish reasons meaning the model ran out of tokens (OpenAI-style, Gemini)
+TRUNCATED_FINISH_REASONS = ("length", "max_tokens")
+_HTML_OPEN = re.compile(r"<html[\s>]", re.IGNORECASE)
+_HTML_CLOSE = re.compile(r"</html\s*>", re.IGNORECASE)
+_HTML_END = re.compile(re.escape(HTML_END), re.IGNORECASE)
+_FENCE_START = re.compile(r"\A\s*```[a-z]*\n")
+_FENCE_END = re.compile(r"\n?```\s*\Z")
+# Bounds for the text a continuation may repeat from the end of the partial output
+MIN_STITCH_OVERLAP = 8
+MAX_STITCH_OVERLAP = 500
+# Rough ratio used when a stream is cut before the provider reports usage
+CHARS_PER_TOKEN = 4
+
+# Running totals of prompt tokens and how many of them the provider served from its prompt cache
+PROMPT_CACHE_STATS = Counter()
+_stats_lock = threading.Lock()
+
+def build_prompt(path, form_data=None, query_params=None):
+    """Return (system prompt, user prompt) for a path.
+
+    The system prompt is the same for every request so that it can be served
+    from provider-side prompt caches; only the short user prompt varies.
+    """
+    optional_data = []
     if form_data:
-        prompt_content = BASE_PROMPT.replace("{{OPTIONAL_DATA}}", f"form data: {json.dumps(form_data)}")
-    else:
-        prompt_content = BASE_PROMPT.replace("{{OPTIONAL_DATA}}", "")
+        optional_data.append(f"form data: {json.dumps(form_data)}")
+    if query_params:
+        optional_data.append(f"query params: {json.dumps(query_params)}")
+    user_prompt = USER_PROMPT.replace("{{OPTIONAL_DATA}}", "\n".join(optional_data))
+    user_prompt = user_prompt.replace("{{URL_PATH}}", path)
+    return SYSTEM_PROMPT, user_prompt
+
+def record_usage(usage):
+    """Add a provider usage block to the prompt cache totals"""
+    with _stats_lock:
+        PROMPT_CACHE_STATS['requests'] += 1
+        PROMPT_CACHE_STATS['prompt_tokens'] += usage.get('prompt_tokens') or 0
+        PROMPT_CACHE_STATS['cached_tokens'] += usage.get('cached_tokens') or 0
+        PROMPT_CACHE_STATS['completion_tokens'] += usage.get('completion_tokens') or 0
+
+def get_prompt_cache_stats():
+    with _stats_lock:
+        stats = dict(PROMPT_CACHE_STATS)
+    prompt_tokens = stats.get('prompt_tokens', 0)
+    stats['cached_ratio'] = round(stats.get('cached_tokens', 0) / prompt_tokens, 3) if prompt_tokens else 0.0
+    return stats
+
+def token_budget(path):
+    """max_tokens for a path: full budget for shallow or popular pages, less for
+    deep long-tail pages and data-like paths"""
+    if not ADAPTIVE_MAX_TOKENS:
+        return MAX_TOKENS
+    name = path.rstrip('/').rpartition('/')[2].lower()
+    if name.endswith(DATA_EXTENSIONS):
+        return min(DATA_MAX_TOKENS, MAX_TOKENS)
+    depth = len([segment for segment in path.split('/') if segment])
+    if depth <= TOKEN_BUDGET_FULL_DEPTH or hit_count(path) >= POPULAR_HITS:
+        return MAX_TOKENS
+    budget = int(MAX_TOKENS * TOKEN_BUDGET_DEPTH_DECAY ** (depth - TOKEN_BUDGET_FULL_DEPTH))
+    return max(min(MIN_TOKENS, MAX_TOKENS), budget)
+
+def generate_content(path, form_data=None, use_cache=True, cache_key=None, query_params=None,
+                     tier=TIER_QUALITY):
+    """Generate content using the configured AI provider.
+
+    The page is cached under ``cache_key`` (see utils.cache_keys), defaulting
+    to the bare path, together with its finish reason, token usage and tier.
+    ``tier`` selects the fast draft model (TIER_DRAFT) or the main model.
+    """
+    config = get_draft_config() if tier == TIER_DRAFT else None
+    if config is None:
+        config, tier = get_ai_config(), TIER_QUALITY
+    log.debug("Using AI provider", extra={"path": path, "provider": config["provider"], "tier": tier})
     
-    prompt_content = prompt_content.replace("{{URL_PATH}}", path)
+    metrics.inc(metrics.GENERATIONS_STARTED)
+    try:
+        # Prepare the prompt
+        with metrics.timed("prompt_build"):
+            system_prompt, user_prompt = build_prompt(path, form_data, query_params)
+        max_tokens = token_budget(path)
+        started = time.time()
+        
+        ai_data, usage = call_provider(system_prompt, user_prompt, max_tokens, config=config)
+        ai_data, usage = continue_if_truncated(ai_data, usage, system_prompt, user_prompt, max_tokens, config)
+        content_type, response_data = extract_content_type_and_data(ai_data)
+        
+        record_usage(usage)
+        usage_ledger.record(path, config["provider"], config.get("model"), tier, usage)
+        log.info("Generated page", extra={
+            "path": path, "provider": config["provider"], "model": config.get("model"), "tier": tier,
+            "max_tokens": max_tokens, "finish_reason": usage.get("finish_reason"),
+            "prompt_tokens": usage.get("prompt_tokens"), "cached_tokens": usage.get("cached_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "latency_ms": round((time.time() - started) * 1000, 1), "bytes": len(response_data),
+        })
+        
+        # For HTML responses, ensure we have rich CSS styling
+        if content_type == "text/html":
+            with metrics.timed("process_html"):
+                response_data = process_html_response(response_data, path)
+        
+        # Save to cache if caching is enabled
+        if use_cache:
+            meta = {
+                "provider": config["provider"],
+                "model": config.get("model"),
+                "tier": tier,
+                "max_tokens": max_tokens,
+                "finish_reason": usage.get("finish_reason"),
+                "usage": {name: usage.get(name) for name in ("prompt_tokens", "completion_tokens", "cached_tokens")},
+                "usage_estimated": bool(usage.get("estimated")),
+                "continuations": usage.get("continuations", 0),
+                "generated_at": round(started, 3),
+                "generation_seconds": round(time.time() - started, 3),
+            }
+            with metrics.timed("cache_write"):
+                save_to_cache(cache_key or path, content_type, response_data, meta=meta)
+    finally:
+        metrics.inc(metrics.GENERATIONS_FINISHED)
     
-    # Route to the appropriate provider
-    if AI_PROVIDER == "openrouter":
-        content_type, response_data = generate_openrouter(prompt_content)
-    elif AI_PROVIDER == "openai":
-        content_type, response_data = generate_openai(prompt_content)
-    elif AI_PROVIDER == "gemini":
-        content_type, response_data = generate_gemini(prompt_content)
-    else:
-        raise ValueError(f"Unsupported AI provider: {AI_PROVIDER}")
+    return content_type, response_data
+
+def call_provider(system_prompt, user_prompt, max_tokens, history=None, is_html=None, config=None):
+    """Send a prompt to a provider and return (raw text, usage).
+
+    ``history`` holds extra (role, text) turns after the user prompt, with role
+    "assistant" or "user"; ``is_html`` tells the stream reader whether the
+    output is HTML when it does not start with its own Content-Type line.
+    ``config`` defaults to the main provider from config.get_ai_config().
+    """
+    config = config or get_ai_config()
+    provider = config["provider"]
+    generate = get_provider(provider)
     
-    # For HTML responses, ensure we have rich CSS styling
-    if content_type == "text/html":
-        response_data = process_html_response(response_data, path)
+    labels = (("provider", provider),)
+    metrics.inc(metrics.PROVIDER_REQUESTS, labels)
+    record = REPLAY_RECORD and provider != "replay"
+    with metrics.timed("provider_call"):
+        try:
+            if record:
+                recording = replay.start_recording()
+            try:
+                ai_data, usage = generate(system_prompt, user_prompt, max_tokens, history, is_html, config)
+            finally:
+                if record:
+                    replay.stop_recording()
+        except Exception as e:
+            metrics.inc(metrics.PROVIDER_ERRORS, labels + (("status", metrics.error_status(e)),))
+            raise
+    if record:
+        try:
+            replay.save(replay.prompt_key(system_prompt, user_prompt, history), config, recording, ai_data, usage)
+        except OSError as e:
+            log.error(f"Error recording provider response: {e}")
+    return ai_data, usage
+
+def is_truncated(ai_data, usage):
+    """Whether a response was cut off: the provider hit the token limit, or an
+    HTML document was opened but never closed"""
+    finish_reason = usage.get("finish_reason")
+    if finish_reason in TRUNCATED_FINISH_REASONS:
+        return True
+    if finish_reason == "html_end":
+        return False
+    first_line, _, body = ai_data.partition("\n")
+    return ("html" in first_line.lower() and _HTML_OPEN.search(body) is not None
+            and _HTML_CLOSE.search(body) is None)
+
+def strip_code_fence(text):
+    """Remove a Markdown code fence (```html ... ```) wrapped around model output"""
+    text = _FENCE_START.sub("", text, count=1)
+    return _FENCE_END.sub("", text, count=1)
+
+def stitch_continuation(partial, continuation):
+    """Append a continuation to a truncated output, dropping any text the model
+    repeated from the end of the partial output"""
+    continuation = strip_code_fence(continuation)
+    if continuation.lstrip()[:9].lower().startswith(("<!doctype", "<html")):
+        # The model started over; keep the Content-Type line of the first attempt
+        return partial.split("\n", 1)[0] + "\n" + continuation.lstrip()
+    longest = min(len(partial), len(continuation), MAX_STITCH_OVERLAP)
+    for size in range(longest, MIN_STITCH_OVERLAP - 1, -1):
+        if partial.endswith(continuation[:size]):
+            return partial + continuation[size:]
+    return partial + continuation
+
+def continue_if_truncated(ai_data, usage, system_prompt, user_prompt, max_tokens, config=None):
+    """Ask the provider to carry on from where a truncated output stopped,
+    instead of throwing the tokens away and regenerating from scratch"""
+    is_html = "html" in ai_data.split("\n", 1)[0].lower()
+    for attempt in range(MAX_CONTINUATIONS):
+        if not is_truncated(ai_data, usage):
+            break
+        log.info(f"Output truncated, requesting continuation {attempt + 1}",
+                 extra={"finish_reason": usage.get("finish_reason")})
+        history = [("assistant", ai_data), ("user", CONTINUE_PROMPT)]
+        more, extra = call_provider(system_prompt, user_prompt, max_tokens, history, is_html, config)
+        ai_data = stitch_continuation(ai_data, more)
+        usage = {
+            "prompt_tokens": (usage.get("prompt_tokens") or 0) + (extra.get("prompt_tokens") or 0),
+            "completion_tokens": (usage.get("completion_tokens") or 0) + (extra.get("completion_tokens") or 0),
+            "cached_tokens": (usage.get("cached_tokens") or 0) + (extra.get("cached_tokens") or 0),
+            "estimated": usage.get("estimated") or extra.get("estimated"),
+            "finish_reason": extra.get("finish_reason"),
+            "continuations": attempt + 1,
+        }
+    return ai_data, usage
+
+def collect_until_html_end(pieces, is_html=None):
+    """Join streamed text pieces, stopping at the closing </html> tag of an HTML
+    document. Returns (text, stopped_early); anything after the tag is dropped.
+
+    Whether the output is HTML is read from its Content-Type first line unless
+    ``is_html`` says so up front."""
+    parts = []
+    size = 0
+    tail = ""  # end of the previous pieces, for a tag split across pieces
+    for piece in replay.timed_pieces(pieces):
+        parts.append(piece)
+        # Searched case-insensitively in the original text: lowercasing can
+        # change the length of a string ("İ"), and with it every offset
+        window = tail + piece
+        hit = _HTML_END.search(window) if STOP_AT_HTML_END else None
+        if hit is not None:
+            text = "".join(parts)
+            # Only HTML documents end at </html>; the first line is the content type
+            if is_html or (is_html is None and "html" in text.split("\n", 1)[0].lower()):
+                return text[:size - len(tail) + hit.end()], True
+        size += len(piece)
+        tail = window[-(len(HTML_END) - 1):]
+    return "".join(parts), False
+
+def estimate_usage(usage, system_prompt, user_prompt, history, text):
+    """Fill in token counts the provider never sent because we hung up early"""
+    if not usage.get("prompt_tokens"):
+        prompt_chars = len(system_prompt) + len(user_prompt) + sum(len(turn) for _, turn in history or ())
+        usage["prompt_tokens"] = prompt_chars // CHARS_PER_TOKEN
+        usage["estimated"] = True
+    if not usage.get("completion_tokens"):
+        usage["completion_tokens"] = len(text) // CHARS_PER_TOKEN
+        usage["estimated"] = True
+    usage.setdefault("cached_tokens", 0)
+    return usage
+
+def _chat_usage(response_data):
+    """Normalize the usage block of an OpenAI-style chat completion"""
+    usage = response_data.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    cached_tokens = details.get("cached_tokens")
+    if cached_tokens is None:
+        # llama.cpp server reports prompt cache reuse at the top level
+        cached_tokens = response_data.get("tokens_cached", 0)
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cached_tokens": cached_tokens or 0,
+    }
+
+def _chat_messages(system_message, user_prompt, history):
+    messages = [system_message, {"role": "user", "content": user_prompt}]
+    for role, text in history or ():
+        messages.append({"role": role, "content": text})
+    return messages
+
+def _stream_chat_completion(url, headers, data, system_prompt, user_prompt, history, is_html):
+    """POST a streaming chat completion and read it until the document is complete.
+
+    Returns (raw text, usage). Leaving the request context
+    early closes the connection, which stops the provider generating.
+    """
+    data = {**data, "stream": True, "stream_options": {"include_usage": True}}
+    usage = {}
     
-    # Save to cache if caching is enabled
-    if use_cache:
-        save_to_cache(path, content_type, response_data)
+    with requests.post(url, headers=headers, json=data, timeout=120, stream=True) as response:
+        response.raise_for_status()
         
-    return content_type, response_data
+        def pieces():
+            for line in response.iter_lines():
+                # Server-sent events; ":" lines are keep-alive comments
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    break
+                event = json.loads(payload)
+                if event.get("error"):
+                    raise ValueError(f"Provider error: {event['error']}")
+                if event.get("usage"):
+                    usage.update(_chat_usage(event))
+                for choice in event.get("choices") or []:
+                    if choice.get("finish_reason"):
+                        usage["finish_reason"] = choice["finish_reason"]
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        
+        ai_data, stopped_early = collect_until_html_end(pieces(), is_html)
+    
+    if stopped_early:
+        usage["finish_reason"] = "html_end"
+    return ai_data, estimate_usage(usage, system_prompt, user_prompt, history, ai_data)
 
-def generate_openrouter(prompt):
+def generate_openrouter(system_prompt, user_prompt, max_tokens=MAX_TOKENS, history=None, is_html=None, config=None):
     """Generate content using OpenRouter API."""
-    config = get_ai_config()
+    config = config or get_ai_config()
     
     headers = {
         "Content-Type": "application/json",
@@ -58,26 +342,31 @@ def generate_openrouter(prompt):
         "X-Title": "Infinite AI Web"
     }
     
+    if PROMPT_CACHE:
+        # Breakpoint after the static prefix; used by Anthropic and Gemini
+        # models, others cache matching prefixes automatically
+        system_message = {"role": "system", "content": [
+            {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+        ]}
+    else:
+        system_message = {"role": "system", "content": system_prompt}
+    
     data = {
         "model": config["model"],
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": _chat_messages(system_message, user_prompt, history),
         "temperature": TEMPERATURE,
-        "max_tokens": MAX_TOKENS,
-        "top_p": TOP_P
+        "max_tokens": max_tokens,
+        "top_p": TOP_P,
+        "usage": {"include": True}
     }
     
-    print(f"Sending request to OpenRouter API for model: {config['model']}")
-    response = requests.post(f"{config['base_url']}/chat/completions", 
-                           headers=headers, json=data, timeout=120)
-    response.raise_for_status()
-    response_data = response.json()
-    
-    ai_data = response_data["choices"][0]["message"]["content"]
-    return extract_content_type_and_data(ai_data)
+    log.debug("Sending request to OpenRouter API", extra={"provider": "openrouter", "model": config["model"]})
+    return _stream_chat_completion(f"{config['base_url']}/chat/completions", headers, data,
+                                   system_prompt, user_prompt, history, is_html)
 
-def generate_openai(prompt):
+def generate_openai(system_prompt, user_prompt, max_tokens=MAX_TOKENS, history=None, is_html=None, config=None):
     """Generate content using OpenAI-compatible API."""
-    config = get_ai_config()
+    config = config or get_ai_config()
     
     headers = {
         "Content-Type": "application/json",
@@ -86,43 +375,29 @@ def generate_openai(prompt):
     
     data = {
         "model": config["model"],
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": _chat_messages({"role": "system", "content": system_prompt}, user_prompt, history),
         "temperature": TEMPERATURE,
-        "max_tokens": MAX_TOKENS,
+        "max_tokens": max_tokens,
         "top_p": TOP_P
     }
+    if PROMPT_CACHE and "api.openai.com" not in config["base_url"]:
+        # llama.cpp server: keep the KV cache of the shared prefix between requests
+        # (api.openai.com caches prefixes automatically and rejects unknown fields)
+        data["cache_prompt"] = True
     
-    print(f"Sending request to OpenAI-compatible API at {config['base_url']}")
-    response = requests.post(f"{config['base_url']}/chat/completions", 
-                           headers=headers, json=data, timeout=120)
-    response.raise_for_status()
-    response_data = response.json()
-    
-    ai_data = response_data["choices"][0]["message"]["content"]
-    return extract_content_type_and_data(ai_data)
+    log.debug("Sending request to OpenAI-compatible API", extra={"provider": "openai", "url": config["base_url"]})
+    return _stream_chat_completion(f"{config['base_url']}/chat/completions", headers, data,
+                                   system_prompt, user_prompt, history, is_html)
 
-def generate_gemini(prompt):
-    """Generate content using Google Gemini API."""
-    if not GEMINI_AVAILABLE:
-        raise ImportError("Google Generative AI package not installed. Run: pip install google-generativeai")
-    
-    config = get_ai_config()
-    
-    # Configure Gemini
-    genai.configure(api_key=config['api_key'])
-    model = genai.GenerativeModel(config['model'])
-    
-    print(f"Sending request to Gemini API for model: {config['model']}")
-    response = model.generate_content(
-        prompt,
-        generation_config={
-            "temperature": TEMPERATURE,
-            "top_p": TOP_P,
-            "max_output_tokens": MAX_TOKENS,
-        }
-    )
-    
-    return extract_content_type_and_data(response.text)
+def generate_replay(system_prompt, user_prompt, max_tokens=MAX_TOKENS, history=None, is_html=None, config=None):
+    """Answer from the recorded corpus (see replay.py) instead of a live model."""
+    entry = replay.load(replay.prompt_key(system_prompt, user_prompt, history))
+    log.debug("Replaying recorded response", extra={"provider": "replay", "recorded_by": entry.get("provider")})
+    ai_data, stopped_early = collect_until_html_end(replay.replay_pieces(entry), is_html)
+    usage = dict(entry.get("usage") or {})
+    if stopped_early:
+        usage["finish_reason"] = "html_end"
+    return ai_data, estimate_usage(usage, system_prompt, user_prompt, history, ai_data)
 
 def extract_content_type_and_data(ai_data):
     """Extract content type and data from AI response."""
@@ -136,42 +411,36 @@ def extract_content_type_and_data(ai_data):
     return content_type, response_data
 
 def process_html_response(html_content, path):
-    """Process HTML response to ensure rich styling and content."""
-    # Check if the HTML already has a proper structure
-    if "<html" not in html_content.lower():
-        return f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{format_title(path)}</title>
-    {get_content_template()}
-</head>
-<body>
-    {html_content}
-    <div class="back-to-search">
-        <a href="../..">Back to Search</a>
-    </div>
-</body>
-</html>"""
-    
-    # If it has HTML structure but missing our CSS, add it
-    if "<style" not in html_content.lower():
-        html_content = html_content.replace("</head>", f"{get_content_template()}\n</head>")
-    
-    # Add back to search link if it's not there
-    if "back-to-search" not in html_content.lower() and "</body>" in html_content:
-        back_link = '\n<div class="back-to-search">\n<a href="../..">Back to Search</a>\n</div>\n'
-        html_content = html_content.replace("</body>", f"{back_link}</body>")
-    
-    return html_content
+    """Process HTML response to ensure rich styling and content (see html_rewriter)."""
+    return rewrite_html(html_content, path)
 
-def format_title(path):
-    """Format a URL path into a readable page title."""
-    if path.startswith("web/"):
-        path = path[4:]
-    
-    title = path.replace("-", " ").replace("/", " - ")
-    title = " ".join(word.capitalize() for word in title.split())
-    
-    return title
\ No newline at end of file
+# Provider backends by name. A value is either the generate function or a
+# "module:function" string imported the first time the provider is used, so
+# heavy SDKs (google-generativeai) only load in processes that select them.
+PROVIDERS = {
+    "openrouter": generate_openrouter,
+    "openai": generate_openai,
+    "gemini": "gemini_provider:generate_gemini",
+    "replay": generate_replay,
+}
+_providers_lock = threading.Lock()
+
+def register_provider(name, generate):
+    """Add or replace a backend; ``generate`` may be a "module:function" string"""
+    with _providers_lock:
+        PROVIDERS[name] = generate
+
+def get_provider(name):
+    """Generate function of a provider, importing its backend on first use"""
+    generate = PROVIDERS.get(name)
+    if generate is None:
+        raise ValueError(f"Unsupported AI provider: {name}")
+    if isinstance(generate, str):
+        with _providers_lock:
+            generate = PROVIDERS[name]
+            if isinstance(generate, str):
+                module_name, _, attribute = generate.partition(":")
+                generate = getattr(importlib.import_module(module_name), attribute)
+                PROVIDERS[name] = generate
+                log.info("Loaded provider backend", extra={"provider": name, "backend_module": module_name})
+    return generate
\ No newline at end of file
@@ -0,0 +1,518 @@
+"""Single-file packfile cache backend.
+
+Instead of one file per page under web/, every cached page is appended to a
+single pack file as a self-describing record. A compact side index maps cache
+keys to record offsets, and reads are served straight out of an mmap of the
+pack, so a cache hit costs one stat() instead of several directory probes and
+a file open.
+
+Overwrites and evictions only append (a new record or a tombstone), so the
+pack accumulates dead bytes; once they pass a configurable ratio the live
+records are copied into a fresh pack by a background compaction thread.
+
+Run ``python packfile.py migrate`` to import an existing web/ directory.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Cross-process locking is only available on POSIX; elsewhere run one process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from app_logging import get_logger
+from config import PACKFILE_PATH, PACKFILE_COMPACT_RATIO, PACKFILE_COMPACT_MIN_BYTES
+
+log = get_logger(__name__)
+
+PACK_MAGIC = b"IAWPACK1"
+INDEX_MAGIC = b"IAWIDX01"
+
+# magic, generation (pack and index must carry the same generation)
+_FILE_HEADER = struct.Struct("<8sQ")
+# flags, key length, content type length, meta length, data length, mtime, crc32
+_RECORD = struct.Struct("<BHHIIdI")
+# flags, key length, record offset, record length, mtime
+_INDEX_ENTRY = struct.Struct("<BHQId")
+
+FLAG_LIVE = 0
+FLAG_DELETED = 1
+
+PackEntry = namedtuple("PackEntry", ["content_type", "content", "mtime", "meta"])
+
+
+class Packfile:
+    """Append-only page store backed by ``<path>`` and ``<path>.idx``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.lock_path = path + ".lock"
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self._pack = None
+        self._index_file = None
+        self._mm = None
+        self._index = {}  # key -> (offset, length, mtime)
+        self._live_bytes = 0
+        self._pack_end = _FILE_HEADER.size
+        self._generation = None
+        self._index_ino = None
+        self._index_pos = 0
+        self._compacting = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._exclusive():
+            if not os.path.exists(self.path):
+                self._write_empty(self.path, self.index_path)
+            self._load()
+
+    # -- locking -----------------------------------------------------------
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold both the in-process lock and the cross-process file lock"""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                if self._lock_file is None:
+                    self._lock_file = open(self.lock_path, "a+b")
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    # -- loading -----------------------------------------------------------
+
+    @staticmethod
+    def _write_empty(pack_path, index_path, generation=None):
+        if generation is None:
+            generation = int.from_bytes(os.urandom(8), "little")
+        for file_path, magic in ((pack_path, PACK_MAGIC), (index_path, INDEX_MAGIC)):
+            with open(file_path, "wb") as f:
+                f.write(_FILE_HEADER.pack(magic, generation))
+
+    def _close_files(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        for handle in (self._pack, self._index_file):
+            if handle is not None:
+                handle.close()
+        self._pack = None
+        self._index_file = None
+
+    def _load(self):
+        """(Re)open the pack and rebuild the in-memory index from disk"""
+        with self._exclusive():
+            self._close_files()
+            self._pack = open(self.path, "r+b")
+            magic, generation = _FILE_HEADER.unpack(self._pack.read(_FILE_HEADER.size))
+            if magic != PACK_MAGIC:
+                raise ValueError(f"Not a cache packfile: {self.path}")
+            self._generation = generation
+            self._index = {}
+            self._live_bytes = 0
+            self._pack_end = _FILE_HEADER.size
+            self._index_ino = None
+            self._index_pos = 0
+            self._remap()
+
+            if self._read_index():
+                # Pick up records whose index entry never made it to disk
+                self._scan_pack(self._pack_end)
+            else:
+                # Missing or stale index: the pack is self-describing, rebuild it
+                self._scan_pack(_FILE_HEADER.size)
+                self._rewrite_index()
+            self._index_file = open(self.index_path, "ab")
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+        size = os.fstat(self._pack.fileno()).st_size
+        self._mm = mmap.mmap(self._pack.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _read_index(self):
+        """Apply index entries appended since the last read. Returns False if
+        the index file is missing or belongs to another pack generation."""
+        try:
+            f = open(self.index_path, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            ino = os.fstat(f.fileno()).st_ino
+            if self._index_pos == 0:
+                header = f.read(_FILE_HEADER.size)
+                if len(header) < _FILE_HEADER.size:
+                    return False
+                magic, generation = _FILE_HEADER.unpack(header)
+                if magic != INDEX_MAGIC or generation != self._generation:
+                    return False
+                self._index_ino = ino
+                self._index_pos = _FILE_HEADER.size
+            elif ino != self._index_ino:
+                # Replaced by a compaction in another process
+                self._load()
+                return True
+            f.seek(self._index_pos)
+            buf = f.read()
+
+        pos = 0
+        while pos + _INDEX_ENTRY.size <= len(buf):
+            flags, key_len, offset, length, mtime = _INDEX_ENTRY.unpack_from(buf, pos)
+            end = pos + _INDEX_ENTRY.size + key_len
+            if end > len(buf):
+                break  # half-written entry, picked up on the next refresh
+            key = buf[pos + _INDEX_ENTRY.size:end].decode("utf-8")
+            self._apply(flags, key, offset, length, mtime)
+            pos = end
+        self._index_pos += pos
+        return True
+
+    def _scan_pack(self, start):
+        """Apply every intact record in the pack from ``start`` onwards"""
+        mm = self._mm
+        pos = start
+        while pos + _RECORD.size <= len(mm):
+            flags, key_len, ctype_len, meta_len, data_len, mtime, crc = _RECORD.unpack_from(mm, pos)
+            body_start = pos + _RECORD.size
+            end = body_start + key_len + ctype_len + meta_len + data_len
+            if end > len(mm) or zlib.crc32(mm[body_start:end]) != crc:
+                break  # torn write at the tail
+            key = mm[body_start:body_start + key_len].decode("utf-8")
+            self._apply(flags, key, pos, end - pos, mtime)
+            pos = end
+
+    def _rewrite_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_FILE_HEADER.pack(INDEX_MAGIC, self._generation))
+            for key, (offset, length, mtime) in self._index.items():
+                key_bytes = key.encode("utf-8")
+                f.write(_INDEX_ENTRY.pack(FLAG_LIVE, len(key_bytes), offset, length, mtime))
+                f.write(key_bytes)
+            self._index_pos = f.tell()
+        os.replace(tmp_path, self.index_path)
+        self._index_ino = os.stat(self.index_path).st_ino
+
+    def _apply(self, flags, key, offset, length, mtime):
+        previous = self._index.pop(key, None)
+        if previous is not None:
+            self._live_bytes -= previous[1]
+        if flags == FLAG_LIVE:
+            self._index[key] = (offset, length, mtime)
+            self._live_bytes += length
+        self._pack_end = max(self._pack_end, offset + length)
+
+    def _refresh(self):
+        """Catch up with writes and compactions made by other processes"""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            self._load()
+            return
+        if st.st_ino != self._index_ino:
+            self._load()
+        elif st.st_size > self._index_pos:
+            self._read_index()
+
+    # -- public API --------------------------------------------------------
+
+    def get(self, key):
+        """Return a PackEntry for ``key`` or None"""
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            offset, length, mtime = entry
+            if offset + length > len(self._mm):
+                self._remap()
+            mm = self._mm
+            _, key_len, ctype_len, meta_len, data_len, _, _ = _RECORD.unpack_from(mm, offset)
+            pos = offset + _RECORD.size + key_len
+            content_type = mm[pos:pos + ctype_len].decode("utf-8")
+            pos += ctype_len
+            meta = json.loads(mm[pos:pos + meta_len]) if meta_len else {}
+            pos += meta_len
+            # Decode straight out of the mapping, no intermediate bytes copy
+            with memoryview(mm) as view:
+                content = str(view[pos:pos + data_len], "utf-8")
+            return PackEntry(content_type, content, mtime, meta)
+
+    def put(self, key, content_type, content, meta=None, mtime=None):
+        """Append a new version of ``key``"""
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+        self._append(FLAG_LIVE, key, content_type.encode("utf-8"), meta_bytes, data,
+                     time.time() if mtime is None else mtime)
+
+    def delete(self, key):
+        """Evict ``key`` by appending a tombstone. Returns False if absent."""
+        with self._exclusive():
+            self._refresh()
+            if key not in self._index:
+                return False
+            self._append(FLAG_DELETED, key, b"", b"", b"", time.time())
+        return True
+
+    def _append(self, flags, key, ctype_bytes, meta_bytes, data, mtime):
+        key_bytes = key.encode("utf-8")
+        parts = (key_bytes, ctype_bytes, meta_bytes, data)
+        crc = 0
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+        header = _RECORD.pack(flags, len(key_bytes), len(ctype_bytes), len(meta_bytes),
+                              len(data), mtime, crc)
+
+        with self._exclusive():
+            self._refresh()
+            self._pack.seek(0, os.SEEK_END)
+            offset = self._pack.tell()
+            self._pack.write(header)
+            for part in parts:
+                self._pack.write(part)
+            self._pack.flush()
+            length = self._pack.tell() - offset
+
+            self._index_file.write(_INDEX_ENTRY.pack(flags, len(key_bytes), offset, length, mtime))
+            self._index_file.write(key_bytes)
+            self._index_file.flush()
+            self._index_pos += _INDEX_ENTRY.size + len(key_bytes)
+            self._apply(flags, key, offset, length, mtime)
+        self._maybe_compact()
+
+    def keys(self):
+        with self._lock:
+            self._refresh()
+            return list(self._index)
+
+    def mtime(self, key):
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(key)
+            return entry[2] if entry else None
+
+    def size(self, key):
+        """Bytes the record for ``key`` takes up in the pack, or None"""
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(key)
+            return entry[1] if entry else None
+
+    def __contains__(self, key):
+        with self._lock:
+            self._refresh()
+            return key in self._index
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            data_bytes = self._pack_end - _FILE_HEADER.size
+            return {
+                "entries": len(self._index),
+                "live_bytes": self._live_bytes,
+                "dead_bytes": data_bytes - self._live_bytes,
+                "pack_size_bytes": self._pack_end,
+                "pack_path": self.path,
+            }
+
+    # -- compaction --------------------------------------------------------
+
+    def _needs_compaction(self):
+        dead = self._pack_end - _FILE_HEADER.size - self._live_bytes
+        total = self._pack_end - _FILE_HEADER.size
+        return dead >= PACKFILE_COMPACT_MIN_BYTES and dead >= total * PACKFILE_COMPACT_RATIO
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compacting or not self._needs_compaction():
+                return
+            self._compacting = True
+        threading.Thread(target=self._background_compact, name="packfile-compact", daemon=True).start()
+
+    def _background_compact(self):
+        try:
+            self.compact(force=False)
+        except Exception as e:
+            log.error(f"Error compacting packfile: {e}")
+        finally:
+            self._compacting = False
+
+    def compact(self, force=True):
+        """Copy live records into a fresh pack and swap it in atomically"""
+        with self._exclusive():
+            self._refresh()
+            if not force and not self._needs_compaction():
+                return False
+            before = self._pack_end
+            self._remap()
+            self._rewrite(sorted(self._index.items(), key=lambda item: item[1][0]))
+        log.info("Compacted packfile", extra={"file": self.path, "bytes_before": before, "bytes": self._pack_end})
+        return True
+
+    def clear(self):
+        """Drop every entry"""
+        with self._exclusive():
+            self._rewrite([])
+
+    def _rewrite(self, entries):
+        generation = int.from_bytes(os.urandom(8), "little")
+        tmp_pack = self.path + ".compact"
+        tmp_index = self.index_path + ".compact"
+        with open(tmp_pack, "wb") as pack, open(tmp_index, "wb") as index:
+            pack.write(_FILE_HEADER.pack(PACK_MAGIC, generation))
+            index.write(_FILE_HEADER.pack(INDEX_MAGIC, generation))
+            for key, (offset, length, mtime) in entries:
+                new_offset = pack.tell()
+                pack.write(self._mm[offset:offset + length])
+                key_bytes = key.encode("utf-8")
+                index.write(_INDEX_ENTRY.pack(FLAG_LIVE, len(key_bytes), new_offset, length, mtime))
+                index.write(key_bytes)
+            for handle in (pack, index):
+                handle.flush()
+                os.fsync(handle.fileno())
+        # Pack first: a reader that sees the new index always finds the new pack
+        os.replace(tmp_pack, self.path)
+        os.replace(tmp_index, self.index_path)
+        self._load()
+
+    def _after_fork(self):
+        """Give a forked worker its own file handles. flock() locks belong to
+        the open file, so a lock file shared with the parent would not
+        exclude it; the inherited in-memory index is kept."""
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._compacting = False
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self._close_files()
+        self._pack = open(self.path, "r+b")
+        self._remap()
+        self._index_file = open(self.index_path, "ab")
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+
+_packfile = None
+_packfile_lock = threading.Lock()
+
+
+def get_packfile():
+    """Return the process-wide packfile instance"""
+    global _packfile
+    if _packfile is None:
+        with _packfile_lock:
+            if _packfile is None:
+                _packfile = Packfile(PACKFILE_PATH)
+    return _packfile
+
+
+def _reopen_after_fork():
+    # gunicorn --preload loads the index in the master before forking workers
+    if _packfile is not None:
+        _packfile._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def migrate_directory(web_dir, pack, remove=False, meta_dir=None):
+    """Import every page of a web/ directory tree into ``pack``, with the
+    metadata sidecars kept in ``meta_dir`` (CACHE_META_DIR by default)"""
+    from config import CACHE_META_DIR
+    from utils import cache_key_for_file, read_metadata_sidecar
+
+    meta_dir = meta_dir or CACHE_META_DIR
+    migrated = skipped = 0
+    for root, dirs, files in os.walk(web_dir):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue  # a write in progress, or left over by a crash
+            file_path = os.path.join(root, name)
+            relative = os.path.relpath(file_path, web_dir).replace(os.sep, "/")
+            key, content_type = cache_key_for_file(relative)
+            if key is None:
+                print(f"Skipping stray file: {relative}")
+                skipped += 1
+                continue
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    content = f.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Skipping unreadable file {relative}: {e}")
+                skipped += 1
+                continue
+            meta = read_metadata_sidecar(key, meta_dir)
+            pack.put(key, content_type, content, meta=meta, mtime=os.path.getmtime(file_path))
+            migrated += 1
+            if remove:
+                os.remove(file_path)
+                if meta:
+                    os.remove(os.path.join(meta_dir, f"{key}.json"))
+
+    if remove:
+        # Prune the directories emptied by the migration
+        for directory in (web_dir, meta_dir):
+            for root, dirs, files in os.walk(directory, topdown=False):
+                if root != directory and not os.listdir(root):
+                    os.rmdir(root)
+
+    print(f"Migrated {migrated} pages into {pack.path} ({skipped} skipped)")
+    return migrated
+
+
+def main(argv=None):
+    from config import WEB_DIR, CACHE_META_DIR
+
+    parser = argparse.ArgumentParser(description="Manage the packfile cache backend")
+    parser.add_argument("--pack", default=PACKFILE_PATH, help="packfile path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="import a web/ directory into the packfile")
+    migrate.add_argument("--source", default=WEB_DIR, help="directory to import")
+    migrate.add_argument("--meta-source", default=CACHE_META_DIR, help="metadata sidecar directory to import")
+    migrate.add_argument("--remove", action="store_true", help="delete files once imported")
+    commands.add_parser("compact", help="reclaim space from overwritten and evicted pages")
+    commands.add_parser("stats", help="show packfile statistics")
+    args = parser.parse_args(argv)
+
+    pack = Packfile(args.pack)
+    if args.command == "migrate":
+        migrate_directory(args.source, pack, remove=args.remove, meta_dir=args.meta_source)
+    elif args.command == "compact":
+        pack.compact()
+    print(json.dumps(pack.stats(), indent=2))
+    pack.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
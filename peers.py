@@ -0,0 +1,145 @@
+"""Consistent-hash peer tier for the page cache.
+
+Every node lists the same CACHE_PEERS. A path is owned by the node its cache
+key hashes to on the ring; on a local miss the other nodes fetch the page from
+the owner over HTTP, and only the owner ever generates it.
+"""
+import bisect
+import hashlib
+import json
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app_logging import get_logger
+from config import (
+    CACHE_PEERS, CACHE_SELF_URL, PEER_TIMEOUT, PEER_POOL_SIZE,
+    PEER_VIRTUAL_NODES, PEER_RETRY_AFTER
+)
+
+# Set on peer-to-peer requests so the owner never forwards them again
+PEER_HEADER = "X-Infinite-Peer"
+# Page metadata (tier, usage, ...) sent by the owner along with the page
+PEER_META_HEADER = "X-Infinite-Meta"
+# Set by the owner on error pages about one path (a failed generation, a spent
+# token budget), so peers pass them on instead of marking the owner down
+PEER_FAILURE_HEADER = "X-Infinite-Failure"
+
+log = get_logger(__name__)
+
+
+class PeerFailure(Exception):
+    """The owner answered with an error page for this path"""
+
+    def __init__(self, reason, status, content, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.content = content
+        self.retry_after = retry_after
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, virtual_nodes=PEER_VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in set(nodes)
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+_ring = None
+_session = None
+_setup_lock = threading.Lock()
+_down_until = {}  # peer URL -> time before which it is not retried
+
+
+def peers_enabled():
+    return len(CACHE_PEERS) > 1 and CACHE_SELF_URL in CACHE_PEERS
+
+
+def _setup():
+    global _ring, _session
+    with _setup_lock:
+        if _ring is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(CACHE_PEERS), pool_maxsize=PEER_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+            _ring = HashRing(CACHE_PEERS)
+    return _ring, _session
+
+
+def peer_owner(key):
+    """Base URL of the node owning ``key``, or None if it is this node"""
+    if not peers_enabled():
+        return None
+    ring, _ = _setup()
+    owner = ring.owner(key)
+    return None if owner == CACHE_SELF_URL else owner
+
+
+def fetch_from_peer(key, path, query_string=b""):
+    """Fetch ``path`` from the owner of ``key``.
+
+    Returns (content_type, content, metadata), or (None, None, None) when
+    this node owns the key or the owner is unreachable, in which case the
+    caller generates the page locally. Raises PeerFailure when the owner
+    reports that the page itself failed, so it is not generated again here.
+    """
+    owner = peer_owner(key)
+    if owner is None or _down_until.get(owner, 0) > time.monotonic():
+        return None, None, None
+
+    _, session = _setup()
+    url = f"{owner}/{quote(path)}"
+    if query_string:
+        url = f"{url}?{query_string.decode('latin-1')}"
+    try:
+        log.debug("Fetching from owner peer", extra={"path": path, "peer": owner})
+        response = session.get(url, headers={PEER_HEADER: CACHE_SELF_URL},
+                               timeout=PEER_TIMEOUT)
+    except requests.RequestException as e:
+        log.warning(f"Peer unreachable, generating locally: {e}", extra={"path": path, "peer": owner})
+        _down_until[owner] = time.monotonic() + PEER_RETRY_AFTER
+        return None, None, None
+
+    reason = response.headers.get(PEER_FAILURE_HEADER)
+    if reason:
+        raise PeerFailure(reason, response.status_code,
+                          response.content.decode("utf-8", errors="replace"),
+                          response.headers.get("Retry-After"))
+    if response.status_code != 200:
+        log.warning("Peer request failed", extra={"path": path, "peer": owner, "status": response.status_code})
+        # Only errors about the owner itself, not about one of its pages
+        if response.status_code in (502, 503, 504):
+            _down_until[owner] = time.monotonic() + PEER_RETRY_AFTER
+        return None, None, None
+
+    content_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip()
+    try:
+        meta = json.loads(response.headers.get(PEER_META_HEADER) or "{}")
+    except ValueError:
+        meta = {}
+    # Pages are always UTF-8; response.text would fall back to ISO-8859-1
+    # for a text/html response without a charset
+    content = response.content.decode("utf-8", errors="replace")
+    return content_type, content, meta if isinstance(meta, dict) else {}
@@ -0,0 +1,40 @@
+"""In-process request popularity, used to size token budgets for popular pages.
+
+Counts are kept per canonical path (variant suffixes stripped) and halved
+whenever more than POPULARITY_MAX_PATHS paths are tracked, so memory stays
+bounded and old traffic fades out.
+"""
+import threading
+from collections import Counter
+
+from config import POPULARITY_MAX_PATHS
+from utils import base_path_for_key, normalize_cache_path
+
+_hits = Counter()
+_lock = threading.Lock()
+
+
+def record_hit(path):
+    """Count a request for ``path`` and return its hit count"""
+    key = base_path_for_key(normalize_cache_path(path))
+    with _lock:
+        _hits[key] += 1
+        count = _hits[key]
+        if len(_hits) > POPULARITY_MAX_PATHS:
+            for name, hits in list(_hits.items()):
+                if hits > 1:
+                    _hits[name] = hits // 2
+                else:
+                    del _hits[name]
+    return count
+
+
+def hit_count(path):
+    key = base_path_for_key(normalize_cache_path(path))
+    with _lock:
+        return _hits.get(key, 0)
+
+
+def top_paths(limit=20):
+    with _lock:
+        return _hits.most_common(limit)
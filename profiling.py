@@ -0,0 +1,178 @@
+"""Opt-in per-request profiling.
+
+A request is profiled when it carries the admin token (``X-Profile`` header
+or ``?profile=`` query flag matching PROFILE_TOKEN), or for one request in
+every PROFILE_SAMPLE_EVERY. The cProfile stats of the request thread and the
+tracemalloc peak are written to PROFILE_DIR, which keeps the newest
+PROFILE_MAX_FILES profiles; /api/profiles lists and downloads them for
+requests carrying the token (without PROFILE_TOKEN the endpoints answer 403).
+
+When neither trigger is configured no hooks are installed, so profiling
+costs nothing.
+"""
+import cProfile
+import hmac
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+from flask import g, request
+
+from app_logging import get_logger
+from config import PROFILE_TOKEN, PROFILE_SAMPLE_EVERY, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_TRACEMALLOC
+
+PROFILE_HEADER = "X-Profile"
+TOP_FUNCTIONS = 30
+
+log = get_logger(__name__)
+
+# Only one cProfile profiler may be active per process
+_active = threading.Lock()
+_requests = itertools.count(1)
+_names = itertools.count(1)
+
+
+def profiling_enabled():
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_EVERY > 0
+
+
+def token_ok(value):
+    # Compared as bytes: compare_digest rejects non-ASCII str
+    return (bool(PROFILE_TOKEN) and value is not None
+            and hmac.compare_digest(value.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")))
+
+
+def _request_token():
+    return request.headers.get(PROFILE_HEADER) or request.args.get("profile")
+
+
+def admin_allowed():
+    """Whether the current request may read profiles: only with the token, so
+    without PROFILE_TOKEN the profile endpoints are closed"""
+    return token_ok(_request_token())
+
+
+def _requested():
+    if request.path.startswith("/api/profiles"):
+        return None  # reading profiles must not evict them
+    if token_ok(_request_token()):
+        return "token"
+    if PROFILE_SAMPLE_EVERY > 0 and next(_requests) % PROFILE_SAMPLE_EVERY == 0:
+        return "sample"
+    return None
+
+
+def install(app):
+    """Register the profiling hooks on ``app`` when profiling is configured"""
+    if not profiling_enabled():
+        return
+
+    @app.before_request
+    def start_profile():
+        reason = _requested()
+        if reason is None or not _active.acquire(blocking=False):
+            return
+        started_tracing = False
+        if PROFILE_TRACEMALLOC:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        g.profile = (profiler, reason, started_tracing, time.perf_counter())
+        profiler.enable()
+
+    @app.teardown_request
+    def finish_profile(error=None):
+        state = g.pop("profile", None)
+        if state is None:
+            return
+        profiler, reason, started_tracing, started = state
+        profiler.disable()
+        wall = time.perf_counter() - started
+        peak = None
+        if PROFILE_TRACEMALLOC:
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+        _active.release()
+        try:
+            _save(profiler, reason, wall, peak, error)
+        except OSError as e:
+            log.error(f"Error saving profile: {e}")
+
+
+def _slug(path):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", path.strip("/"))[:80] or "index"
+
+
+def _save(profiler, reason, wall, peak, error):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_names)}-{_slug(request.path)}"
+
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    stats.dump_stats(os.path.join(PROFILE_DIR, name + ".prof"))
+
+    summary = {
+        "name": name,
+        "path": request.path,
+        "method": request.method,
+        "reason": reason,
+        "created": round(time.time(), 3),
+        "wall_ms": round(wall * 1000, 2),
+        # tracemalloc is process-wide, so concurrent requests add to the peak
+        "tracemalloc_peak_bytes": peak,
+        "error": str(error) if error else None,
+        "top_cumulative": report.getvalue(),
+    }
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    log.info("Saved request profile", extra={"path": request.path, "profile": name,
+                                            "latency_ms": summary["wall_ms"]})
+    _prune()
+
+
+def _prune():
+    """Keep only the newest PROFILE_MAX_FILES profiles"""
+    summaries = sorted(entry for entry in os.listdir(PROFILE_DIR) if entry.endswith(".json"))
+    excess = len(summaries) - max(PROFILE_MAX_FILES, 1)
+    for stale in summaries[:max(excess, 0)]:
+        for extension in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stale[:-5] + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first, without the stats text"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, entry), encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        summary.pop("top_cumulative", None)
+        profiles.append(summary)
+    return profiles
+
+
+def profile_file(name):
+    """Absolute path of a stored .prof/.json file, or None for unknown names"""
+    if os.path.basename(name) != name or not name.endswith((".prof", ".json")):
+        return None
+    file_path = os.path.join(PROFILE_DIR, name)
+    return file_path if os.path.isfile(file_path) else None
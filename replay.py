@@ -0,0 +1,151 @@
+"""Record/replay of provider responses for offline load tests and regression checks.
+
+With REPLAY_RECORD=1 every provider call is stored in REPLAY_CORPUS, keyed by a
+hash of the prompt (system prompt, user prompt and continuation turns), with
+its usage block and the arrival time of every streamed chunk. With
+AI_PROVIDER=replay the corpus answers instead of a live model, so the same
+traffic produces the same pages on a machine without network access.
+REPLAY_SPEED=1 reproduces the recorded latency and chunk timing (2 = twice
+as fast, 0 = no delays).
+
+    REPLAY_RECORD=1 AI_PROVIDER=openrouter python infinite_web.py   # record
+    AI_PROVIDER=replay REPLAY_SPEED=1 python benchmark.py run ...     # replay
+    python replay.py stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+from config import REPLAY_CORPUS, REPLAY_SPEED
+
+CORPUS_FORMAT = 1
+
+_local = threading.local()
+
+
+class ReplayMiss(LookupError):
+    """No recording exists for a prompt"""
+
+
+def prompt_key(system_prompt, user_prompt, history=None):
+    payload = json.dumps([system_prompt, user_prompt, [list(turn) for turn in history or ()]],
+                         ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(REPLAY_CORPUS, key[:2], key + ".json")
+
+
+class Recording:
+    """Chunks of one provider call, timed from the start of the call"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.chunks = []
+
+    def add(self, piece):
+        self.chunks.append([round(time.perf_counter() - self.started, 4), piece])
+
+
+def start_recording():
+    _local.recording = Recording()
+    return _local.recording
+
+
+def stop_recording():
+    return _local.__dict__.pop("recording", None)
+
+
+def timed_pieces(pieces):
+    """Pass streamed pieces through, noting their timing while a recording is active"""
+    recording = getattr(_local, "recording", None)
+    if recording is None:
+        return pieces
+    return _record_pieces(pieces, recording)
+
+
+def _record_pieces(pieces, recording):
+    for piece in pieces:
+        recording.add(piece)
+        yield piece
+
+
+def save(key, config, recording, text, usage):
+    """Store one provider answer in the corpus (the newest recording wins)"""
+    entry = {
+        "format": CORPUS_FORMAT,
+        "key": key,
+        "provider": config.get("provider"),
+        "model": config.get("model"),
+        "recorded_at": round(time.time(), 3),
+        "duration": round(time.perf_counter() - recording.started, 4),
+        "text": text,
+        "usage": usage,
+        "chunks": recording.chunks,
+    }
+    file_path = _entry_path(key)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, file_path)
+
+
+def load(key):
+    try:
+        with open(_entry_path(key), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ReplayMiss(f"No recorded response for prompt {key[:16]} in {REPLAY_CORPUS}") from None
+
+
+def replay_pieces(entry, speed=REPLAY_SPEED):
+    """Yield the recorded chunks, sleeping to their recorded offsets when speed > 0"""
+    chunks = entry.get("chunks") or [[entry.get("duration", 0), entry["text"]]]
+    started = time.perf_counter()
+    for offset, piece in chunks:
+        if speed > 0:
+            delay = offset / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        yield piece
+
+
+def corpus_stats():
+    entries = 0
+    total_bytes = 0
+    providers = {}
+    if os.path.isdir(REPLAY_CORPUS):
+        for directory, _, files in os.walk(REPLAY_CORPUS):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                file_path = os.path.join(directory, name)
+                entries += 1
+                total_bytes += os.path.getsize(file_path)
+                try:
+                    with open(file_path, encoding="utf-8") as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                label = f"{entry.get('provider')}:{entry.get('model')}"
+                providers[label] = providers.get(label, 0) + 1
+    return {"corpus": REPLAY_CORPUS, "entries": entries, "bytes": total_bytes, "recorded_by": providers}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recorded provider responses")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="summarize the corpus")
+    parser.parse_args(argv)
+    print(json.dumps(corpus_stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Cheap checks that run before a request can reach the AI provider.
+
+- Junk paths (favicon.ico, robots.txt, wp-login.php, .env, ...) are answered
+  with small static responses instead of a full generation.
+- Paths whose generation just failed are remembered for NEGATIVE_CACHE_TTL
+  seconds, so a failing provider is not hit again on every retry.
+"""
+import threading
+import time
+from collections import Counter
+
+from config import JUNK_EXTENSIONS, JUNK_PREFIXES, JUNK_DOTFILES, NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_MAX_ENTRIES
+
+_JUNK_EXTENSIONS = frozenset(JUNK_EXTENSIONS)
+_JUNK_PREFIXES = tuple(JUNK_PREFIXES)
+_JUNK_DOTFILES = frozenset(JUNK_DOTFILES)
+_JUNK_DOTFILE_STEMS = tuple(f"{name}." for name in JUNK_DOTFILES)  # .env.local, .git.bak
+
+ROBOTS_TXT = "User-agent: *\nDisallow: /api/\n"
+_STATIC_HEADERS = {'Cache-Control': 'public, max-age=86400'}
+
+_lock = threading.Lock()
+_counters = Counter()
+_negative = {}  # cache key -> (expires_at, error message)
+
+
+def match_junk(path):
+    """Return the name of the rule matching a junk path, or None"""
+    path = path.strip('/').lower()
+    # Prefixes are whole leading segments: wp-admin/x, not wp-admin-history
+    if path.startswith(_JUNK_PREFIXES):
+        for prefix in _JUNK_PREFIXES:
+            if path.startswith(prefix) and path[len(prefix):len(prefix) + 1] in ('', '/'):
+                return 'prefix'
+    if path.startswith('.') or '/.' in path:
+        for segment in path.split('/'):
+            if segment in _JUNK_DOTFILES or segment.startswith(_JUNK_DOTFILE_STEMS):
+                return 'dotfile'
+    name = path.rpartition('/')[2]
+    dot = name.rfind('.')
+    if dot > 0 and name[dot:] in _JUNK_EXTENSIONS:
+        return 'extension'
+    return None
+
+
+def junk_response(path):
+    """Static (body, status, headers) for a junk path, or None if the path is not junk"""
+    rule = match_junk(path)
+    if rule is None:
+        return None
+    with _lock:
+        _counters['junk_hits'] += 1
+        _counters[f'junk_{rule}'] += 1
+
+    name = path.lstrip('/').lower()
+    if name == 'favicon.ico':
+        return '', 204, _STATIC_HEADERS
+    if name == 'robots.txt':
+        return ROBOTS_TXT, 200, {**_STATIC_HEADERS, 'Content-Type': 'text/plain'}
+    return 'Not Found', 404, {**_STATIC_HEADERS, 'Content-Type': 'text/plain'}
+
+
+def remember_failure(key, error):
+    """Negative-cache a failed generation for ``key``"""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return
+    now = time.monotonic()
+    with _lock:
+        if len(_negative) >= NEGATIVE_CACHE_MAX_ENTRIES:
+            for stale in [k for k, (expires, _) in _negative.items() if expires <= now]:
+                del _negative[stale]
+            while len(_negative) >= NEGATIVE_CACHE_MAX_ENTRIES:
+                del _negative[next(iter(_negative))]  # oldest entry
+        _negative.pop(key, None)
+        _negative[key] = (now + NEGATIVE_CACHE_TTL, str(error))
+        _counters['negative_stored'] += 1
+
+
+def recent_failure(key):
+    """Error message of a generation for ``key`` that failed within the TTL, or None"""
+    if not _negative:
+        return None
+    with _lock:
+        entry = _negative.get(key)
+        if entry is None:
+            return None
+        expires, message = entry
+        if expires <= time.monotonic():
+            del _negative[key]
+            return None
+        _counters['negative_hits'] += 1
+        return message
+
+
+def forget_failure(key):
+    with _lock:
+        _negative.pop(key, None)
+
+
+def get_filter_stats():
+    with _lock:
+        stats = dict(_counters)
+        stats['negative_entries'] = len(_negative)
+    for name in ('junk_hits', 'negative_hits', 'negative_stored'):
+        stats.setdefault(name, 0)
+    return stats
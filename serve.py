@@ -0,0 +1,182 @@
+"""Production server: gunicorn around ``create_app()``.
+
+Page generations spend tens of seconds waiting on the provider, so the
+defaults run one process per CPU with many threads each (gthread), or
+gevent greenlets with SERVE_WORKER_CLASS=gevent. Configuration, templates,
+the rewrite rules, the selected provider backends, the packfile index and
+the link state filter are loaded once in the master before forking (SERVE_PRELOAD), so workers
+start warm and share those pages copy-on-write; workers are recycled after
+SERVE_MAX_REQUESTS requests.
+
+    python serve.py                     # start (settings from config.py / .env)
+    python serve.py --print-config      # show the resolved gunicorn settings
+    python serve.py reload              # graceful restart of the workers (HUP)
+    python serve.py stop                # graceful shutdown (TERM)
+
+With preloading, a reload restarts the workers from the already loaded code;
+deploy code changes with a restart (or SERVE_PRELOAD=0).
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import signal
+import sys
+
+from config import (
+    ROOT_DIR, WEB_DIR, CACHE_BACKEND, LINK_STATE, AI_PROVIDER, DRAFT_PROVIDER, SERVE_BIND, SERVE_WORKER_CLASS,
+    SERVE_WORKERS, SERVE_THREADS, SERVE_WORKER_CONNECTIONS, SERVE_TIMEOUT, SERVE_GRACEFUL_TIMEOUT, SERVE_KEEPALIVE,
+    SERVE_MAX_REQUESTS, SERVE_MAX_REQUESTS_JITTER, SERVE_PRELOAD, SERVE_PIDFILE, METRICS_DIR
+)
+from app_logging import setup_logging, shutdown_logging, get_logger
+import metrics
+
+log = get_logger(__name__)
+
+WORKER_CLASSES = ("gthread", "gevent")
+
+
+def settings(bind=SERVE_BIND, worker_class=SERVE_WORKER_CLASS, workers=SERVE_WORKERS,
+             threads=SERVE_THREADS, preload=SERVE_PRELOAD):
+    """gunicorn settings for generation traffic: few processes, many concurrent requests each"""
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"Unsupported worker class {worker_class!r}, expected one of {WORKER_CLASSES}")
+    if worker_class == "gevent":
+        # gevent patches the standard library in each worker; modules preloaded
+        # in the master would keep unpatched locks and sockets
+        preload = False
+    result = {
+        "bind": bind,
+        "worker_class": worker_class,
+        "workers": workers or os.cpu_count() or 1,
+        "timeout": SERVE_TIMEOUT,
+        "graceful_timeout": SERVE_GRACEFUL_TIMEOUT,
+        "keepalive": SERVE_KEEPALIVE,
+        "max_requests": SERVE_MAX_REQUESTS,
+        "max_requests_jitter": SERVE_MAX_REQUESTS_JITTER if SERVE_MAX_REQUESTS else 0,
+        "preload_app": preload,
+        "pidfile": SERVE_PIDFILE or None,
+        "accesslog": None,  # views log one line per request
+        "errorlog": "-",
+    }
+    if worker_class == "gthread":
+        result["threads"] = threads
+    else:
+        result["worker_connections"] = SERVE_WORKER_CONNECTIONS
+    return result
+
+
+def preload():
+    """Load everything workers can share, then build the app"""
+    from html_rewriter import compile_rules
+    from infinite_web import create_app, prepare_site
+    from models import get_provider
+
+    setup_logging()
+    prepare_site()
+    compile_rules()
+    for provider in {AI_PROVIDER, DRAFT_PROVIDER} - {""}:
+        get_provider(provider)  # import the backends in use (and only those) before forking
+    if CACHE_BACKEND == "packfile":
+        from packfile import get_packfile
+        pack = get_packfile()
+        log.info("Loaded packfile index", extra={"entries": len(pack)})
+    if LINK_STATE:
+        import link_state
+        link_state.build()
+    return create_app()
+
+
+# gunicorn server hooks
+
+def when_ready(server):
+    cfg = server.cfg
+    if cfg.workers > 1:
+        # Any worker may answer a scrape; make it report all of them
+        metrics.share(METRICS_DIR)
+    log.info("Serving", extra={"bind": cfg.bind, "workers": cfg.workers, "worker_class": cfg.worker_class_str,
+                               "threads": cfg.threads, "preload": cfg.preload_app, "web_dir": WEB_DIR})
+
+
+def post_fork(server, worker):
+    metrics.start_sharing()
+    log.info("Worker started", extra={"worker_pid": worker.pid})
+
+
+def worker_exit(server, worker):
+    metrics.flush()
+    shutdown_logging()
+
+
+def child_exit(server, worker):
+    metrics.retire_process(worker.pid)
+
+
+def _application(options):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for name, value in options.items():
+                self.cfg.set(name, value)
+            for hook in (when_ready, post_fork, worker_exit, child_exit):
+                self.cfg.set(hook.__name__, hook)
+
+        def load(self):
+            app = preload()
+            if options["preload_app"]:
+                # Keep the garbage collector from touching (and so copying) the
+                # preloaded objects in every worker
+                gc.collect()
+                gc.freeze()
+            return app
+
+    return Server()
+
+
+def _signal_master(sig):
+    try:
+        with open(SERVE_PIDFILE) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError) as e:
+        print(f"No running server found via {SERVE_PIDFILE}: {e}", file=sys.stderr)
+        return 1
+    os.kill(pid, sig)
+    print(f"Sent {signal.Signals(sig).name} to {pid}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the production server (gunicorn)")
+    parser.add_argument("command", nargs="?", choices=("start", "reload", "stop"), default="start")
+    parser.add_argument("--bind", default=SERVE_BIND)
+    parser.add_argument("--worker-class", choices=WORKER_CLASSES, default=SERVE_WORKER_CLASS)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="0 = one per CPU")
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS, help="threads per gthread worker")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", default=SERVE_PRELOAD,
+                        help="import the app in each worker instead of the master")
+    parser.add_argument("--print-config", action="store_true", help="print the settings and exit")
+    args = parser.parse_args(argv)
+
+    if args.command == "reload":
+        return _signal_master(signal.SIGHUP)
+    if args.command == "stop":
+        return _signal_master(signal.SIGTERM)
+
+    options = settings(args.bind, args.worker_class, args.workers, args.threads, args.preload)
+    if args.print_config:
+        print(json.dumps(options, indent=2))
+        return 0
+    for module in ("gunicorn", "gevent" if args.worker_class == "gevent" else None):
+        if module and importlib.util.find_spec(module) is None:
+            print(f"{module} is not installed: pip install {module}", file=sys.stderr)
+            return 1
+    setup_logging()
+    os.chdir(ROOT_DIR)
+    _application(options).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
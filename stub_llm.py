@@ -0,0 +1,203 @@
+"""Local OpenAI-compatible stub server for offline benchmarks.
+
+Answers POST /v1/chat/completions with a generated HTML page after a
+configurable latency, at a configurable token rate, streamed (SSE) or not,
+and injects errors on request. Point the app at it with:
+
+    python stub_llm.py --port 9900 --latency 0.8 --tokens-per-second 200
+    AI_PROVIDER=openai OPENAI_BASE_URL=http://127.0.0.1:9900/v1 python infinite_web.py
+
+benchmark.py starts one in-process with ``start_stub``.
+"""
+import argparse
+import html
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+
+
+class StubOptions:
+    """Behaviour of the stub; every field can be set from the command line"""
+
+    def __init__(self, latency=0.5, latency_dist="lognormal", latency_sigma=0.5,
+                 tokens_per_second=0.0, completion_tokens=1500, chunk_tokens=8,
+                 error_rate=0.0, error_status=503, hang_rate=0.0, seed=None):
+        self.latency = latency  # median time to first token, seconds
+        self.latency_dist = latency_dist  # fixed, uniform, exponential or lognormal
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second  # 0 = whole answer at once
+        self.completion_tokens = completion_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate  # requests that never answer (client timeouts)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "streamed": 0, "errors": 0, "hangs": 0}
+
+    def sample_latency(self):
+        with self.lock:
+            if self.latency_dist == "fixed":
+                return self.latency
+            if self.latency_dist == "uniform":
+                return self.random.uniform(0, 2 * self.latency)
+            if self.latency_dist == "exponential":
+                return self.random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            return self.random.lognormvariate(0, self.latency_sigma) * self.latency
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+def fake_page(prompt, completion_tokens):
+    """Deterministic HTML page of roughly ``completion_tokens`` tokens"""
+    match = re.search(r"URL path: `([^`]*)`", prompt)
+    title = html.escape(match.group(1)[:60]) if match else "Stub page"
+    head = f"text/html\n<!DOCTYPE html><html><head><title>{title}</title></head><body><h1>{title}</h1>\n"
+    tail = "</body></html>"
+    paragraph = ("<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+                 "<a href=\"/stub/related-topic\">Related topic</a> and more text.</p>\n")
+    budget = max(0, completion_tokens * CHARS_PER_TOKEN - len(head) - len(tail))
+    body = paragraph * (budget // len(paragraph) + 1)
+    return head + body[:budget] + tail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = StubOptions()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        options = self.options
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        options.count("requests")
+        time.sleep(options.sample_latency())
+
+        if options.roll(options.hang_rate):
+            options.count("hangs")
+            time.sleep(3600)
+            return
+        if options.roll(options.error_rate):
+            options.count("errors")
+            self._send_json(options.error_status, {"error": {"message": "injected error"}})
+            return
+
+        messages = request.get("messages", [])
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        completion_tokens = min(options.completion_tokens, request.get("max_tokens") or options.completion_tokens)
+        text = fake_page(prompt, completion_tokens)
+        usage = {
+            "prompt_tokens": len(prompt) // CHARS_PER_TOKEN,
+            "completion_tokens": len(text) // CHARS_PER_TOKEN,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+        if not request.get("stream"):
+            if options.tokens_per_second > 0:
+                time.sleep(usage["completion_tokens"] / options.tokens_per_second)
+            self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        options.count("streamed")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = options.chunk_tokens * CHARS_PER_TOKEN
+        delay = options.chunk_tokens / options.tokens_per_second if options.tokens_per_second > 0 else 0
+        try:
+            for start in range(0, len(text), step):
+                chunk = {"choices": [{"index": 0, "delta": {"content": text[start:start + step]},
+                                      "finish_reason": None}]}
+                self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+                if delay:
+                    time.sleep(delay)
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+            self.wfile.write(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading, e.g. after </html>
+
+
+def start_stub(options=None, host="127.0.0.1", port=0):
+    """Run a stub server in a daemon thread; returns (server, base URL ending in /v1)"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"options": options or StubOptions()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_stub_arguments(parser):
+    group = parser.add_argument_group("stub LLM")
+    group.add_argument("--latency", type=float, default=0.5, help="median seconds before the answer")
+    group.add_argument("--latency-dist", choices=("fixed", "uniform", "exponential", "lognormal"),
+                       default="lognormal")
+    group.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread")
+    group.add_argument("--tokens-per-second", type=float, default=0.0, help="0 answers at once")
+    group.add_argument("--completion-tokens", type=int, default=1500, help="size of generated pages")
+    group.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    group.add_argument("--error-status", type=int, default=503)
+    group.add_argument("--hang-rate", type=float, default=0.0, help="share of requests that never answer")
+    group.add_argument("--seed", type=int, default=None)
+
+
+def options_from_args(args):
+    return StubOptions(
+        latency=args.latency, latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate, error_status=args.error_status, hang_rate=args.hang_rate,
+        seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9900)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+    server, url = start_stub(options_from_args(args), args.host, args.port)
+    print(f"Stub LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -306,6 +306,23 @@ CONTENT_PAGE_CSS = """
 </style>
 """
 
+# Link state styling added to served pages (see link_state.py)
+LINK_STATE_CSS = """<style>
+    a[data-link="ungenerated"] {
+        text-decoration-style: dashed;
+    }
+    a[data-link="ungenerated"]::after {
+        content: " \\2726";
+        font-size: 0.75em;
+        opacity: 0.6;
+    }
+    a[data-link="external"]::after {
+        content: " \\2197";
+        font-size: 0.85em;
+    }
+</style>
+"""
+
 def get_content_template():
     """Returns the base template with CSS for content pages"""
     return CONTENT_PAGE_CSS
@@ -0,0 +1,49 @@
+"""Test settings. config.py reads the environment once at import, so every
+path the app writes to is pointed at a scratch directory before any
+application module is imported."""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCRATCH = tempfile.mkdtemp(prefix="iaw-tests-")
+os.environ.update({
+    "AI_PROVIDER": "openai",
+    "DRAFT_PROVIDER": "",
+    "WEB_DIR": os.path.join(SCRATCH, "web"),
+    "CACHE_META_DIR": os.path.join(SCRATCH, "web_meta"),
+    "CACHE_BACKEND": "directory",
+    "PACKFILE_PATH": os.path.join(SCRATCH, "web.pack"),
+    "LEDGER_PATH": os.path.join(SCRATCH, "ledger.sqlite3"),
+    "PROFILE_DIR": os.path.join(SCRATCH, "profiles"),
+    "REPLAY_CORPUS": os.path.join(SCRATCH, "replay"),
+    "SERVE_PIDFILE": os.path.join(SCRATCH, "serve.pid"),
+    "CACHE_PEERS": "",
+    "LOG_LEVEL": "INFO",
+})
+
+
+@pytest.fixture
+def web_dir():
+    """An empty directory-backend cache"""
+    from config import WEB_DIR, CACHE_META_DIR
+    for directory in (WEB_DIR, CACHE_META_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(WEB_DIR)
+    yield WEB_DIR
+    for directory in (WEB_DIR, CACHE_META_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def client(web_dir):
+    """Test client of the app, serving from an empty cache"""
+    from infinite_web import create_app
+    app = create_app()
+    app.testing = True
+    return app.test_client()
@@ -0,0 +1,67 @@
+import os
+
+from werkzeug.datastructures import MultiDict
+
+import utils
+import views
+from utils import base_path_for_key, cache_keys, list_cache_variants, save_to_cache
+
+
+def test_plain_request_falls_back_to_the_legacy_key():
+    variant, legacy = cache_keys("/python/modules/")
+    assert legacy == "python/modules"
+    assert base_path_for_key(variant) == legacy and variant != legacy
+
+
+def test_form_data_is_normalized():
+    a = cache_keys("search", MultiDict([("q", " rome "), ("lang", "it"), ("empty", "")]))
+    b = cache_keys("search", MultiDict([("lang", "it"), ("q", "rome")]))
+    c = cache_keys("search", MultiDict([("q", "paris"), ("lang", "it")]))
+    assert a == b and len(a) == 1  # no legacy fallback for submissions
+    assert a != c and a[0] != cache_keys("search")[0]
+
+
+def test_large_forms_are_not_cached(monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_MAX_FORM_BYTES", 20)
+    assert cache_keys("search", MultiDict([("q", "x" * 50)])) == []
+
+
+def test_only_listed_query_params_vary(monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_VARY_QUERY_PARAMS", ["lang"])
+    plain = cache_keys("rome")
+    assert cache_keys("rome", query_args=MultiDict([("utm_source", "x")])) == plain
+    localized = cache_keys("rome", query_args=MultiDict([("lang", "it"), ("utm_source", "x")]))
+    assert len(localized) == 1 and localized[0] != plain[0]
+
+
+def test_model_selects_the_variant(monkeypatch):
+    default = cache_keys("rome")
+    monkeypatch.setattr(utils, "AI_PROVIDER", "other")
+    assert cache_keys("rome")[0] != default[0]
+    monkeypatch.setattr(utils, "CACHE_VARY_ON_MODEL", False)
+    assert cache_keys("rome") == ["rome"]
+    monkeypatch.setattr(utils, "CACHE_LEGACY_FALLBACK", False)
+    monkeypatch.setattr(utils, "CACHE_VARY_ON_MODEL", True)
+    assert len(cache_keys("rome")) == 1
+
+
+def test_oldest_variants_are_evicted(web_dir, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_MAX_VARIANTS_PER_PATH", 2)
+    keys = [f"rome@{i:016x}" for i in range(3)]
+    for age, key in enumerate(keys):
+        save_to_cache(key, "text/html", f"<html>{key}</html>")
+        os.utime(os.path.join(web_dir, f"{key}.html"), (1000 + age, 1000 + age))
+    assert sorted(key for key, _ in list_cache_variants("rome")) == keys[1:]
+
+
+def test_legacy_page_only_answers_plain_requests(client, web_dir, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_VARY_QUERY_PARAMS", ["lang"])
+    monkeypatch.setattr(views, "LINK_STATE", False)
+    monkeypatch.setattr(views, "generate_content",
+                        lambda path, *args, **kwargs: ("text/html", "<html>generated</html>"))
+    with open(os.path.join(web_dir, "rome.html"), "w", encoding="utf-8") as f:
+        f.write("<html>legacy</html>")
+
+    assert client.get("/rome").get_data(as_text=True) == "<html>legacy</html>"
+    assert client.get("/rome?utm_source=x").get_data(as_text=True) == "<html>legacy</html>"
+    assert client.get("/rome?lang=it").get_data(as_text=True) == "<html>generated</html>"
@@ -0,0 +1,124 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+import cache_snapshot
+import link_state
+import tiering
+from utils import load_from_cache, read_cache_metadata, save_to_cache
+
+
+def _export(**kwargs):
+    out = io.BytesIO()
+    summary = cache_snapshot.export_snapshot(out, **kwargs)
+    out.seek(0)
+    return out, summary
+
+
+def _clear(web_dir):
+    from config import CACHE_META_DIR
+    for directory in (web_dir, CACHE_META_DIR):
+        for root, _, files in os.walk(directory):
+            for name in files:
+                os.remove(os.path.join(root, name))
+
+
+def test_round_trip(web_dir):
+    save_to_cache("wiki/rome", "text/html", "<html><body>Roma ☃</body></html>", meta={"tier": "draft"})
+    save_to_cache("api/rome", "application/json", '{"name": "Rome"}')
+    archive, summary = _export()
+    assert summary["entries"] == 2 and summary["unreadable"] == 0
+
+    _clear(web_dir)
+    result = cache_snapshot.import_snapshot(archive)
+    assert result["entries"] == result["imported"] == 2
+    assert load_from_cache("wiki/rome") == ("text/html", "<html><body>Roma ☃</body></html>")
+    assert load_from_cache("api/rome") == ("application/json", '{"name": "Rome"}')
+    assert read_cache_metadata("wiki/rome") == {"tier": "draft"}
+
+    archive.seek(0)
+    assert cache_snapshot.import_snapshot(archive)["skipped"] == 2
+
+
+def test_each_file_of_a_key_is_exported_once(web_dir):
+    save_to_cache("rome", "text/html", "<html>page</html>")
+    save_to_cache("rome", "application/json", '{"page": false}')
+    archive, summary = _export()
+    assert summary["entries"] == 2
+
+    _clear(web_dir)
+    cache_snapshot.import_snapshot(archive)
+    with open(os.path.join(web_dir, "rome.html"), encoding="utf-8") as f:
+        assert f.read() == "<html>page</html>"
+    with open(os.path.join(web_dir, "rome.json"), encoding="utf-8") as f:
+        assert f.read() == '{"page": false}'
+
+
+def test_unreadable_pages_are_skipped(web_dir, capsys):
+    save_to_cache("good", "text/html", "<html>ok</html>")
+    with open(os.path.join(web_dir, "bad.html"), "wb") as f:
+        f.write(b"<html>\xff\xfe</html>")
+    archive, summary = _export()
+    assert summary["entries"] == 1 and summary["unreadable"] == 1
+    assert "bad.html" in capsys.readouterr().err
+
+    _clear(web_dir)
+    assert cache_snapshot.import_snapshot(archive)["imported"] == 1
+    assert load_from_cache("good") == ("text/html", "<html>ok</html>")
+
+
+def test_incremental_export(web_dir):
+    save_to_cache("old", "text/html", "<html>old</html>")
+    os.utime(os.path.join(web_dir, "old.html"), (1000, 1000))
+    save_to_cache("new", "text/html", "<html>new</html>")
+    archive, summary = _export(since=2000)
+    assert summary["entries"] == 1
+    manifest = None
+    with tarfile.open(fileobj=archive, mode="r|*") as tar:
+        names = []
+        for member in tar:
+            names.append(member.name)
+            if member.name == cache_snapshot.MANIFEST_NAME:
+                manifest = json.load(tar.extractfile(member))
+    assert names == ["pages/new.html", cache_snapshot.MANIFEST_NAME]
+    assert manifest["since"] == 2000
+
+
+def test_bad_archives_import_nothing(web_dir):
+    save_to_cache("a", "text/html", "<html>a</html>")
+    save_to_cache("b", "text/html", "<html>b</html>")
+    archive, _ = _export()
+    data = archive.getvalue()
+    _clear(web_dir)
+
+    raw = gzip.decompress(data)
+    truncated = raw[:raw.index(cache_snapshot.MANIFEST_NAME.encode("ascii"))]
+    with pytest.raises((ValueError, tarfile.TarError)):
+        cache_snapshot.import_snapshot(io.BytesIO(truncated))
+    tampered = raw.replace(b"<html>b</html>", b"<html>x</html>")
+    with pytest.raises(ValueError, match="Checksum"):
+        cache_snapshot.import_snapshot(io.BytesIO(tampered))
+    assert not os.listdir(web_dir)
+
+
+class _Pipe(io.BytesIO):
+    def seekable(self):
+        return False
+
+
+def test_import_from_a_pipe_updates_link_and_tier_state(web_dir, monkeypatch):
+    save_to_cache("wiki/rome", "text/html", "<html>rome</html>", meta={"tier": "draft"})
+    archive, _ = _export()
+    _clear(web_dir)
+    with tiering._lock:
+        tiering._settle("wiki/rome")
+    saved = []
+    monkeypatch.setattr(link_state, "note_saved", saved.append)
+
+    assert cache_snapshot.import_snapshot(_Pipe(archive.getvalue()))["imported"] == 1
+    assert saved == ["wiki/rome"]
+    assert "wiki/rome" not in tiering._settled
@@ -0,0 +1,44 @@
+import pytest
+
+genai = pytest.importorskip("google.generativeai")
+
+import gemini_provider  # noqa: E402
+
+
+@pytest.fixture
+def caching(monkeypatch):
+    """Record CachedContent.create calls; models named "tiny" cannot be cached"""
+    created = []
+
+    def create(model, system_instruction, ttl):
+        if model == "tiny":
+            raise ValueError("prompt below the minimum cacheable size")
+        created.append((model, system_instruction))
+        return (model, system_instruction)
+
+    monkeypatch.setattr(gemini_provider, "GEMINI_CONTEXT_CACHE", True)
+    monkeypatch.setattr(gemini_provider, "_gemini_caches", {})
+    monkeypatch.setattr(gemini_provider, "_gemini_cache_disabled", set())
+    monkeypatch.setattr(genai.caching.CachedContent, "create", staticmethod(create))
+    monkeypatch.setattr(genai.GenerativeModel, "from_cached_content",
+                        staticmethod(lambda content: ("cached", content)))
+    return created
+
+
+def test_cached_content_per_model_key_and_prompt(caching):
+    main = {"model": "gemini-pro", "api_key": "a"}
+    draft = {"model": "gemini-flash", "api_key": "a"}
+    assert gemini_provider._gemini_model(main, "system") == ("cached", ("gemini-pro", "system"))
+    assert gemini_provider._gemini_model(draft, "system") == ("cached", ("gemini-flash", "system"))
+    gemini_provider._gemini_model(main, "system")
+    gemini_provider._gemini_model(dict(main, api_key="b"), "system")
+    gemini_provider._gemini_model(main, "other system")
+    assert len(caching) == 4
+
+
+def test_failures_only_disable_caching_for_that_model(caching):
+    plain = gemini_provider._gemini_model({"model": "tiny", "api_key": "a"}, "system")
+    assert plain.model_name.endswith("tiny")
+    assert gemini_provider._gemini_cache_disabled == {"tiny"}
+    cached = gemini_provider._gemini_model({"model": "gemini-pro", "api_key": "a"}, "system")
+    assert cached == ("cached", ("gemini-pro", "system"))
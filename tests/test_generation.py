@@ -0,0 +1,72 @@
+import pytest
+
+import models
+from models import collect_until_html_end
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+PAGE = "text/html\n<!DOCTYPE html><html><body><p>Rome</p></body></html>"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_stops_at_html_end_across_piece_boundaries(size):
+    text, stopped = collect_until_html_end(_pieces(PAGE + "\nHope this helps!", size))
+    assert stopped
+    assert text == PAGE
+
+
+def test_offset_is_taken_in_the_original_text():
+    # "İ".lower() is two characters long
+    page = "text/html\n<html><body>İstanbul İzmir</body></html>"
+    for size in (1, 4, 1000):
+        text, stopped = collect_until_html_end(_pieces(page + " chatter", size))
+        assert stopped and text == page
+
+
+def test_closing_tag_in_any_case():
+    page = "text/html\n<HTML><BODY>x</BODY></HTML>"
+    assert collect_until_html_end(_pieces(page + "\nmore", 3)) == (page, True)
+
+
+def test_only_html_documents_stop_early():
+    data = 'application/json\n{"snippet": "</html>", "more": 1}'
+    assert collect_until_html_end(_pieces(data, 4)) == (data, False)
+    assert collect_until_html_end(_pieces(data, 4), is_html=True)[1]
+
+
+def test_unfinished_document_is_returned_whole():
+    page = "text/html\n<html><body><p>cut off"
+    assert collect_until_html_end(_pieces(page, 3)) == (page, False)
+
+
+def test_stop_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(models, "STOP_AT_HTML_END", False)
+    text, stopped = collect_until_html_end(_pieces(PAGE + " chatter", 5))
+    assert not stopped and text == PAGE + " chatter"
+
+
+PARTIAL = "text/html\n<html><body><p>The Colosseum was built under Vesp"
+
+
+def test_continuation_fences_are_stripped():
+    more = "```html\nasian and finished under Titus.</p></body></html>\n```\n"
+    assert models.stitch_continuation(PARTIAL, more) == (
+        PARTIAL + "asian and finished under Titus.</p></body></html>"
+    )
+
+
+def test_continuation_overlap_is_dropped():
+    more = "```html\nbuilt under Vespasian.</p></body></html>\n```"
+    assert models.stitch_continuation(PARTIAL, more) == (
+        PARTIAL + "asian.</p></body></html>"
+    )
+
+
+def test_restarted_document_replaces_the_partial():
+    more = "```html\n<!DOCTYPE html><html><body>Again</body></html>\n```"
+    assert models.stitch_continuation(PARTIAL, more) == (
+        "text/html\n<!DOCTYPE html><html><body>Again</body></html>"
+    )
@@ -0,0 +1,73 @@
+import pytest
+
+from html_rewriter import BACK_LINK, HtmlRewriter, Rule, rewrite_html
+from templates import get_content_template
+
+DOCUMENTS = [
+    "<!DOCTYPE html><html><head><title>Rome</title></head><body><p>Roma</p></body></html>",
+    "<HTML><HEAD><STYLE>p{}</STYLE></HEAD><BODY>x</BODY></HTML>",
+    '<html><head></head><body><div class="back-to-search"><a href="/">Back</a></div></body></html>',
+    "<html><head></head><body>no body end",
+    "text before <html><head></head><body>İstanbul ☃</body></html> text after",
+    "<p>just a fragment</p>",
+    '<html><head></head><body><DIV CLASS="Back-To-Search">Back</DIV></body></html>',
+]
+
+
+def _feed(document, size, **kwargs):
+    rewriter = HtmlRewriter("wiki/rome", **kwargs)
+    out = [rewriter.feed(document[i:i + size]) for i in range(0, len(document), size)]
+    return "".join(out) + rewriter.close()
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_chunking_does_not_change_the_output(document):
+    whole = rewrite_html(document, "wiki/rome")
+    for size in range(1, len(document) + 1):
+        assert _feed(document, size) == whole, size
+
+
+def test_default_rules():
+    css = get_content_template()
+    page = rewrite_html(DOCUMENTS[0], "wiki/rome")
+    assert page.count(css) == 1 and page.index(css) < page.index("</head>")
+    assert page.count(BACK_LINK) == 1 and page.index(BACK_LINK) < page.index("</body>")
+
+    styled = rewrite_html(DOCUMENTS[1], "wiki/rome")
+    assert css not in styled and BACK_LINK in styled
+    assert BACK_LINK not in rewrite_html(DOCUMENTS[2], "wiki/rome")
+
+    fragment = rewrite_html(DOCUMENTS[5], "wiki/rome")
+    assert fragment.startswith("<!DOCTYPE html>") and "<title>Wiki - Rome</title>" in fragment
+
+
+def test_back_link_marker_matches_any_case():
+    # As before the rewriter: the check lowercased the page
+    assert BACK_LINK not in rewrite_html(DOCUMENTS[6], "wiki/rome")
+
+
+def test_changes_from_process_html_response():
+    css = get_content_template()
+    # A <style> after </head> comes too late to keep the CSS out
+    late_style = rewrite_html("<html><head></head><body><style>p{}</style></body></html>", "x")
+    assert late_style.count(css) == 1
+    # Pages that get the CSS also get the back link
+    page = rewrite_html(DOCUMENTS[0], "wiki/rome")
+    assert css in page and BACK_LINK in page
+    # Only the first </head> and </body> are rewritten, in any case
+    twice = rewrite_html("<html><HEAD></HEAD><BODY></BODY><head></head><body></body></html>", "x")
+    assert twice.count(css) == 1 and twice.count(BACK_LINK) == 1
+    assert twice.index(BACK_LINK) < twice.index("</BODY>")
+
+
+def test_custom_rules_stream_without_wrapping():
+    rules = [Rule("strong", r"<b>", lambda match, rewriter: "<strong>")]
+    document = "<p>a <b>bold</b> and <B>loud</B> word</p>"
+    expected = "<p>a <strong>bold</b> and <strong>loud</B> word</p>"
+    for size in range(1, len(document) + 1):
+        assert _feed(document, size, rules=rules, wrap_fragments=False) == expected
+
+
+def test_rules_must_match_a_tag():
+    with pytest.raises(ValueError):
+        Rule("text", "back-to-search", lambda match, rewriter: None)
@@ -0,0 +1,67 @@
+import pytest
+
+import link_state
+from peers import PEER_HEADER
+from templates import LINK_STATE_CSS
+from utils import save_to_cache
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Rome</title><style>body { margin: 0; }</style></head>
+<body>
+<a href="/history/rome/empire">Empire</a>
+<a href="republic">Republic</a>
+<a href="https://example.org/rome">Elsewhere</a>
+<a href="#top">Top</a>
+<a href="mailto:rome@example.org">Mail</a>
+</body></html>
+"""
+
+
+@pytest.fixture
+def built(web_dir):
+    save_to_cache("history/rome", "text/html", PAGE)
+    save_to_cache("history/rome/empire", "text/html", PAGE)
+    link_state.build()
+    return link_state._filter
+
+
+def test_link_states(built):
+    page = "history/rome"
+    assert link_state.link_state("/history/rome/empire", page, "localhost", built) == link_state.CACHED
+    assert link_state.link_state("rome/empire", page, "localhost", built) == link_state.CACHED
+    assert link_state.link_state("/history/carthage", page, "localhost", built) == link_state.UNGENERATED
+    assert link_state.link_state("https://example.org/x", page, "localhost", built) == link_state.EXTERNAL
+    assert link_state.link_state("http://localhost/history/rome/empire", page, "localhost", built) == link_state.CACHED
+    for href in ("#top", "?q=1", "mailto:a@b.c", "javascript:void(0)", "/", "/api/cache/stats", "/favicon.ico"):
+        assert link_state.link_state(href, page, "localhost", built) is None
+
+
+def test_annotate_tags_links_and_adds_css_once(built):
+    annotated = link_state.annotate(PAGE, "history/rome", "localhost")
+    assert '<a href="/history/rome/empire" data-link="cached">' in annotated
+    assert '<a href="republic" data-link="ungenerated">' in annotated
+    assert '<a href="https://example.org/rome" data-link="external">' in annotated
+    assert '<a href="#top">' in annotated
+    assert annotated.count(LINK_STATE_CSS) == 1
+
+    # Serving an already annotated page neither stacks CSS nor keeps stale states
+    save_to_cache("history/republic", "text/html", PAGE)
+    link_state.build()
+    again = link_state.annotate(annotated, "history/rome", "localhost")
+    assert again.count(LINK_STATE_CSS) == 1
+    assert again.count("<style") == annotated.count("<style")
+    assert '<a href="republic" data-link="cached">' in again
+    assert again.count("data-link=") == annotated.count("data-link=")
+
+
+def test_stale_tag_is_dropped_when_the_link_has_no_state(built):
+    stale = '<html><head></head><body><a href="#top" data-link="cached">Top</a></body></html>'
+    assert '<a href="#top">' in link_state.annotate(stale, "history/rome", "localhost")
+
+
+def test_peer_requests_get_the_page_as_cached(client, built):
+    tagged = client.get("/history/rome").get_data(as_text=True)
+    assert 'data-link="cached"' in tagged and LINK_STATE_CSS in tagged
+
+    raw = client.get("/history/rome", headers={PEER_HEADER: "http://127.0.0.1:1"}).get_data(as_text=True)
+    assert raw == PAGE
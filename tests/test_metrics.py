@@ -0,0 +1,60 @@
+import gc
+import os
+import threading
+
+import pytest
+
+import metrics
+
+COUNTER = "iaw_test_total"
+
+
+def _count(text, line):
+    return [row for row in text.splitlines() if row.startswith(line + " ")]
+
+
+def _value(text, line):
+    rows = _count(text, line)
+    return float(rows[0].split()[-1]) if rows else 0.0
+
+
+def test_finished_threads_are_folded_into_the_total():
+    before = _value(metrics.render(), COUNTER)
+    stores_before = len(metrics._stores)
+
+    def work():
+        metrics.inc(COUNTER)
+        metrics.observe(metrics.STAGE_SECONDS, 0.002, (("stage", "test"),))
+
+    for _ in range(300):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(metrics._stores) <= stores_before + 1
+    text = metrics.render()
+    assert _value(text, COUNTER) == before + 300
+    assert _value(text, 'iaw_stage_seconds_count{stage="test"}') >= 300
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_shared_dir", None)
+    (tmp_path / "12345.json").write_text("stale from an earlier run")
+    metrics.share(str(tmp_path))
+    assert not (tmp_path / "12345.json").exists()
+    return tmp_path
+
+
+def test_scrapes_add_up_all_workers(shared):
+    local = _value(metrics.render(), COUNTER)
+    other_pid = os.getpid() + 1
+    metrics._dump({(COUNTER, ()): 7}, {}, str(shared / f"{other_pid}.json"))
+    assert _value(metrics.render(), COUNTER) == local + 7
+
+    # An exited worker's counts survive in the retired totals
+    metrics.retire_process(other_pid)
+    assert not (shared / f"{other_pid}.json").exists()
+    assert (shared / metrics.RETIRED_FILE).exists()
+    assert _value(metrics.render(), COUNTER) == local + 7
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import packfile
+from packfile import Packfile
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    return str(tmp_path / "web.pack")
+
+
+def test_put_get_overwrite_delete(pack_path):
+    pack = Packfile(pack_path)
+    pack.put("wiki/rome", "text/html", "<html>Roma ☃</html>", meta={"tier": "draft"}, mtime=1000)
+    entry = pack.get("wiki/rome")
+    assert entry == ("text/html", "<html>Roma ☃</html>", 1000, {"tier": "draft"})
+
+    pack.put("wiki/rome", "text/html", "<html>v2</html>")
+    assert pack.get("wiki/rome").content == "<html>v2</html>"
+    assert pack.get("wiki/rome").meta == {}
+    assert pack.keys() == ["wiki/rome"]
+
+    assert pack.delete("wiki/rome")
+    assert not pack.delete("wiki/rome")
+    assert pack.get("wiki/rome") is None and len(pack) == 0
+    pack.close()
+
+
+def test_reopen_rebuilds_missing_index_and_ignores_torn_tail(pack_path):
+    pack = Packfile(pack_path)
+    pack.put("a", "text/html", "<html>a</html>")
+    pack.put("b", "application/json", "{}")
+    pack.delete("a")
+    pack.close()
+
+    os.remove(pack_path + ".idx")
+    with open(pack_path, "ab") as f:
+        f.write(b"\x00\x01half a record")
+    pack = Packfile(pack_path)
+    assert pack.keys() == ["b"]
+    assert pack.get("b").content_type == "application/json"
+    pack.put("c", "text/html", "<html>c</html>")
+    pack.close()
+    assert sorted(Packfile(pack_path).keys()) == ["b", "c"]
+
+
+def test_compaction_keeps_live_pages(pack_path):
+    pack = Packfile(pack_path)
+    reader = Packfile(pack_path)  # another process sharing the pack
+    for version in range(20):
+        pack.put("rome", "text/html", f"<html>{version}</html>" * 50)
+    pack.put("paris", "text/html", "<html>paris</html>", mtime=1234)
+    before = pack.stats()
+    assert before["dead_bytes"] > 0
+    assert reader.get("rome").content.startswith("<html>19</html>")
+
+    assert pack.compact()
+    after = pack.stats()
+    assert after["dead_bytes"] == 0
+    assert after["live_bytes"] == before["live_bytes"]
+    assert os.path.getsize(pack_path) < before["pack_size_bytes"]
+    for instance in (pack, reader):
+        assert instance.get("rome").content == "<html>19</html>" * 50
+        assert instance.get("paris") == ("text/html", "<html>paris</html>", 1234, {})
+
+    reader.put("london", "text/html", "<html>london</html>")
+    assert pack.get("london").content == "<html>london</html>"
+    pack.close()
+    reader.close()
+
+
+def test_background_compaction(pack_path, monkeypatch):
+    monkeypatch.setattr(packfile, "PACKFILE_COMPACT_MIN_BYTES", 1)
+    monkeypatch.setattr(packfile, "PACKFILE_COMPACT_RATIO", 0.5)
+    pack = Packfile(pack_path)
+    pack.put("rome", "text/html", "<html>old</html>")
+    pack.put("rome", "text/html", "<html>new</html>")
+    deadline = time.monotonic() + 5
+    while pack.stats()["dead_bytes"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pack.stats()["dead_bytes"] == 0
+    assert pack.get("rome").content == "<html>new</html>"
+    pack.close()
+
+
+def _writer(pack_path, name, count):
+    pack = Packfile(pack_path)
+    for i in range(count):
+        pack.put(f"{name}/{i}", "text/html", f"<html>{name} {i}</html>")
+        if i % 10 == 0:
+            pack.compact()
+    pack.close()
+
+
+@pytest.mark.skipif(packfile.fcntl is None, reason="cross-process locking needs fcntl")
+def test_concurrent_writers(pack_path):
+    Packfile(pack_path).close()
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_writer, args=(pack_path, name, 40)) for name in ("a", "b", "c")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    pack = Packfile(pack_path)
+    assert len(pack) == 120
+    for name in ("a", "b", "c"):
+        for i in range(40):
+            assert pack.get(f"{name}/{i}").content == f"<html>{name} {i}</html>"
+    pack.close()
+
+
+def test_migration_keeps_metadata_and_skips_temporary_files(tmp_path, pack_path):
+    web_dir, meta_dir = tmp_path / "web", tmp_path / "web_meta"
+    (web_dir / "wiki").mkdir(parents=True)
+    (meta_dir / "wiki").mkdir(parents=True)
+    (web_dir / "wiki" / "rome.html").write_text("<html>draft</html>", encoding="utf-8")
+    (meta_dir / "wiki" / "rome.json").write_text('{"tier": "draft"}', encoding="utf-8")
+    (web_dir / "wiki" / "paris.html").write_text("<html>paris</html>", encoding="utf-8")
+    (web_dir / "wiki" / "paris.html.1234.tmp").write_text("<html>pa", encoding="utf-8")
+
+    pack = Packfile(pack_path)
+    assert packfile.migrate_directory(str(web_dir), pack, remove=True, meta_dir=str(meta_dir)) == 2
+    assert sorted(pack.keys()) == ["wiki/paris", "wiki/rome"]
+    assert pack.get("wiki/rome").meta == {"tier": "draft"}
+    assert pack.get("wiki/paris").meta == {}
+    assert not (meta_dir / "wiki").exists()
+    assert [p.name for p in web_dir.rglob("*")] == ["wiki", "paris.html.1234.tmp"]
+    pack.close()
@@ -0,0 +1,148 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import peers
+import views
+from request_filters import forget_failure, remember_failure
+from utils import cache_keys, save_to_cache, read_cache_metadata
+
+PAGE = "<html><head><title>Café</title></head><body><p>Café</p></body></html>"
+META = {"tier": "draft", "usage": {"prompt_tokens": 10, "completion_tokens": 20, "cached_tokens": 0}}
+
+
+class OwnerHandler(BaseHTTPRequestHandler):
+    """An owner node answering with UTF-8 HTML but no charset. Paths starting
+    with "failed" recently failed on the owner, "busy" ones find it overloaded."""
+
+    def do_GET(self):
+        if self.path.startswith(("/failed", "/busy")):
+            body = b"<html>Generation failed</html>"
+            self.send_response(503)
+            if self.path.startswith("/failed"):
+                self.send_header(peers.PEER_FAILURE_HEADER, "negative_cache")
+                self.send_header("Retry-After", "30")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = PAGE.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header(peers.PEER_META_HEADER, json.dumps(META))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def owner(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OwnerHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    owner_url = f"http://127.0.0.1:{server.server_port}"
+    self_url = "http://127.0.0.1:1"
+    monkeypatch.setattr(peers, "CACHE_PEERS", [self_url, owner_url])
+    monkeypatch.setattr(peers, "CACHE_SELF_URL", self_url)
+    monkeypatch.setattr(peers, "_ring", None)
+    monkeypatch.setattr(peers, "_session", None)
+    monkeypatch.setattr(peers, "_down_until", {})
+    yield owner_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_ring_ownership_is_stable_and_balanced():
+    nodes = [f"http://node{i}:5000" for i in range(4)]
+    ring = peers.HashRing(nodes)
+    keys = [f"topic/{i}" for i in range(4000)]
+    owners = {key: ring.owner(key) for key in keys}
+    reordered = peers.HashRing(list(reversed(nodes)))
+    assert owners == {key: reordered.owner(key) for key in keys}
+    counts = {node: list(owners.values()).count(node) for node in nodes}
+    assert min(counts.values()) > 500
+
+    # Removing a node only moves the keys it owned
+    smaller = peers.HashRing(nodes[:3])
+    moved = [key for key in keys if smaller.owner(key) != owners[key]]
+    assert moved and all(owners[key] == nodes[3] for key in moved)
+
+
+def test_empty_ring_has_no_owner():
+    assert peers.HashRing([]).owner("anything") is None
+
+
+def test_fetch_decodes_utf8_and_returns_metadata(owner):
+    key = next(key for key in (f"page{i}" for i in range(1000)) if peers.peer_owner(key) == owner)
+    content_type, content, meta = peers.fetch_from_peer(key, key)
+    assert content_type == "text/html"
+    assert content == PAGE
+    assert meta == META
+
+
+def _owned_by(owner, prefix):
+    return next(path for path in (f"{prefix}{i}" for i in range(1000))
+                if peers.peer_owner(cache_keys(path)[0]) == owner)
+
+
+def test_page_failures_do_not_mark_the_owner_down(owner):
+    path = _owned_by(owner, "failed")
+    with pytest.raises(peers.PeerFailure) as failure:
+        peers.fetch_from_peer(cache_keys(path)[0], path)
+    assert failure.value.status == 503 and failure.value.retry_after == "30"
+    assert failure.value.reason == "negative_cache"
+    assert not peers._down_until
+
+    path = _owned_by(owner, "page")
+    assert peers.fetch_from_peer(cache_keys(path)[0], path)[1] == PAGE
+
+
+def test_owner_errors_mark_it_down(owner):
+    path = _owned_by(owner, "busy")
+    assert peers.fetch_from_peer(cache_keys(path)[0], path) == (None, None, None)
+    assert owner in peers._down_until
+    path = _owned_by(owner, "page")
+    assert peers.fetch_from_peer(cache_keys(path)[0], path) == (None, None, None)
+
+
+def test_owner_failures_are_passed_on(client, owner, monkeypatch):
+    def generate(*args, **kwargs):
+        raise AssertionError("generated locally")
+    monkeypatch.setattr(views, "generate_content", generate)
+    response = client.get("/" + _owned_by(owner, "failed"))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert response.get_data(as_text=True) == "<html>Generation failed</html>"
+
+
+def test_owner_tags_page_failures(client):
+    key = cache_keys("broken")[0]
+    remember_failure(key, RuntimeError("provider down"))
+    response = client.get("/broken", headers={peers.PEER_HEADER: "http://127.0.0.1:1"})
+    forget_failure(key)
+    assert response.status_code == 503
+    assert response.headers[peers.PEER_FAILURE_HEADER] == "negative_cache"
+
+
+def test_owned_keys_are_not_fetched(owner):
+    key = next(key for key in (f"page{i}" for i in range(1000)) if peers.peer_owner(key) is None)
+    assert peers.fetch_from_peer(key, key) == (None, None, None)
+
+
+def test_owner_sends_charset_and_metadata(client):
+    save_to_cache("cafe", "text/html", PAGE, meta=META)
+    response = client.get("/cafe", headers={peers.PEER_HEADER: "http://127.0.0.1:1"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/html; charset=utf-8"
+    assert json.loads(response.headers[peers.PEER_META_HEADER]) == META
+    assert "Café" in response.get_data(as_text=True)
+
+
+def test_metadata_is_only_sent_to_peers(client):
+    save_to_cache("cafe", "text/html", PAGE, meta=META)
+    assert peers.PEER_META_HEADER not in client.get("/cafe").headers
+    assert read_cache_metadata("cafe") == META
@@ -0,0 +1,29 @@
+import pytest
+
+import profiling
+
+
+def test_profiles_are_closed_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "")
+    assert client.get("/api/profiles").status_code == 403
+    assert client.get("/api/profiles?profile=").status_code == 403
+    assert client.get("/api/profiles/x.json", headers={"X-Profile": ""}).status_code == 403
+
+
+@pytest.mark.parametrize("headers, query, status", [
+    ({}, "", 403),
+    ({"X-Profile": "wrong"}, "", 403),
+    ({"X-Profile": "s3cret-ü"}, "", 403),
+    ({"X-Profile": "s3cret"}, "", 200),
+    ({}, "?profile=s3cret", 200),
+])
+def test_profiles_require_the_token(client, monkeypatch, headers, query, status):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    assert client.get("/api/profiles" + query, headers=headers).status_code == status
+
+
+def test_token_comparison_accepts_any_text(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "jeton-é")
+    assert profiling.token_ok("jeton-é")
+    assert not profiling.token_ok("jeton-e")
+    assert not profiling.token_ok(None)
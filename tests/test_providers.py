@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+import models
+from app_logging import setup_logging
+
+
+@pytest.fixture
+def fake_provider():
+    models.register_provider("fake", "json:dumps")
+    yield "fake"
+    with models._providers_lock:
+        models.PROVIDERS.pop("fake", None)
+
+
+def test_lazy_backend_loads_with_logging_enabled(fake_provider):
+    setup_logging()
+    assert models.get_provider(fake_provider) is json.dumps
+    # Resolved once, then served from the registry
+    assert models.PROVIDERS[fake_provider] is json.dumps
+
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        models.get_provider("no-such-provider")
@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import request_filters
+from request_filters import junk_response, match_junk
+
+
+@pytest.mark.parametrize("path", [
+    "/node.js", "/programming/vue.js", "/my.sql", "/topics/.net", "/wordpress-history", "/pmarca",
+    "/wordpress", "/wp-admin-history", "/vendor/phpunit-tutorial", "/robots.txt-history",
+    "/languages/php", "/styles/css", "/history/.environment", "/git", "/python-tutorial",
+])
+def test_topics_are_not_junk(path):
+    assert match_junk(path) is None
+
+
+@pytest.mark.parametrize("path, rule", [
+    ("/favicon.ico", "extension"),
+    ("/apple-touch-icon-120x120.png", "extension"),
+    ("/static/app.js.map", "extension"),
+    ("/backup.zip", "extension"),
+    ("/wp-login.php", "prefix"),
+    ("/wp-admin/install.php", "prefix"),
+    ("/WP-Content/plugins/x", "prefix"),
+    ("/vendor/phpunit/phpunit/src/Util/PHP/eval-stdin.php", "prefix"),
+    ("/robots.txt", "prefix"),
+    ("/cgi-bin/", "prefix"),
+    ("/.env", "dotfile"),
+    ("/.env.production", "dotfile"),
+    ("/api/.env", "dotfile"),
+    ("/.git/config", "dotfile"),
+    ("/.well-known/security.txt", "dotfile"),
+])
+def test_probes_are_junk(path, rule):
+    assert match_junk(path) == rule
+
+
+def test_junk_responses():
+    assert junk_response("favicon.ico")[1] == 204
+    body, status, headers = junk_response("robots.txt")
+    assert status == 200 and "Disallow: /api/" in body
+    assert junk_response("wp-login.php")[1] == 404
+    assert junk_response("node.js") is None
+
+
+def test_negative_cache_expires(monkeypatch):
+    request_filters.remember_failure("broken/page", RuntimeError("provider down"))
+    assert request_filters.recent_failure("broken/page") == "provider down"
+    request_filters.forget_failure("broken/page")
+    assert request_filters.recent_failure("broken/page") is None
+
+    monkeypatch.setattr(request_filters, "NEGATIVE_CACHE_TTL", 0.01)
+    request_filters.remember_failure("broken/page", RuntimeError("provider down"))
+    time.sleep(0.02)
+    assert request_filters.recent_failure("broken/page") is None
@@ -0,0 +1,69 @@
+import pytest
+
+import tiering
+from utils import clear_cache_for_path, save_to_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    with tiering._lock:
+        tiering._settled.clear()
+        tiering._retry_at.clear()
+    yield
+
+
+def _fail_upgrade(monkeypatch, key):
+    def broken(*args, **kwargs):
+        raise RuntimeError("provider down")
+    monkeypatch.setattr(tiering, "generate_content", broken)
+    tiering._upgrade(key, key, None, None)
+
+
+def test_saving_a_page_forgets_its_state(web_dir, monkeypatch):
+    with tiering._lock:
+        tiering._settle("rome")
+    _fail_upgrade(monkeypatch, "paris")
+    assert "paris" in tiering._retry_at
+
+    save_to_cache("rome", "text/html", "<html>draft</html>", meta={"tier": "draft"})
+    save_to_cache("paris", "text/html", "<html>draft</html>", meta={"tier": "draft"})
+    assert "rome" not in tiering._settled
+    assert "paris" not in tiering._retry_at
+
+
+def test_clearing_a_page_forgets_its_variants(web_dir):
+    save_to_cache("rome", "text/html", "<html>page</html>")
+    save_to_cache("rome@0123456789abcdef", "text/html", "<html>variant</html>")
+    with tiering._lock:
+        tiering._settle("rome")
+        tiering._settle("rome@0123456789abcdef")
+    assert clear_cache_for_path("rome")
+    assert not tiering._settled
+
+
+def test_settled_keys_are_least_recently_used(monkeypatch):
+    monkeypatch.setattr(tiering, "MAX_SETTLED_KEYS", 3)
+    monkeypatch.setattr(tiering, "tiering_enabled", lambda: True)
+    monkeypatch.setattr(tiering, "hit_count", lambda path: tiering.UPGRADE_HITS)
+    monkeypatch.setattr(tiering, "budget_state", lambda: None)
+    with tiering._lock:
+        for key in ("a", "b", "c"):
+            tiering._settle(key)
+    assert not tiering.maybe_upgrade("a", "a")  # a hit refreshes "a"
+    with tiering._lock:
+        tiering._settle("d")
+    assert list(tiering._settled) == ["c", "a", "d"]
+
+
+def test_retry_times_are_bounded(monkeypatch):
+    monkeypatch.setattr(tiering, "MAX_RETRY_KEYS", 2)
+    monkeypatch.setattr(tiering, "UPGRADE_RETRY_AFTER", 0)
+    for key in ("a", "b"):
+        _fail_upgrade(monkeypatch, key)
+    monkeypatch.setattr(tiering, "UPGRADE_RETRY_AFTER", 300)
+    _fail_upgrade(monkeypatch, "c")
+    assert list(tiering._retry_at) == ["c"]  # expired entries pruned
+
+    for key in ("d", "e"):
+        _fail_upgrade(monkeypatch, key)
+    assert list(tiering._retry_at) == ["d", "e"]  # then the oldest failures
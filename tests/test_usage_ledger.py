@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+import usage_ledger
+import views
+from usage_ledger import MODE_CACHE_ONLY, MODE_DRAFT, budget_state, record
+from utils import save_to_cache
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    """An empty ledger with a 1000 token hourly budget, checked on every call"""
+    usage_ledger._connection().execute("DELETE FROM usage")
+    monkeypatch.setattr(usage_ledger, "TOKEN_BUDGET_HOURLY", 1000)
+    monkeypatch.setattr(usage_ledger, "BUDGET_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(usage_ledger, "BUDGET_EXHAUSTED_MODE", MODE_DRAFT)
+    monkeypatch.setattr(usage_ledger, "get_draft_config", lambda: {"provider": "draft"})
+    monkeypatch.setitem(usage_ledger._budget_cache, "checked", 0.0)
+    monkeypatch.setitem(usage_ledger._budget_cache, "state", None)
+    return usage_ledger
+
+
+def _spend(tokens, tier="quality", path="wiki/rome"):
+    record(path, "openai", "gpt", tier, {"prompt_tokens": tokens // 2, "completion_tokens": tokens - tokens // 2})
+
+
+def test_budget_transitions(ledger, monkeypatch):
+    _spend(600)
+    assert budget_state() is None
+    _spend(5000, tier="draft")  # drafts are not budgeted
+    assert budget_state() is None
+
+    _spend(400)
+    assert budget_state() == MODE_DRAFT
+    # Without a draft model to fall back to, only the cache is left
+    monkeypatch.setattr(ledger, "get_draft_config", lambda: None)
+    assert budget_state() == MODE_CACHE_ONLY
+    monkeypatch.setattr(ledger, "get_draft_config", lambda: {"provider": "draft"})
+    monkeypatch.setattr(ledger, "BUDGET_EXHAUSTED_MODE", MODE_CACHE_ONLY)
+    assert budget_state() == MODE_CACHE_ONLY
+
+    monkeypatch.setattr(ledger, "TOKEN_BUDGET_HOURLY", 0)
+    monkeypatch.setattr(ledger, "TOKEN_BUDGET_DAILY", 2000)
+    assert budget_state() is None
+
+
+def test_state_is_cached_between_checks(ledger, monkeypatch):
+    monkeypatch.setattr(ledger, "BUDGET_CHECK_INTERVAL", 60)
+    assert budget_state() is None
+    _spend(1000)
+    assert budget_state() is None
+    monkeypatch.setitem(ledger._budget_cache, "checked", time.time() - 61)
+    assert budget_state() == MODE_DRAFT
+
+
+def test_usage_is_aggregated(ledger):
+    _spend(100, path="wiki/rome")
+    _spend(50, tier="draft", path="wiki/paris")
+    _spend(10, path="news/today")
+    rows = {row["prefix"]: row for row in ledger.aggregate("prefix")}
+    assert rows["wiki"]["requests"] == 2 and rows["wiki"]["total_tokens"] == 150
+    assert rows["news"]["total_tokens"] == 10
+    assert ledger.aggregate("tier", prefix="wiki/rome")[0]["total_tokens"] == 100
+
+
+def test_pages_in_degraded_modes(client, ledger, monkeypatch):
+    tiers = []
+
+    def generate(path, *args, tier=None, **kwargs):
+        tiers.append(tier)
+        return "text/html", f"<html>{tier}</html>"
+
+    monkeypatch.setattr(views, "generate_content", generate)
+    monkeypatch.setattr(views, "LINK_STATE", False)
+    save_to_cache(views.cache_keys("cached")[0], "text/html", "<html>cached</html>")
+    _spend(1000)
+
+    assert client.get("/fresh").get_data(as_text=True) == "<html>draft</html>"
+    assert tiers == ["draft"]
+
+    monkeypatch.setattr(ledger, "BUDGET_EXHAUSTED_MODE", MODE_CACHE_ONLY)
+    response = client.get("/other")
+    assert response.status_code == 503 and int(response.headers["Retry-After"]) >= 1
+    nocache = client.get("/cached?nocache=1")
+    assert nocache.status_code == 200 and nocache.get_data(as_text=True) == "<html>cached</html>"
+    assert tiers == ["draft"]
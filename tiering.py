@@ -0,0 +1,134 @@
+"""Model tier policy: fast drafts first, background upgrades for popular pages.
+
+With DRAFT_PROVIDER configured, a cache miss is generated by the fast draft
+model so the first visitor does not wait for the main model. Once a page has
+been requested UPGRADE_HITS times it is regenerated by the main model on a
+small background pool and swapped into the cache under the same key.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app_logging import get_logger
+from config import UPGRADE_HITS, UPGRADE_WORKERS, UPGRADE_RETRY_AFTER, get_draft_config
+from models import TIER_DRAFT, TIER_QUALITY, generate_content
+from popularity import hit_count
+from utils import read_cache_metadata
+from usage_ledger import budget_state
+
+# Keys known not to need an upgrade are remembered so popular hits skip the
+# metadata read; the least recently hit are forgotten first
+MAX_SETTLED_KEYS = 100000
+# Failed upgrades waiting for a retry; expired entries are pruned beyond this
+MAX_RETRY_KEYS = 10000
+
+log = get_logger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+_inflight = set()
+_settled = OrderedDict()  # key -> None, least recently hit first
+_retry_at = {}  # key -> time after which a failed upgrade may be retried, oldest failure first
+
+
+def tiering_enabled():
+    return get_draft_config() is not None
+
+
+def choose_tier(path):
+    """Tier for a cache miss: popular pages skip the draft"""
+    if not tiering_enabled() or hit_count(path) >= UPGRADE_HITS:
+        return TIER_QUALITY
+    return TIER_DRAFT
+
+
+def maybe_upgrade(key, path, form_data=None, query_params=None):
+    """Schedule a main-model regeneration of a popular draft page. Returns True if scheduled."""
+    if not tiering_enabled() or hit_count(path) < UPGRADE_HITS:
+        return False
+    if budget_state() is not None:
+        return False  # upgrades wait until the main model's budget is back
+    with _lock:
+        if key in _settled:
+            _settled.move_to_end(key)
+            return False
+        if key in _inflight or _retry_at.get(key, 0) > time.monotonic():
+            return False
+
+    if read_cache_metadata(key).get("tier") != TIER_DRAFT:
+        with _lock:
+            _settle(key)
+        return False
+
+    with _lock:
+        if key in _inflight:
+            return False
+        _inflight.add(key)
+    # The request's form data does not outlive the request
+    form_copy = form_data.copy() if form_data else None
+    _get_executor().submit(_upgrade, key, path, form_copy, query_params)
+    log.info("Scheduled background upgrade", extra={"key": key})
+    return True
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPGRADE_WORKERS, thread_name_prefix="upgrade")
+        return _executor
+
+
+def _upgrade(key, path, form_data, query_params):
+    try:
+        generate_content(path, form_data, use_cache=True, cache_key=key,
+                         query_params=query_params, tier=TIER_QUALITY)
+        log.info("Upgraded page", extra={"key": key, "tier": TIER_QUALITY})
+        with _lock:
+            _settle(key)
+            _retry_at.pop(key, None)
+    except Exception as e:
+        log.error(f"Error upgrading page: {e}", extra={"key": key})
+        with _lock:
+            _retry_later(key)
+    finally:
+        with _lock:
+            _inflight.discard(key)
+
+
+def _settle(key):
+    """Remember that ``key`` needs no upgrade (caller holds _lock)"""
+    _settled[key] = None
+    _settled.move_to_end(key)
+    while len(_settled) > MAX_SETTLED_KEYS:
+        _settled.popitem(last=False)
+
+
+def _retry_later(key):
+    """Hold back upgrades of ``key`` for UPGRADE_RETRY_AFTER (caller holds _lock)"""
+    now = time.monotonic()
+    _retry_at.pop(key, None)
+    _retry_at[key] = now + UPGRADE_RETRY_AFTER
+    if len(_retry_at) > MAX_RETRY_KEYS:
+        for stale in [k for k, t in _retry_at.items() if t <= now]:
+            del _retry_at[stale]
+        while len(_retry_at) > MAX_RETRY_KEYS:
+            del _retry_at[next(iter(_retry_at))]
+
+
+def forget(key):
+    """Drop what is known about ``key``; called when its page is saved or removed"""
+    with _lock:
+        _settled.pop(key, None)
+        _retry_at.pop(key, None)
+
+
+def get_tier_stats():
+    with _lock:
+        return {
+            "enabled": tiering_enabled(),
+            "upgrades_in_flight": len(_inflight),
+            "settled_keys": len(_settled),
+            "failed_upgrades_waiting": sum(1 for t in _retry_at.values() if t > time.monotonic()),
+        }
@@ -0,0 +1,221 @@
+"""Token usage ledger and budgets.
+
+Every generation (including continuations and background upgrades) is
+recorded as one row in a small SQLite database, so usage can be aggregated
+by path prefix, provider, model or day, and hourly/daily token budgets can
+be enforced across all worker processes.
+
+Report from the command line:
+
+    python usage_ledger.py report --by day
+    python usage_ledger.py report --by prefix --since 2026-01-01
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from app_logging import get_logger
+from config import (
+    LEDGER_PATH, LEDGER_PREFIX_DEPTH, TOKEN_BUDGET_HOURLY, TOKEN_BUDGET_DAILY,
+    BUDGET_EXHAUSTED_MODE, BUDGET_CHECK_INTERVAL, get_draft_config
+)
+
+# Degraded modes returned by budget_state()
+MODE_DRAFT = "draft"
+MODE_CACHE_ONLY = "cache-only"
+# Only main-model generations count against the budgets (models.TIER_QUALITY)
+BUDGET_TIER = "quality"
+
+log = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    ts REAL NOT NULL,
+    path TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT,
+    tier TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts);
+"""
+
+GROUP_COLUMNS = {
+    "prefix": "prefix",
+    "provider": "provider",
+    "model": "model",
+    "tier": "tier",
+    "day": "date(ts, 'unixepoch', 'localtime')",
+    "hour": "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')",
+}
+
+_local = threading.local()
+_budget_lock = threading.Lock()
+_budget_cache = {"checked": 0.0, "state": None}
+
+
+def _connection():
+    """Per-thread connection; WAL lets workers write while others read"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(LEDGER_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _forget_connections():
+    # SQLite connections must not be used across fork (e.g. gunicorn --preload)
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_connections)
+
+
+def path_prefix(path):
+    segments = [segment for segment in path.strip("/").split("/") if segment]
+    return "/".join(segments[:LEDGER_PREFIX_DEPTH]) or "index"
+
+
+def record(path, provider, model, tier, usage):
+    """Append one generation's usage to the ledger"""
+    try:
+        _connection().execute(
+            "INSERT INTO usage (ts, path, prefix, provider, model, tier, prompt_tokens,"
+            " completion_tokens, cached_tokens, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), path, path_prefix(path), provider, model, tier,
+             usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0,
+             usage.get("cached_tokens") or 0, 1 if usage.get("estimated") else 0)
+        )
+    except sqlite3.Error as e:
+        log.error(f"Error recording token usage: {e}", extra={"path": path})
+
+
+def aggregate(by="day", since=None, prefix=None):
+    """Token totals grouped by one of GROUP_COLUMNS"""
+    column = GROUP_COLUMNS[by]
+    query = (f"SELECT {column} AS grp, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens),"
+             f" SUM(cached_tokens) FROM usage WHERE ts >= ?")
+    params = [since or 0]
+    if prefix:
+        query += " AND (path = ? OR path LIKE ?)"
+        params += [prefix.strip("/"), prefix.strip("/") + "/%"]
+    query += " GROUP BY grp ORDER BY grp"
+    return [
+        {by: group, "requests": count, "prompt_tokens": prompt or 0,
+         "completion_tokens": completion or 0, "cached_tokens": cached or 0,
+         "total_tokens": (prompt or 0) + (completion or 0)}
+        for group, count, prompt, completion, cached in _connection().execute(query, params)
+    ]
+
+
+def tokens_since(since, tier=None):
+    query = "SELECT SUM(prompt_tokens + completion_tokens) FROM usage WHERE ts >= ?"
+    params = [since]
+    if tier:
+        query += " AND tier = ?"
+        params.append(tier)
+    return _connection().execute(query, params).fetchone()[0] or 0
+
+
+def _window_starts(now):
+    local = time.localtime(now)
+    hour_start = now - local.tm_min * 60 - local.tm_sec
+    day_start = hour_start - local.tm_hour * 3600
+    return hour_start, day_start
+
+
+def budget_state():
+    """None while main-model budgets hold, else MODE_DRAFT or MODE_CACHE_ONLY.
+
+    The ledger is queried at most every BUDGET_CHECK_INTERVAL seconds.
+    """
+    if not TOKEN_BUDGET_HOURLY and not TOKEN_BUDGET_DAILY:
+        return None
+    now = time.time()
+    with _budget_lock:
+        if now - _budget_cache["checked"] < BUDGET_CHECK_INTERVAL:
+            return _budget_cache["state"]
+        _budget_cache["checked"] = now
+
+    hour_start, day_start = _window_starts(now)
+    exhausted = False
+    try:
+        if TOKEN_BUDGET_HOURLY and tokens_since(hour_start, BUDGET_TIER) >= TOKEN_BUDGET_HOURLY:
+            exhausted = True
+        elif TOKEN_BUDGET_DAILY and tokens_since(day_start, BUDGET_TIER) >= TOKEN_BUDGET_DAILY:
+            exhausted = True
+    except sqlite3.Error as e:
+        log.error(f"Error checking token budget: {e}")
+
+    state = None
+    if exhausted:
+        if BUDGET_EXHAUSTED_MODE == MODE_DRAFT and get_draft_config() is not None:
+            state = MODE_DRAFT
+        else:
+            state = MODE_CACHE_ONLY
+    with _budget_lock:
+        if state != _budget_cache["state"]:
+            log.warning(f"Token budget state changed: {_budget_cache['state'] or 'ok'} -> {state or 'ok'}")
+        _budget_cache["state"] = state
+    return state
+
+
+def seconds_until_reset(now=None):
+    """Seconds until the hourly window rolls over, a Retry-After hint"""
+    now = time.time() if now is None else now
+    hour_start, _ = _window_starts(now)
+    return max(1, int(hour_start + 3600 - now))
+
+
+def get_budget_stats():
+    now = time.time()
+    hour_start, day_start = _window_starts(now)
+    return {
+        "state": budget_state() or "ok",
+        "hourly_budget": TOKEN_BUDGET_HOURLY,
+        "daily_budget": TOKEN_BUDGET_DAILY,
+        "quality_tokens_this_hour": tokens_since(hour_start, BUDGET_TIER),
+        "quality_tokens_today": tokens_since(day_start, BUDGET_TIER),
+        "all_tokens_today": tokens_since(day_start),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Token usage ledger")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="aggregate token usage")
+    report.add_argument("--by", choices=sorted(GROUP_COLUMNS), default="day")
+    report.add_argument("--since", help="unix timestamp or ISO date")
+    report.add_argument("--prefix", help="only paths under this prefix")
+    commands.add_parser("budget", help="show budget state")
+    args = parser.parse_args(argv)
+
+    if args.command == "budget":
+        print(json.dumps(get_budget_stats(), indent=2))
+        return 0
+    since = None
+    if args.since:
+        try:
+            since = float(args.since)
+        except ValueError:
+            since = datetime.fromisoformat(args.since).timestamp()
+    print(json.dumps(aggregate(args.by, since, args.prefix), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
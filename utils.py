@@ -1,168 +1,399 @@
 import os
 import json
-from config import WEB_DIR
+import hashlib
+from config import (
+    WEB_DIR, CACHE_META_DIR, CACHE_BACKEND, AI_PROVIDER, CACHE_VARY_ON_MODEL, CACHE_VARY_QUERY_PARAMS,
+    CACHE_MAX_VARIANTS_PER_PATH, CACHE_MAX_FORM_BYTES, CACHE_LEGACY_FALLBACK,
+    get_ai_config
+)
+from app_logging import get_logger
 
-def save_to_cache(path, content_type, content):
+log = get_logger(__name__)
+
+CACHE_EXTENSIONS = {
+    '.html': 'text/html',
+    '.json': 'application/json',
+    '.txt': 'text/plain',
+}
+
+def normalize_cache_path(path):
+    """Normalize a request path into its canonical cache key"""
+    if path.startswith('/'):
+        path = path[1:]
+    path = path.rstrip('/')
+    if path == '':
+        path = 'index'
+    return path
+
+def relevant_query_params(query_args):
+    """Query params that select a different page variant (CACHE_VARY_QUERY_PARAMS)"""
+    if not query_args:
+        return {}
+    return {
+        name: sorted(query_args.getlist(name))
+        for name in CACHE_VARY_QUERY_PARAMS
+        if name in query_args
+    }
+
+def _normalize_form(form_data):
+    """Sorted, whitespace-trimmed form fields with empty values dropped"""
+    normalized = {}
+    for name in sorted(form_data.keys()):
+        values = form_data.getlist(name) if hasattr(form_data, 'getlist') else [form_data[name]]
+        values = [str(value).strip() for value in values if str(value).strip()]
+        if values:
+            normalized[name] = values
+    return normalized
+
+def cache_keys(path, form_data=None, query_args=None):
+    """Cache keys to try for a request, most specific first.
+
+    The first key is where a freshly generated page is stored: the normalized
+    path plus a digest of the normalized form data, relevant query params and
+    provider/model, e.g. "python/modules@3f2a9c0d1e4b5a67". A plain GET may also
+    fall back to a page cached under the bare path before variants existed.
+    Returns an empty list when the request must not be cached at all.
+    """
+    path = normalize_cache_path(path)
+    variant = {}
+    if form_data:
+        form = _normalize_form(form_data)
+        if len(json.dumps(form)) > CACHE_MAX_FORM_BYTES:
+            return []
+        if form:
+            variant['form'] = form
+    query = relevant_query_params(query_args)
+    if query:
+        variant['query'] = query
+    plain = not variant
+    if CACHE_VARY_ON_MODEL:
+        variant['model'] = f"{AI_PROVIDER}:{get_ai_config().get('model')}"
+    
+    if not variant:
+        return [path]
+    digest = hashlib.sha256(json.dumps(variant, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    keys = [f"{path}@{digest.hexdigest()[:16]}"]
+    if plain and CACHE_LEGACY_FALLBACK:
+        keys.append(path)
+    return keys
+
+def base_path_for_key(key):
+    """Strip the variant suffix from a cache key"""
+    base, separator, digest = key.rpartition('@')
+    if separator and len(digest) == 16 and all(c in '0123456789abcdef' for c in digest):
+        return base
+    return key
+
+def extension_for_content_type(content_type):
+    """File extension used to store content of the given type"""
+    if content_type == 'text/html':
+        return '.html'
+    elif content_type == 'application/json':
+        return '.json'
+    elif content_type.startswith('text/'):
+        return '.txt'
+    return '.html'  # default to HTML if unknown
+
+def content_type_for_file(file_path):
+    """Content type of a cached file, determined from its extension"""
+    for extension, content_type in CACHE_EXTENSIONS.items():
+        if file_path.endswith(extension):
+            return content_type
+    return 'text/html'  # default
+
+def cache_key_for_file(relative_path):
+    """Map a file path relative to WEB_DIR back to (cache key, content type).
+
+    Returns (None, None) for stray files that no request path can reach,
+    such as "tunisia/cities/tunisia/.html".
+    """
+    key = relative_path
+    for extension in CACHE_EXTENSIONS:
+        if key.endswith(extension):
+            key = key[:-len(extension)]
+            break
+    if key == '' or key.endswith('/'):
+        return None, None
+    return key, content_type_for_file(relative_path)
+
+def _candidate_files(path):
+    """Files that may hold the cached content for a normalized path"""
+    return [
+        os.path.join(WEB_DIR, f"{path}.html"),  # .html files
+        os.path.join(WEB_DIR, f"{path}.json"),  # .json files
+        os.path.join(WEB_DIR, f"{path}.txt"),   # .txt files
+        os.path.join(WEB_DIR, path),            # no extension (legacy)
+    ]
+
+def _packfile():
+    from packfile import get_packfile
+    return get_packfile()
+
+def _link_state():
+    import link_state
+    return link_state
+
+def _tiering():
+    import tiering
+    return tiering
+
+def _metadata_file(path):
+    return os.path.join(CACHE_META_DIR, f"{path}.json")
+
+def write_cache_entry(path, content_type, content, mtime=None, meta=None):
+    """Store content (and optional metadata) under a normalized cache key and
+    return where it went"""
+    if CACHE_BACKEND == 'packfile':
+        _packfile().put(path, content_type, content, meta=meta, mtime=mtime)
+        return f"packfile:{path}"
+    
+    # Write the metadata sidecar first, or drop a stale one
+    meta_path = _metadata_file(path)
+    if meta:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, separators=(',', ':'))
+        os.replace(tmp_meta, meta_path)
+    elif os.path.exists(meta_path):
+        os.remove(meta_path)
+    
+    # Always add extension to the filename
+    file_path = os.path.join(WEB_DIR, f"{path}{extension_for_content_type(content_type)}")
+    
+    # Create directory if it doesn't exist
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    
+    # Write to a temporary file first so readers never see a partial page
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(tmp_path, (mtime, mtime))
+    os.replace(tmp_path, file_path)
+    return file_path
+
+def read_cache_entry(path, source=None):
+    """Return (content_type, content, source) for a normalized cache key, or None.
+    ``source`` (as yielded by iter_cache_entries) picks one of several files
+    stored under the same key instead of the first candidate."""
+    if CACHE_BACKEND == 'packfile':
+        entry = _packfile().get(path)
+        if entry is None:
+            return None
+        return entry.content_type, entry.content, f"packfile:{path}"
+    
+    # Try different extensions
+    for file_path in [source] if source else _candidate_files(path):
+        if os.path.isfile(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            return content_type_for_file(file_path), content, file_path
+    return None
+
+def read_metadata_sidecar(path, meta_dir=None):
+    """Metadata in the directory backend's sidecar file for a normalized key
+    (empty dict if none)"""
+    meta_path = os.path.join(meta_dir, f"{path}.json") if meta_dir else _metadata_file(path)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def read_cache_metadata(path):
+    """Metadata stored with a cached page (empty dict if none)"""
+    path = normalize_cache_path(path)
+    if CACHE_BACKEND == 'packfile':
+        entry = _packfile().get(path)
+        return entry.meta if entry else {}
+    return read_metadata_sidecar(path)
+
+def get_cache_mtime(path):
+    """Modification time of the cached entry for path, or None"""
+    path = normalize_cache_path(path)
+    if CACHE_BACKEND == 'packfile':
+        return _packfile().mtime(path)
+    for file_path in _candidate_files(path):
+        if os.path.isfile(file_path):
+            return os.path.getmtime(file_path)
+    return None
+
+def _scan_web_dir(directory):
+    """Recursively yield os.DirEntry objects for every file under directory"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_web_dir(entry.path)
+            elif entry.is_file(follow_symlinks=False) and not entry.name.endswith('.tmp'):
+                yield entry
+
+def iter_cache_entries(since=None):
+    """Yield (key, content_type, mtime, source) for every cached page, optionally
+    only those modified at or after the ``since`` timestamp. The content type is
+    None when the backend only knows it once the entry is read; ``source`` is
+    the file the entry was found in (pass it on to read_cache_entry)."""
+    if CACHE_BACKEND == 'packfile':
+        pack = _packfile()
+        for key in pack.keys():
+            entry_mtime = pack.mtime(key)
+            if entry_mtime is None or (since is not None and entry_mtime < since):
+                continue
+            yield key, None, entry_mtime, f"packfile:{key}"
+        return
+    
+    if not os.path.isdir(WEB_DIR):
+        return
+    for entry in _scan_web_dir(WEB_DIR):
+        entry_mtime = entry.stat().st_mtime
+        if since is not None and entry_mtime < since:
+            continue
+        relative = os.path.relpath(entry.path, WEB_DIR).replace(os.sep, '/')
+        key, content_type = cache_key_for_file(relative)
+        if key is not None:
+            yield key, content_type, entry_mtime, entry.path
+
+def note_cache_saved(key):
+    """Update link and tier state for a page just stored under a normalized key"""
+    _link_state().note_saved(key)
+    _tiering().forget(key)
+
+def save_to_cache(path, content_type, content, meta=None):
     """Save generated content to cache in web directory"""
     try:
-        # Normalize path
-        if path.startswith('/'):
-            path = path[1:]
-        path = path.rstrip('/')
-        if path == '':
-            path = 'index'
-        
-        # Determine file extension based on content type
-        if content_type == 'text/html':
-            extension = '.html'
-        elif content_type == 'application/json':
-            extension = '.json'
-        elif content_type.startswith('text/'):
-            extension = '.txt'
-        else:
-            extension = '.html'  # default to HTML if unknown
-        
-        # Always add extension to the filename
-        if '/' in path:
-            dir_path = os.path.join(WEB_DIR, os.path.dirname(path))
-            file_name = os.path.basename(path)
-            file_path = os.path.join(dir_path, f"{file_name}{extension}")
-        else:
-            file_path = os.path.join(WEB_DIR, f"{path}{extension}")
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        
-        # Save content to file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        print(f"Content cached to: {file_path}")
+        key = normalize_cache_path(path)
+        _enforce_variant_limit(key)
+        location = write_cache_entry(key, content_type, content, meta=meta)
+        log.debug("Content cached", extra={"key": key, "file": location, "bytes": len(content)})
+        note_cache_saved(key)
         return True
         
     except Exception as e:
-        print(f"Error caching content: {e}")
+        log.error(f"Error caching content: {e}", extra={"path": path})
         return False
 
 def load_from_cache(path):
     """Load content from cache if exists"""
     try:
-        # Normalize path
-        if path.startswith('/'):
-            path = path[1:]
-        path = path.rstrip('/')
-        if path == '':
-            path = 'index'
-        
-        # Try different extensions
-        possible_paths = []
-        
-        if '/' in path:
-            # For nested paths like "games/stronghold"
-            dir_path = os.path.join(WEB_DIR, os.path.dirname(path))
-            file_name = os.path.basename(path)
-            possible_paths.extend([
-                os.path.join(dir_path, f"{file_name}.html"),  # .html files
-                os.path.join(dir_path, f"{file_name}.json"),  # .json files  
-                os.path.join(dir_path, f"{file_name}.txt"),   # .txt files
-                os.path.join(dir_path, file_name),            # no extension (legacy)
-            ])
-        else:
-            # For top-level paths like "programming"
-            possible_paths.extend([
-                os.path.join(WEB_DIR, f"{path}.html"),
-                os.path.join(WEB_DIR, f"{path}.json"),
-                os.path.join(WEB_DIR, f"{path}.txt"),
-                os.path.join(WEB_DIR, path),
-            ])
+        entry = read_cache_entry(normalize_cache_path(path))
+        if entry is None:
+            return None, None
         
-        for file_path in possible_paths:
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Determine content type from extension
-                if file_path.endswith('.html'):
-                    content_type = 'text/html'
-                elif file_path.endswith('.json'):
-                    content_type = 'application/json'
-                elif file_path.endswith('.txt'):
-                    content_type = 'text/plain'
-                else:
-                    content_type = 'text/html'  # default
-                
-                print(f"Content loaded from cache: {file_path}")
-                return content_type, content
-        
-        return None, None
+        content_type, content, location = entry
+        log.debug("Content loaded from cache", extra={"file": location, "sample": True})
+        return content_type, content
         
     except Exception as e:
-        print(f"Error loading from cache: {e}")
+        log.error(f"Error loading from cache: {e}", extra={"path": path})
         return None, None
 
+def list_cache_variants(path):
+    """Return [(key, mtime)] for every cached variant of a normalized path"""
+    prefix = f"{path}@"
+    if CACHE_BACKEND == 'packfile':
+        pack = _packfile()
+        return [(key, pack.mtime(key)) for key in pack.keys()
+                if key.startswith(prefix) and base_path_for_key(key) == path]
+    
+    directory = os.path.join(WEB_DIR, os.path.dirname(path))
+    name_prefix = os.path.basename(path) + '@'
+    variants = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(name_prefix) and entry.is_file():
+                    key, _ = cache_key_for_file(os.path.relpath(entry.path, WEB_DIR).replace(os.sep, '/'))
+                    if key and base_path_for_key(key) == path:
+                        variants.append((key, entry.stat().st_mtime))
+    except FileNotFoundError:
+        pass
+    return variants
+
+def _enforce_variant_limit(key):
+    """Evict the oldest variants of key's path so that storing key stays
+    within CACHE_MAX_VARIANTS_PER_PATH"""
+    path = base_path_for_key(key)
+    if path == key:
+        return
+    others = sorted((mtime or 0, other) for other, mtime in list_cache_variants(path) if other != key)
+    while others and len(others) >= CACHE_MAX_VARIANTS_PER_PATH:
+        _, oldest = others.pop(0)
+        remove_cache_key(oldest)
+        log.info("Evicted cache variant", extra={"key": oldest})
+
 def is_cached(path):
     """Check if content is cached"""
+    if CACHE_BACKEND == 'packfile':
+        return normalize_cache_path(path) in _packfile()
     content_type, content = load_from_cache(path)
     return content is not None
 
+def remove_cache_key(key):
+    """Remove one normalized cache key, returning the number of entries removed"""
+    _link_state().note_evicted(key)
+    _tiering().forget(key)
+    if CACHE_BACKEND == 'packfile':
+        return 1 if _packfile().delete(key) else 0
+    removed_count = 0
+    for file_path in _candidate_files(key):
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+            log.info("Removed cache", extra={"file": file_path})
+            removed_count += 1
+    if os.path.isfile(_metadata_file(key)):
+        os.remove(_metadata_file(key))
+    return removed_count
+
 def clear_cache_for_path(path):
-    """Clear cache for specific path"""
+    """Clear cache for specific path, including all of its variants"""
     try:
-        # Normalize path
-        if path.startswith('/'):
-            path = path[1:]
-        if path == '':
-            path = 'index'
-        
-        # Possible cache file paths
-        possible_paths = []
+        path = normalize_cache_path(path)
         
-        if '/' in path:
-            # For nested paths
-            dir_path = os.path.join(WEB_DIR, os.path.dirname(path))
-            file_name = os.path.basename(path)
-            possible_paths.extend([
-                os.path.join(dir_path, f"{file_name}.html"),
-                os.path.join(dir_path, f"{file_name}.json"),
-                os.path.join(dir_path, f"{file_name}.txt"),
-                os.path.join(dir_path, file_name),
-            ])
-        else:
-            # For top-level paths
-            possible_paths.extend([
-                os.path.join(WEB_DIR, f"{path}.html"),
-                os.path.join(WEB_DIR, f"{path}.json"),
-                os.path.join(WEB_DIR, f"{path}.txt"),
-                os.path.join(WEB_DIR, path),
-            ])
+        removed_count = remove_cache_key(path)
+        for key, _ in list_cache_variants(path):
+            removed_count += remove_cache_key(key)
         
-        # Also add directory index paths
-        possible_paths.append(os.path.join(WEB_DIR, path, "index.html"))
+        if CACHE_BACKEND == 'packfile':
+            return removed_count > 0
         
-        removed_count = 0
-        for file_path in possible_paths:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Removed cache: {file_path}")
-                removed_count += 1
+        # Also remove the directory index
+        index_path = os.path.join(WEB_DIR, path, "index.html")
+        if os.path.isfile(index_path):
+            os.remove(index_path)
+            log.info("Removed cache", extra={"file": index_path})
+            removed_count += 1
         
         # Also remove directory if empty
         dir_path = os.path.join(WEB_DIR, path)
         if os.path.exists(dir_path) and os.path.isdir(dir_path):
             try:
                 os.rmdir(dir_path)
-                print(f"Removed empty directory: {dir_path}")
+                log.info("Removed empty directory", extra={"file": dir_path})
             except OSError:
                 pass  # Directory not empty
         
         return removed_count > 0
         
     except Exception as e:
-        print(f"Error clearing cache for path: {e}")
+        log.error(f"Error clearing cache for path: {e}", extra={"path": path})
         return False
 
 def get_cache_stats():
     """Get cache statistics"""
+    if CACHE_BACKEND == 'packfile':
+        pack_stats = _packfile().stats()
+        return {
+            'backend': 'packfile',
+            'total_files': pack_stats['entries'],
+            'total_size_bytes': pack_stats['live_bytes'],
+            'total_size_mb': round(pack_stats['live_bytes'] / (1024 * 1024), 2),
+            'dead_bytes': pack_stats['dead_bytes'],
+            'pack_size_bytes': pack_stats['pack_size_bytes'],
+            'cache_location': pack_stats['pack_path']
+        }
+    
     total_files = 0
     total_size = 0
     
@@ -173,6 +404,7 @@ def get_cache_stats():
             total_size += os.path.getsize(file_path)
     
     return {
+        'backend': 'directory',
         'total_files': total_files,
         'total_size_bytes': total_size,
         'total_size_mb': round(total_size / (1024 * 1024), 2),
@@ -212,4 +444,4 @@ def generate_index_html():
     index_path = os.path.join(os.path.dirname(WEB_DIR), "index.html")
     with open(index_path, "w", encoding="utf-8") as f:
         f.write(index_content)
-    print("Generated index.html")
\ No newline at end of file
+    log.info("Generated index.html")
\ No newline at end of file
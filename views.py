@@ -1,11 +1,67 @@
-from flask import request, redirect, url_for, Response
+from flask import request, redirect, url_for, Response, g, send_file
+import json
 import os
-from config import ROOT_DIR, WEB_DIR
-from models import generate_content
-from utils import save_to_cache, load_from_cache, generate_index_html, is_cached
+import time
+from config import ROOT_DIR, WEB_DIR, NEGATIVE_CACHE_TTL, LINK_STATE
+from models import generate_content, get_prompt_cache_stats, TIER_DRAFT, TIER_QUALITY
+from utils import (
+    save_to_cache, load_from_cache, generate_index_html, is_cached,
+    cache_keys, relevant_query_params, normalize_cache_path, read_cache_metadata
+)
+from peers import PEER_HEADER, PEER_META_HEADER, PEER_FAILURE_HEADER, PeerFailure, fetch_from_peer
+from popularity import record_hit
+from tiering import choose_tier, maybe_upgrade, get_tier_stats
+from usage_ledger import (
+    MODE_DRAFT, MODE_CACHE_ONLY, budget_state, seconds_until_reset, aggregate, get_budget_stats
+)
+from request_filters import junk_response, recent_failure, remember_failure, get_filter_stats
 from templates import SEARCH_PAGE_HTML, generate_error_page
+import link_state
+import metrics
+import profiling
+from app_logging import get_logger, get_log_stats, elapsed_ms
+
+log = get_logger(__name__)
+
+def _outcome(name):
+    metrics.inc(metrics.REQUESTS, (("outcome", name),))
+    g.outcome = name
+
+def _page(path, content, content_type, key=None):
+    """200 response for a page; HTML gets its links tagged by link state.
+    A peer fetching the page gets it as cached, plus the metadata cached
+    under ``key``: it caches the page and tags the links when serving it."""
+    if LINK_STATE and content_type == 'text/html' and not request.headers.get(PEER_HEADER):
+        with metrics.timed("link_state"):
+            content = link_state.annotate(content, path, request.host)
+    headers = {'Content-Type': f'{content_type}; charset=utf-8'}
+    if key and request.headers.get(PEER_HEADER):
+        meta = read_cache_metadata(key)
+        if meta:
+            headers[PEER_META_HEADER] = json.dumps(meta, separators=(',', ':'))
+    return content, 200, headers
 
 def setup_routes(app):
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    def observe_latency(response):
+        started = g.get('started')
+        if started is not None:
+            labels = (("endpoint", request.endpoint or "none"), ("status", response.status_code))
+            metrics.observe(metrics.REQUEST_SECONDS, time.perf_counter() - started, labels)
+            outcome = g.get('outcome')
+            if outcome is not None:
+                # One access line per page request; cache hits are sampled
+                log.info("Handled request", extra={
+                    "path": request.path, "method": request.method, "status": response.status_code,
+                    "cache": outcome, "latency_ms": elapsed_ms(started),
+                    "bytes": response.content_length, "sample": outcome == "hit",
+                })
+        return response
+
     @app.route("/", methods=['GET'])
     def home():
         # Check if we have cached home page in web directory
@@ -18,7 +74,7 @@ def setup_routes(app):
         if not os.path.exists(home_path):
             with open(home_path, "w", encoding="utf-8") as f:
                 f.write(SEARCH_PAGE_HTML)
-            print("Saved home page HTML to home.html")
+            log.info("Saved home page HTML to home.html")
         
         return SEARCH_PAGE_HTML, 200, {'Content-Type': 'text/html'}
 
@@ -52,63 +108,153 @@ def setup_routes(app):
 
     @app.route("/<path:path>", methods=['POST', 'GET'])
     def catch_all(path=""):
-        print(f"Handling request for path: {path}")
+        log.debug("Handling request", extra={"path": path})
         
         # Special handling for index.html
         if path == "index.html":
             return redirect(url_for('index'))
         
+        # Scanners and browser probes never reach the AI provider
+        junk = junk_response(path)
+        if junk:
+            _outcome("junk")
+            return junk
+        
+        record_hit(path)
+        
         # Check if we should use cache (default: yes)
         use_cache = request.args.get('nocache', '0') == '0'
         
+        # Get form data if available
+        form_data = request.form if request.form else None
+        
+        # Pages are cached per variant of path, form data, query params and model
+        keys = cache_keys(path, form_data, request.args)
+        if not keys:
+            log.info("Form data too large to cache", extra={"path": path})
+            use_cache = False
+        
+        # With the token budget spent, even ?nocache=1 is answered from cache
+        budget = budget_state()
+        if budget == MODE_CACHE_ONLY and not use_cache and keys:
+            log.warning("Token budget exhausted, ignoring nocache", extra={"path": path})
+            use_cache = True
+        
+        # Pages stored outside the variant scheme only answer plain requests
+        legacy_ok = bool(keys) and keys[-1] == normalize_cache_path(path)
+        
         # First check cache
         if use_cache:
-            content_type, cached_content = load_from_cache(path)
+            with metrics.timed("cache_lookup"):
+                for key in keys:
+                    content_type, cached_content = load_from_cache(key)
+                    if cached_content:
+                        break
             if cached_content:
-                print(f"Serving from cache: {path}")
-                return cached_content, 200, {'Content-Type': content_type}
+                log.debug("Serving from cache", extra={"path": path, "key": key, "sample": True})
+                metrics.inc(metrics.CACHE_LOOKUPS, (("result", "hit"),))
+                _outcome("hit")
+                if key == keys[0]:
+                    maybe_upgrade(key, path, form_data, relevant_query_params(request.args))
+                return _page(path, cached_content, content_type, key)
+            metrics.inc(metrics.CACHE_LOOKUPS, (("result", "miss"),))
         
         # Then check if file exists in web directory (legacy support)
         web_file_path = os.path.join(WEB_DIR, path + ".html")
-        if os.path.exists(web_file_path):
-            print(f"Serving existing file from web directory: {web_file_path}")
+        with metrics.timed("legacy_probe"):
+            web_file_exists = legacy_ok and os.path.exists(web_file_path)
+        if web_file_exists:
+            log.info("Serving existing file from web directory", extra={"path": path, "file": web_file_path})
             with open(web_file_path, "r", encoding="utf-8") as f:
                 content = f.read()
             
             # Cache this content for future requests
             if use_cache:
-                save_to_cache(path, 'text/html', content)
+                with metrics.timed("cache_write"):
+                    save_to_cache(keys[0], 'text/html', content)
             
-            return content, 200, {'Content-Type': 'text/html'}
+            _outcome("legacy")
+            return _page(path, content, 'text/html')
         
         # Then check if file exists in root directory (for backward compatibility)
         root_file_path = os.path.join(ROOT_DIR, path + ".html")
-        if os.path.exists(root_file_path):
-            print(f"Serving existing file from root directory: {root_file_path}")
+        with metrics.timed("legacy_probe"):
+            root_file_exists = legacy_ok and os.path.exists(root_file_path)
+        if root_file_exists:
+            log.info("Serving existing file from root directory", extra={"path": path, "file": root_file_path})
             with open(root_file_path, "r", encoding="utf-8") as f:
                 content = f.read()
             
             # Cache this content for future requests
             if use_cache:
-                save_to_cache(path, 'text/html', content)
+                with metrics.timed("cache_write"):
+                    save_to_cache(keys[0], 'text/html', content)
             
-            return content, 200, {'Content-Type': 'text/html'}
+            _outcome("legacy")
+            return _page(path, content, 'text/html')
         
         # Generate content for any path that hasn't been found
-        print(f"No existing file found for {path}, generating rich content...")
+        log.debug("No existing file found, generating rich content", extra={"path": path})
         
-        # Get form data if available
-        form_data = request.form if request.form else None
+        # Ask the node that owns this page before paying for a generation.
+        # Requests forwarded by a peer are always handled here.
+        if use_cache and not form_data and not request.headers.get(PEER_HEADER):
+            try:
+                with metrics.timed("peer_fetch"):
+                    content_type, peer_content, peer_meta = fetch_from_peer(keys[0], path, request.query_string)
+            except PeerFailure as failure:
+                # The owner already failed on this page; pass its answer on
+                log.info("Owner peer reported a failure", extra={"path": path, "reason": failure.reason})
+                _outcome("peer_failure")
+                headers = {'Content-Type': 'text/html', PEER_FAILURE_HEADER: failure.reason}
+                if failure.retry_after:
+                    headers['Retry-After'] = failure.retry_after
+                return failure.content, failure.status, headers
+            if peer_content:
+                with metrics.timed("cache_write"):
+                    save_to_cache(keys[0], content_type, peer_content, meta=peer_meta)
+                _outcome("peer")
+                return _page(path, peer_content, content_type)
+        
+        # Don't hammer a failing provider with retries of the same page
+        failure_key = keys[0] if keys else normalize_cache_path(path)
+        recent_error = recent_failure(failure_key)
+        if recent_error:
+            log.info("Generation failed recently, not retrying yet", extra={"path": path})
+            error_page = generate_error_page(path, recent_error)
+            _outcome("negative_cache")
+            return error_page, 503, {'Content-Type': 'text/html', 'Retry-After': str(int(NEGATIVE_CACHE_TTL)),
+                                     PEER_FAILURE_HEADER: 'negative_cache'}
+        
+        if budget == MODE_CACHE_ONLY:
+            log.warning("Token budget exhausted, not generating", extra={"path": path})
+            error_page = generate_error_page(path, "The token budget for this period is exhausted. Cached pages are still available.")
+            _outcome("budget_exhausted")
+            return error_page, 503, {'Content-Type': 'text/html', 'Retry-After': str(seconds_until_reset()),
+                                     PEER_FAILURE_HEADER: 'budget_exhausted'}
+        
+        # A draft answers the first visitors; ?nocache=1 asks for the best
+        tier = choose_tier(path) if use_cache else TIER_QUALITY
+        if budget == MODE_DRAFT:
+            tier = TIER_DRAFT
         
         # Generate content with enhanced settings
         try:
-            content_type, response_data = generate_content(path, form_data, use_cache=use_cache)
+            content_type, response_data = generate_content(
+                path, form_data, use_cache=use_cache,
+                cache_key=keys[0] if keys else None,
+                query_params=relevant_query_params(request.args),
+                tier=tier
+            )
             
-            return response_data, 200, {'Content-Type': content_type}
+            _outcome("generated")
+            return _page(path, response_data, content_type, keys[0] if use_cache and keys else None)
         except Exception as e:
-            print(f"Error generating content: {str(e)}")
+            log.error(f"Error generating content: {e}", extra={"path": path})
+            _outcome("error")
+            remember_failure(failure_key, e)
             error_page = generate_error_page(path, e)
-            return error_page, 500, {'Content-Type': 'text/html'}
+            return error_page, 500, {'Content-Type': 'text/html', PEER_FAILURE_HEADER: 'error'}
 
     @app.route("/api/cache/clear/<path:path>")
     def clear_cache_path(path):
@@ -126,6 +272,8 @@ def setup_routes(app):
         from web_folder_cleaner import clean_web_folder
         try:
             clean_web_folder()
+            if LINK_STATE:
+                link_state.build()
             return "All cache cleared successfully", 200
         except Exception as e:
             return f"Error clearing cache: {str(e)}", 500
@@ -135,7 +283,48 @@ def setup_routes(app):
         """Get cache statistics"""
         from utils import get_cache_stats
         stats = get_cache_stats()
+        stats['filters'] = get_filter_stats()
+        stats['prompt_cache'] = get_prompt_cache_stats()
+        stats['tiers'] = get_tier_stats()
+        stats['logging'] = get_log_stats()
+        stats['link_state'] = link_state.get_link_state_stats()
         return {
             'status': 'success',
             'data': stats
-        }, 200
\ No newline at end of file
+        }, 200
+
+    @app.route("/api/usage")
+    def usage_report():
+        """Token usage grouped by prefix, provider, model, tier, day or hour"""
+        by = request.args.get('by', 'day')
+        try:
+            since = float(request.args.get('since', 0))
+            rows = aggregate(by, since, request.args.get('prefix'))
+        except (KeyError, ValueError):
+            return {'status': 'error', 'message': f"Cannot group usage by {by!r}"}, 400
+        return {
+            'status': 'success',
+            'data': {'budget': get_budget_stats(), 'by': by, 'rows': rows}
+        }, 200
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        """Request, stage latency and provider metrics in Prometheus text format"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    @app.route("/api/profiles")
+    def list_profiles():
+        """List stored request profiles"""
+        if not profiling.admin_allowed():
+            return {'status': 'error', 'message': 'Profile token required'}, 403
+        return {'status': 'success', 'data': profiling.list_profiles()}, 200
+
+    @app.route("/api/profiles/<name>")
+    def download_profile(name):
+        """Download a profile: <name>.prof for pstats/snakeviz, <name>.json for the summary"""
+        if not profiling.admin_allowed():
+            return {'status': 'error', 'message': 'Profile token required'}, 403
+        file_path = profiling.profile_file(name)
+        if file_path is None:
+            return {'status': 'error', 'message': f"No profile named {name}"}, 404
+        return send_file(file_path, as_attachment=name.endswith('.prof'))
@@ -1,30 +1,72 @@
+"""Cache maintenance.
+
+Without a command an interactive menu is shown. The commands are meant for
+cron jobs and scripts: they run at a lowered priority next to the live server,
+list directories in parallel, and print one JSON object per line (progress
+every few seconds, one line per finding, a final "done" summary).
+
+    python web_folder_cleaner.py scan --prefix wiki/
+    python web_folder_cleaner.py prune --older-than 30d --smaller-than 2k --dry-run
+    python web_folder_cleaner.py verify --fix
+    python web_folder_cleaner.py minify
+    python web_folder_cleaner.py compact
+    python web_folder_cleaner.py clear --yes
+"""
+import argparse
+import json
+import multiprocessing
 import os
+import posixpath
+import re
 import shutil
+import importlib.util
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from itertools import islice, repeat
 from pathlib import Path
 import sys
 
+# One cache file (directory backend) or record (packfile). key is None for
+# stray and temporary files; content_type is None until a packfile record is read.
+CacheFile = namedtuple("CacheFile", ["key", "name", "size", "mtime", "content_type"])
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+# Comments (conditional ones are kept) and blocks whose whitespace matters
+_MINIFY_TOKENS = re.compile(
+    r"<!--(?P<comment>.*?)-->|<(?P<tag>pre|textarea|script|style)\b[^>]*>.*?</(?P=tag)\s*>",
+    re.IGNORECASE | re.DOTALL)
+# HTML whitespace only: \s would also swallow non-breaking spaces
+_WHITESPACE = re.compile(r"[ \t\r\n\f]+")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+def _module_available(name):
+    # find_spec imports the parent package of a dotted name and raises if it is missing
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
 def check_required_packages():
+    # find_spec only locates the packages; importing them (google-generativeai
+    # in particular) would cost seconds for nothing
     missing_packages = []
     
     # Check for python-dotenv
-    try:
-        import dotenv
-    except ImportError:
+    if importlib.util.find_spec("dotenv") is None:
         missing_packages.append("python-dotenv")
     
     # Check for requests
-    try:
-        import requests
-    except ImportError:
+    if importlib.util.find_spec("requests") is None:
         missing_packages.append("requests")
     
     # Check for google-generativeai only if using Gemini
     from config import AI_PROVIDER
-    if AI_PROVIDER == "gemini":
-        try:
-            import google.generativeai
-        except ImportError:
-            missing_packages.append("google-generativeai")
+    if AI_PROVIDER == "gemini" and not _module_available("google.generativeai"):
+        missing_packages.append("google-generativeai")
     
     if missing_packages:
         print("Missing required packages. Please install:")
@@ -35,31 +77,505 @@ def check_required_packages():
     
     return True
 
+def _remove_item(item):
+    try:
+        if item.is_dir() and not item.is_symlink():
+            shutil.rmtree(item)
+        else:
+            os.remove(item)
+    except Exception as e:
+        return f"Error removing {item.name}: {e}"
+    return None
+
+def clear_cache(threads=None):
+    """Drop every cached page. Returns (items removed, error messages), or None
+    if there is no cache"""
+    from config import WEB_DIR, CACHE_BACKEND, CACHE_META_DIR, MAINTENANCE_SCAN_THREADS
+
+    if CACHE_BACKEND == "packfile":
+        from packfile import get_packfile
+        pack = get_packfile()
+        removed = len(pack)
+        pack.clear()
+        return removed, []
+
+    web_folder = Path(WEB_DIR)
+    if not web_folder.exists():
+        return None
+
+    # Top-level directories are removed in parallel
+    items = list(web_folder.iterdir())
+    with ThreadPoolExecutor(threads or MAINTENANCE_SCAN_THREADS) as pool:
+        errors = [error for error in pool.map(_remove_item, items) if error]
+
+    # Page metadata belongs to the pages just removed
+    if os.path.isdir(CACHE_META_DIR):
+        shutil.rmtree(CACHE_META_DIR, ignore_errors=True)
+
+    return len(items) - len(errors), errors
+
 def clean_web_folder():
     """Clear the entire web cache directory"""
+    from config import WEB_DIR, CACHE_BACKEND
+
+    location = "packfile cache" if CACHE_BACKEND == "packfile" else WEB_DIR
+    print(f"Cleaning contents of {location}")
+    result = clear_cache()
+    if result is None:
+        print(f"Web folder not found at {WEB_DIR}")
+        return False
+
+    removed, errors = result
+    for error in errors:
+        print(error)
+    print(f"Finished cleaning {location}: {removed} removed, {len(errors)} errors")
+    return not errors
+
+def parse_duration(value):
+    """Seconds in "90s", "15m", "12h", "30d" or "2w"; a bare number counts days"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw]?)", value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid age {value!r} (e.g. 90s, 15m, 12h, 30d, 2w)")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "d"]
+
+def parse_size(value):
+    """Bytes in "512", "4k", "1.5M" or "2G" (binary units)"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kmg]?)(?:i?b)?", value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid size {value!r} (e.g. 512, 4k, 1.5M)")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+def _timestamp(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).isoformat(timespec="seconds")
+
+class Progress:
+    """Machine-readable output: one JSON object per line on stdout"""
+
+    def __init__(self, command, every):
+        self.command = command
+        self.every = every
+        self.started = time.monotonic()
+        self._last = self.started
+
+    def emit(self, event, **fields):
+        record = {"event": event, "command": self.command,
+                  "elapsed": round(time.monotonic() - self.started, 2)}
+        record.update(fields)
+        print(json.dumps(record), flush=True)
+
+    def tick(self, counters):
+        """Report the counters, at most once every ``every`` seconds"""
+        if self.every > 0:
+            now = time.monotonic()
+            if now - self._last >= self.every:
+                self._last = now
+                self.emit("progress", **counters)
+
+def _list_dir(directory):
+    """(path, size, mtime) of the files in one directory, and its subdirectories"""
+    files, dirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, st.st_size, st.st_mtime))
+                except FileNotFoundError:
+                    pass  # removed by the live server meanwhile
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return files, dirs
+
+def scan_directory(root, threads):
+    """Yield (path, size, mtime) for every file under root. Each directory is
+    listed (and its files stat'ed) as a separate task, so one large subtree
+    keeps every thread busy."""
+    with ThreadPoolExecutor(threads) as pool:
+        pending = {pool.submit(_list_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                pending.update(pool.submit(_list_dir, directory) for directory in dirs)
+                yield from files
+
+def iter_cache_files(threads):
+    """Yield a CacheFile for everything in the cache, stray and temporary files included"""
+    from config import WEB_DIR, CACHE_BACKEND
+    from utils import cache_key_for_file
+
+    if CACHE_BACKEND == "packfile":
+        from packfile import get_packfile
+        pack = get_packfile()
+        for key in pack.keys():
+            size, mtime = pack.size(key), pack.mtime(key)
+            if size is not None and mtime is not None:  # not evicted meanwhile
+                yield CacheFile(key, key, size, mtime, None)
+        return
+
+    if not os.path.isdir(WEB_DIR):
+        return
+    for path, size, mtime in scan_directory(WEB_DIR, threads):
+        relative = os.path.relpath(path, WEB_DIR).replace(os.sep, "/")
+        key, content_type = (None, None) if relative.endswith(".tmp") else cache_key_for_file(relative)
+        yield CacheFile(key, relative, size, mtime, content_type)
+
+def _has_filter(args):
+    return any(value is not None for value in (
+        args.older_than, args.newer_than, args.larger_than, args.smaller_than, args.prefix))
+
+def _matching_files(args, counters):
+    """Cache files selected by the age, size and prefix options"""
+    now = time.time()
+    prefixes = tuple(prefix.lstrip("/") for prefix in args.prefix or ())
+    for item in iter_cache_files(args.threads):
+        counters["scanned"] += 1
+        if args.older_than is not None and item.mtime > now - args.older_than:
+            continue
+        if args.newer_than is not None and item.mtime < now - args.newer_than:
+            continue
+        if args.larger_than is not None and item.size <= args.larger_than:
+            continue
+        if args.smaller_than is not None and item.size >= args.smaller_than:
+            continue
+        if prefixes and not (item.key or item.name).startswith(prefixes):
+            continue
+        counters["matched"] += 1
+        yield item
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def _read_entry(item):
+    """(content type, content) of a cache entry, or None once it is gone"""
+    from config import WEB_DIR, CACHE_BACKEND
+
+    if CACHE_BACKEND == "packfile":
+        from packfile import get_packfile
+        entry = get_packfile().get(item.key)
+        return None if entry is None else (entry.content_type, entry.content)
+    try:
+        with open(os.path.join(WEB_DIR, item.name), "rb") as f:
+            return item.content_type, f.read().decode("utf-8")
+    except FileNotFoundError:
+        return None
+
+def _remove_entry(item):
+    """Remove a cache entry, or a stray or temporary file. Returns whether anything was removed."""
     from config import WEB_DIR
-    web_folder = Path(WEB_DIR)
-    
-    if not web_folder.exists():
-        print(f"Web folder not found at {web_folder}")
+    from utils import remove_cache_key
+
+    if item.key is not None:
+        return remove_cache_key(item.key) > 0
+    try:
+        os.remove(os.path.join(WEB_DIR, item.name))
+        return True
+    except FileNotFoundError:
         return False
-    
-    print(f"Cleaning contents of {web_folder}")
-    
-    # List all items in the web folder
-    for item in web_folder.iterdir():
+
+def _remove_empty_dirs(relative_dirs):
+    """Remove the given directories (relative to WEB_DIR) and their parents once they are empty"""
+    from config import WEB_DIR, CACHE_BACKEND
+
+    if CACHE_BACKEND == "packfile":
+        return 0
+    removed = 0
+    for relative in sorted(relative_dirs, key=len, reverse=True):
+        while relative:
+            try:
+                os.rmdir(os.path.join(WEB_DIR, relative))
+            except OSError:
+                break  # not empty, or already gone
+            removed += 1
+            relative = posixpath.dirname(relative)
+    return removed
+
+def _is_truncated(html):
+    """Whether a page opens <html> (or <body>) but never closes it"""
+    head, tail = html[:4096].lower(), html[-4096:].lower()
+    for tag in ("html", "body"):
+        if f"<{tag}" in head:
+            return f"</{tag}>" not in tail
+    return False
+
+def check_entry(item, stale_after=3600):
+    """The problem with one cache file, or None if it looks fine"""
+    if item.key is None:
+        if item.name.endswith(".tmp"):
+            # A write in progress, unless its writer died long ago
+            return "stale_temporary" if time.time() - item.mtime > stale_after else None
+        return "stray"  # no request path maps to it, such as "tunisia/cities/tunisia/.html"
+    if item.size == 0:
+        return "empty"
+    try:
+        entry = _read_entry(item)
+    except UnicodeDecodeError:
+        return "undecodable"
+    if entry is None:
+        return None
+    content_type, content = entry
+    if not content.strip():
+        return "empty"
+    if content_type == "application/json":
         try:
-            if item.is_file():
-                os.remove(item)
-                print(f"Removed file: {item.name}")
-            elif item.is_dir():
-                shutil.rmtree(item)
-                print(f"Removed directory: {item.name}")
-        except Exception as e:
-            print(f"Error removing {item.name}: {e}")
-    
-    print(f"Finished cleaning {web_folder}")
-    return True
+            json.loads(content)
+        except ValueError:
+            return "invalid_json"
+    elif content_type == "text/html" and _is_truncated(content):
+        return "truncated"
+    return None
+
+def minify_html(html):
+    """Conservative minification: drops comments (but conditional ones) and
+    collapses each run of whitespace to one space, or one newline if it
+    spanned lines. <pre>, <textarea> and <script> are left as they are;
+    <style> loses its comments and indentation."""
+    parts, text, pos = [], [], 0
+    for match in _MINIFY_TOKENS.finditer(html):
+        text.append(html[pos:match.start()])
+        pos = match.end()
+        comment = match.group("comment")
+        if comment is not None and not comment.startswith("[if"):
+            continue  # the whitespace around it merges into one run
+        parts.append(_WHITESPACE.sub(_collapse, "".join(text)))
+        text = []
+        block = match.group()
+        if (match.group("tag") or "").lower() == "style":
+            block = _WHITESPACE.sub(_collapse, _CSS_COMMENT.sub("", block))
+        parts.append(block)
+    text.append(html[pos:])
+    parts.append(_WHITESPACE.sub(_collapse, "".join(text)))
+    return "".join(parts)
+
+def _collapse(match):
+    return "\n" if "\n" in match.group() else " "
+
+def _minify_file(path, dry_run):
+    """Minify one cached page in place, keeping its modification time.
+    Returns (bytes before, bytes after)."""
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    minified = minify_html(data.decode("utf-8")).encode("utf-8")
+    if len(minified) >= len(data):
+        return len(data), len(data)
+    if not dry_run:
+        # Same temporary naming as utils.write_cache_entry, so scans skip it
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(minified)
+        os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        if current is None or (current.st_ino, current.st_mtime_ns) != (st.st_ino, st.st_mtime_ns):
+            # Regenerated or evicted by the live server meanwhile: that wins
+            os.remove(tmp_path)
+            return len(data), len(data)
+        os.replace(tmp_path, path)
+    return len(data), len(minified)
+
+def _minify_files(paths, dry_run):
+    """Process pool task: minify a batch of cached pages"""
+    totals = Counter()
+    for path in paths:
+        try:
+            before, after = _minify_file(path, dry_run)
+        except FileNotFoundError:
+            continue
+        except (OSError, UnicodeDecodeError):
+            totals["errors"] += 1
+            continue
+        totals["pages"] += 1
+        totals["minified"] += after < before
+        totals["bytes_before"] += before
+        totals["bytes_after"] += after
+    return totals
+
+def _minify_texts(texts):
+    """Process pool task: [(bytes before, bytes after, minified text or None)]"""
+    results = []
+    for text in texts:
+        before = len(text.encode("utf-8"))
+        minified = minify_html(text)
+        after = len(minified.encode("utf-8"))
+        results.append((before, after, minified) if after < before else (before, before, None))
+    return results
+
+def _drain(pending, finish, limit):
+    """Wait for pool tasks until at most ``limit`` are pending"""
+    while len(pending) > limit:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            finish(pending.pop(future), future.result())
+
+def scan_cache(args, progress):
+    counters = {"scanned": 0, "matched": 0, "bytes": 0, "stray": 0, "temporary": 0}
+    prefixes = Counter()
+    oldest = newest = None
+    for item in _matching_files(args, counters):
+        counters["bytes"] += item.size
+        if item.key is None:
+            counters["temporary" if item.name.endswith(".tmp") else "stray"] += 1
+        prefixes[(item.key or item.name).split("/", 1)[0]] += 1
+        oldest = item.mtime if oldest is None else min(oldest, item.mtime)
+        newest = item.mtime if newest is None else max(newest, item.mtime)
+        progress.tick(counters)
+    progress.emit("done", **counters, oldest=_timestamp(oldest), newest=_timestamp(newest),
+                  top_prefixes=dict(prefixes.most_common(args.top)))
+    return 0
+
+def prune_cache(args, progress):
+    if not _has_filter(args):
+        progress.emit("error", message="prune needs at least one filter; use 'clear' to drop everything")
+        return 2
+    counters = {"scanned": 0, "matched": 0, "removed": 0, "bytes": 0}
+    touched_dirs = set()
+    for item in _matching_files(args, counters):
+        if item.key is None:
+            continue  # stray and temporary files are verify's business
+        if args.dry_run or _remove_entry(item):
+            counters["removed"] += 1
+            counters["bytes"] += item.size
+            touched_dirs.add(posixpath.dirname(item.name))
+            progress.emit("remove", key=item.key, file=item.name, bytes=item.size, dry_run=args.dry_run)
+        progress.tick(counters)
+    if not args.dry_run:
+        counters["directories_removed"] = _remove_empty_dirs(touched_dirs)
+    progress.emit("done", dry_run=args.dry_run, **counters)
+    return 0
+
+def verify_cache(args, progress):
+    counters = {"scanned": 0, "matched": 0, "problems": 0, "removed": 0}
+    issues = Counter()
+    touched_dirs = set()
+    # Reading is I/O bound; the checks themselves are a few substring searches
+    with ThreadPoolExecutor(args.threads) as pool:
+        for batch in _batched(_matching_files(args, counters), 256):
+            for item, issue in zip(batch, pool.map(check_entry, batch, repeat(args.stale_after))):
+                if issue is not None:
+                    counters["problems"] += 1
+                    issues[issue] += 1
+                    removed = args.fix and not args.dry_run and _remove_entry(item)
+                    if removed:
+                        counters["removed"] += 1
+                        touched_dirs.add(posixpath.dirname(item.name))
+                    progress.emit("problem", issue=issue, key=item.key, file=item.name,
+                                  bytes=item.size, removed=removed)
+            progress.tick(counters)
+    if touched_dirs:
+        counters["directories_removed"] = _remove_empty_dirs(touched_dirs)
+    progress.emit("done", dry_run=args.dry_run, **counters, issues=dict(issues))
+    return 1 if counters["problems"] > counters["removed"] else 0
+
+def minify_cache(args, progress):
+    from config import WEB_DIR, CACHE_BACKEND, MAINTENANCE_PROCESSES
+
+    counters = {"scanned": 0, "matched": 0, "pages": 0, "minified": 0, "errors": 0,
+                "bytes_before": 0, "bytes_after": 0}
+    pages = (item for item in _matching_files(args, counters)
+             if item.key is not None and item.content_type in ("text/html", None))
+    processes = args.processes or MAINTENANCE_PROCESSES or max(1, (os.cpu_count() or 2) // 2)
+    pending = {}
+
+    # spawn: forking this process would copy the scanning threads' locks mid-use
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        if CACHE_BACKEND == "packfile":
+            from packfile import get_packfile
+            pack = get_packfile()
+
+            def finish(entries, results):
+                for (key, entry), (before, after, minified) in zip(entries, results):
+                    if minified is not None and not args.dry_run:
+                        if pack.mtime(key) == entry.mtime:
+                            pack.put(key, entry.content_type, minified, meta=entry.meta, mtime=entry.mtime)
+                        else:
+                            minified, after = None, before  # regenerated meanwhile: that wins
+                    counters["pages"] += 1
+                    counters["minified"] += minified is not None
+                    counters["bytes_before"] += before
+                    counters["bytes_after"] += after
+                progress.tick(counters)
+
+            for batch in _batched(pages, 64):
+                entries = [(item.key, entry) for item, entry in ((item, pack.get(item.key)) for item in batch)
+                           if entry is not None and entry.content_type == "text/html"]
+                pending[pool.submit(_minify_texts, [entry.content for _, entry in entries])] = entries
+                _drain(pending, finish, 2 * processes)
+            _drain(pending, finish, 0)
+            if counters["minified"] and not args.dry_run:
+                pack.compact()  # the old versions are dead bytes now
+                counters["pack_size_bytes"] = pack.stats()["pack_size_bytes"]
+        else:
+            def finish(_, totals):
+                for name, value in totals.items():
+                    counters[name] += value
+                progress.tick(counters)
+
+            for batch in _batched(pages, 64):
+                paths = [os.path.join(WEB_DIR, item.name) for item in batch]
+                pending[pool.submit(_minify_files, paths, args.dry_run)] = None
+                _drain(pending, finish, 2 * processes)
+            _drain(pending, finish, 0)
+
+    counters["bytes_saved"] = counters["bytes_before"] - counters["bytes_after"]
+    progress.emit("done", dry_run=args.dry_run, processes=processes, **counters)
+    return 0
+
+def compact_cache(args, progress):
+    from config import WEB_DIR, CACHE_BACKEND
+
+    if CACHE_BACKEND == "packfile":
+        from packfile import get_packfile
+        pack = get_packfile()
+        before = pack.stats()
+        if not args.dry_run:
+            pack.compact()
+        after = pack.stats()
+        progress.emit("done", dry_run=args.dry_run, entries=after["entries"],
+                      bytes_before=before["pack_size_bytes"], bytes_after=after["pack_size_bytes"],
+                      dead_bytes=before["dead_bytes"])
+        return 0
+
+    # Directory backend: drop the empty directories evictions leave behind
+    counters = {"directories": 0, "removed": 0}
+    empty = set()
+    for root, dirs, files in os.walk(WEB_DIR, topdown=False):
+        counters["directories"] += 1
+        if root == WEB_DIR or files or any(os.path.join(root, d) not in empty for d in dirs):
+            continue
+        try:
+            if not args.dry_run:
+                os.rmdir(root)
+        except OSError:
+            continue  # a page was just written into it
+        empty.add(root)
+        counters["removed"] += 1
+        progress.tick(counters)
+    progress.emit("done", dry_run=args.dry_run, **counters)
+    return 0
+
+def clear_cache_command(args, progress):
+    if not args.yes:
+        progress.emit("error", message="clear drops every cached page; pass --yes to confirm")
+        return 2
+    result = clear_cache(args.threads)
+    if result is None:
+        progress.emit("error", message="no cache to clear")
+        return 1
+    removed, errors = result
+    for error in errors:
+        progress.emit("error", message=error)
+    progress.emit("done", removed=removed, errors=len(errors))
+    return 1 if errors else 0
 
 def list_available_models():
     """List available models for the current provider"""
@@ -168,8 +684,63 @@ def show_menu():
         else:
             print("Invalid choice. Please try again.")
 
-if __name__ == "__main__":
-    if check_required_packages():
+
+def main(argv=None):
+    from config import MAINTENANCE_SCAN_THREADS, MAINTENANCE_NICE
+
+    parser = argparse.ArgumentParser(description="Maintain the page cache (no command: interactive menu)")
+    parser.add_argument("--threads", type=int, default=MAINTENANCE_SCAN_THREADS,
+                        help="parallel directory listings and reads")
+    parser.add_argument("--nice", type=int, default=MAINTENANCE_NICE,
+                        help="niceness increment so the live server keeps priority (0 = none)")
+    parser.add_argument("--progress-every", type=float, default=2.0, metavar="SECONDS",
+                        help="interval of progress lines (0 = findings and summary only)")
+    commands = parser.add_subparsers(dest="command")
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument("--older-than", type=parse_duration, metavar="AGE",
+                         help="only entries last written more than AGE ago (90s, 15m, 12h, 30d, 2w; default unit: days)")
+    filters.add_argument("--newer-than", type=parse_duration, metavar="AGE",
+                         help="only entries written within AGE")
+    filters.add_argument("--larger-than", type=parse_size, metavar="SIZE", help="only entries above SIZE (4k, 1M, ...)")
+    filters.add_argument("--smaller-than", type=parse_size, metavar="SIZE", help="only entries below SIZE")
+    filters.add_argument("--prefix", action="append", metavar="PATH", help="only keys under PATH (repeatable)")
+    dry_run = argparse.ArgumentParser(add_help=False)
+    dry_run.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+
+    scan = commands.add_parser("scan", parents=[filters], help="count entries and bytes")
+    scan.add_argument("--top", type=int, default=10, help="number of top-level prefixes to report")
+    commands.add_parser("prune", parents=[filters, dry_run], help="remove the entries selected by the filters")
+    verify = commands.add_parser("verify", parents=[filters, dry_run],
+                                 help="find empty, truncated, undecodable and stray entries")
+    verify.add_argument("--fix", action="store_true", help="remove the entries found")
+    verify.add_argument("--stale-after", type=parse_duration, default=3600.0, metavar="AGE",
+                        help="age after which a temporary file counts as left behind (default 1h)")
+    minify = commands.add_parser("minify", parents=[filters, dry_run], help="re-minify cached HTML pages")
+    minify.add_argument("--processes", type=int, default=0, help="worker processes (default MAINTENANCE_PROCESSES)")
+    commands.add_parser("compact", parents=[dry_run],
+                        help="compact the packfile, or remove empty directories from web/")
+    clear = commands.add_parser("clear", help="drop every cached page")
+    clear.add_argument("--yes", action="store_true", help="confirm")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
         show_menu()
-    else:
-        sys.exit(1)
\ No newline at end of file
+        return 0
+    if args.nice and hasattr(os, "nice"):
+        os.nice(args.nice)  # inherited by the minify worker processes
+
+    handlers = {
+        "scan": scan_cache,
+        "prune": prune_cache,
+        "verify": verify_cache,
+        "minify": minify_cache,
+        "compact": compact_cache,
+        "clear": clear_cache_command,
+    }
+    return handlers[args.command](args, Progress(args.command, args.progress_every))
+
+if __name__ == "__main__":
+    if not check_required_packages():
+        sys.exit(1)
+    sys.exit(main())